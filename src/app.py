@@ -1,27 +1,59 @@
 """
 FastAPI 后端应用 (负责静态页面、/chat 接口与启动) 
 - 提供 / 返回静态 index.html (前端) 
-- 提供 POST /chat 接收 {message: "...", reference_time: "<可选>", include_forecast: bool}, 返回 {"response": "..."}
+- 提供 POST /chat 接收 {message: "...", reference_time: "<可选>", include_forecast: bool, device_key: "<可选>",
+  pre_hours / post_hours: <可选, 默认 24>}, 返回 {"response": "..."}
+- 提供 POST /chat/stream 参数同 /chat, 以 SSE 逐段返回回复
+- 提供 POST /chat/batch 接收 {messages: ["...", ...], 其余参数同 /chat}, 数据窗口只加载一次, 各问题并发调用 LLM, 按顺序返回
+- 提供 GET /digest 读取后台生成的各设备摘要 (统计、规则告警、可选的预热回复), ?device_key= 只取单个设备
+- 提供 GET /alerts 用规则引擎一次扫描所有设备的最近窗口, 返回有告警的设备
+- 提供 GET /metrics 以 Prometheus 文本格式导出各阶段耗时直方图、缓存命中率、上游错误、token 用量与 LLM 排队状态
 - start_server()：用于 main.py 启动 uvicorn
 """
 
 import os
+import json
+import time
+import asyncio
+import functools
 import uvicorn
 import webbrowser
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Optional
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 
-from .data_loader import load_recent_window, load_forecast_window, load_both_windows
-from .llm_service import get_ai_response
-from .config import DATA_FILE_PATH, SYSTEM_PROMPT_TEMPLATE
+from .data_loader import (
+    load_window, read_fleet_windows, list_device_keys, WindowSummary, dataset_cache_stats, dataset_version, window_memo_stats,
+)
+from .llm_service import aget_ai_response, astream_ai_response, close_llm_client, response_cache_stats, scheduler_stats
+from .config import (
+    DATA_FILE_PATH, SYSTEM_PROMPT_TEMPLATE, CONTEXT_MAX_HOURS, CHAT_BATCH_MAX, DIGEST_ENABLED,
+    ALERT_RULES, ALERT_WINDOW_HOURS,
+)
+from .metrics import REGISTRY, REQUEST_SECONDS, CONTENT_TYPE, observe_stages
+from .digest import DigestService
+from .rules import RuleEngine
 
 
 ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 STATIC_DIR = os.path.join(ROOT_DIR, "static")
 
-app = FastAPI(title="果农助手API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 后台摘要任务: 各设备有新记录时重新生成摘要
+    if DIGEST_ENABLED:
+        DIGESTS.start()
+    yield
+    await DIGESTS.stop()
+    # 关闭 LLM 连接池
+    await close_llm_client()
+
+
+app = FastAPI(title="果农助手API", lifespan=lifespan)
 
 
 app.add_middleware(
@@ -51,45 +83,294 @@ async def index():
 async def status():
     # 前端轮询时用于检查数据文件状态
     exists = os.path.exists(DATA_FILE_PATH)
-    return {"ok": True, "data_file_exists": exists}
+    return {
+        "ok": True,
+        "data_file_exists": exists,
+        "dataset_cache": dataset_cache_stats(),
+        "window_memo": window_memo_stats(),
+        "response_cache": response_cache_stats(),
+        "llm_scheduler": scheduler_stats(),
+        "digest": DIGESTS.stats(),
+    }
 
 
-@app.post("/chat")
-async def chat_endpoint(req: Request):
-    payload = await req.json()
-    user_message = payload.get("message", "").strip()
-    if not user_message:
-        return JSONResponse({"response": "请提供问题描述，例如：'我的果树要不要浇水？' "}, status_code=400)
+@app.get("/digest")
+async def digest(device_key: Optional[str] = None):
+    """
+    后台生成的摘要; 给出 device_key 时只返回该设备 (尚未生成时 404), 默认数据源的 device_key 为空字符串
+    """
+    if device_key is not None:
+        d = DIGESTS.get(device_key)
+        if d is None:
+            return JSONResponse({"error": f"尚无该设备的摘要: {device_key}"}, status_code=404)
+        return d.to_dict()
+    return {"service": DIGESTS.stats(), "digests": [d.to_dict() for d in DIGESTS.all()]}
+
+
+ALERT_ENGINE = RuleEngine(ALERT_RULES)
+
 
+def _ms(seconds: float) -> float:
+    return round(seconds * 1e3, 3)
+
+
+@app.get("/alerts")
+async def alerts(reference_time: Optional[str] = None, hours: int = ALERT_WINDOW_HOURS, level: Optional[str] = None):
+    """
+    扫描默认数据源与 DATA_DIR 下所有设备 reference_time 前 hours 小时的窗口, 一次向量化评估 ALERT_RULES
+    窗口经 read_fleet_windows 直接读取, 不填充数据集缓存, 不影响 /chat 的缓存命中
+    level 给出时只返回该级别 (info / warning / critical) 的告警; 默认数据源的 device_key 为空字符串
+    """
+    hours = min(max(hours, 1), CONTEXT_MAX_HOURS)
+    t0 = time.perf_counter()
+    keys = ["", *list_device_keys()]
     try:
+        windows, errors = await asyncio.to_thread(read_fleet_windows, keys, hours, reference_time,
+                                                  ALERT_ENGINE.variables)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    t1 = time.perf_counter()
+    per_device = ALERT_ENGINE.evaluate_windows(windows)
+    t2 = time.perf_counter()
+
+    results = []
+    for key, found in zip(keys, per_device):
+        if level:
+            found = [a for a in found if a["level"] == level]
+        if key not in errors and found:
+            results.append({"device_key": key, "alerts": found})
+    return {
+        "devices": len(keys),
+        "alerting": len(results),
+        "hours": hours,
+        "load_ms": _ms(t1 - t0),
+        "evaluate_ms": _ms(t2 - t1),
+        "results": results,
+        "errors": errors,
+    }
+
+
+def _cache_metrics() -> list:
+    # 导出 /metrics 时读取各缓存的现有统计
+    caches = {
+        "dataset": dataset_cache_stats(),
+        "window_memo": window_memo_stats(),
+        "response": response_cache_stats(),
+    }
+    ratio, requests, entries = [], [], []
+    for name, st in caches.items():
+        ratio.append(({"cache": name}, st.get("hit_ratio", 0.0)))
+        entries.append(({"cache": name}, st.get("entries", 0)))
+        for result in ("hits", "revalidated", "coalesced", "misses", "bypassed"):
+            if result in st:
+                requests.append(({"cache": name, "result": result}, st[result]))
+    return [
+        ("fg_cache_hit_ratio", "gauge", "Cache hit ratio since start", ratio),
+        ("fg_cache_requests_total", "counter", "Cache lookups by result", requests),
+        ("fg_cache_entries", "gauge", "Entries currently held", entries),
+    ]
+
+
+def _scheduler_metrics() -> list:
+    st = scheduler_stats()
+    return [
+        ("fg_llm_queue_depth", "gauge", "Requests waiting for an upstream LLM slot", [({}, st["queue_depth"])]),
+        ("fg_llm_in_flight", "gauge", "Upstream LLM calls in progress", [({}, st["in_flight"])]),
+        ("fg_llm_concurrency_limit", "gauge", "Current upstream concurrency limit (halved on 429)", [({}, st["limit"])]),
+        ("fg_llm_rate_limited_total", "counter", "Upstream 429 responses", [({}, st["rate_limited"])]),
+    ]
+
+
+REGISTRY.add_collector(_cache_metrics)
+REGISTRY.add_collector(_scheduler_metrics)
+
+
+@app.get("/metrics")
+async def metrics():
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@dataclass
+class ChatContext:
+    data_context: str
+    summary: str
+    error: Optional[str] = None
+    data_version: Optional[tuple] = None
+    stats: Optional[WindowSummary] = None  # PRE 窗口的结构化摘要
+    device_key: Optional[str] = None
+    timings: Optional[dict] = None  # 各阶段耗时 (秒), 请求结束时写入 metrics
+    as_of: Optional[str] = None  # PRE 窗口中最新记录的时间
+
+
+def _window_hours(payload: dict, key: str) -> int:
+    # 窗口小时数: 默认 24, 限制在 [1, CONTEXT_MAX_HOURS]; 超出预算的长窗口由 data_loader 自动压缩
+    value = payload.get(key)
+    if value is None:
+        return 24
+    try:
+        hours = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{key} 必须为整数")
+    return min(max(hours, 1), CONTEXT_MAX_HOURS)
+
+
+def _load_chat_context(payload: dict, cache: bool = True) -> ChatContext:
+    """
+    按请求参数加载数据窗口
+    数据加载失败时 data_context 为空, summary 与 error 为错误描述
+    cache=False 供后台摘要使用: 读取不写入数据集缓存与窗口备忘 (见 data_loader.WindowMemo)
+    """
+    device_key = payload.get("device_key") or None
+    timings = {}
+    try:
+        version = dataset_version(device_key)
         reference_time = payload.get("reference_time", None)
         include_forecast = bool(payload.get("include_forecast", True))
+        pre_hours = _window_hours(payload, "pre_hours")
+        post_hours = _window_hours(payload, "post_hours")
 
         # 默认取过去 24 小时数据
-        pre_context, pre_summary, pre_df = load_recent_window(pre_hours=24, reference_time=reference_time)
-        post_context = post_summary = post_df = None
+        pre = load_window(pre_hours, reference_time=reference_time, direction='past', device_key=device_key, timings=timings,
+                          cache=cache)
+        post = None
         if include_forecast:
             # 可选：附加未来 24 小时预报窗口
-            post_context, post_summary, post_df = load_forecast_window(post_hours=24, reference_time=reference_time)
+            post = load_window(post_hours, reference_time=reference_time, direction='future', device_key=device_key,
+                               timings=timings, cache=cache)
 
     except Exception as e:
         
         err = f"数据加载失败: {e}"
-        ai_text = get_ai_response(user_message=user_message, data_context="", summary_str=err)
-        return JSONResponse({"response": ai_text, "error": err}, status_code=200)
+        return ChatContext(data_context="", summary=err, error=err, device_key=device_key, timings=timings)
 
     
-    if post_context:
-        combined_context = f"PRE_WINDOW:\n{pre_context}\n\nPOST_WINDOW:\n{post_context}"
-        combined_summary = f"PRE: {pre_summary} || POST: {post_summary}"
+    if post is not None and post.data_context:
+        combined_context = f"PRE_WINDOW:\n{pre.data_context}\n\nPOST_WINDOW:\n{post.data_context}"
+        combined_summary = f"PRE: {pre.summary} || POST: {post.summary}"
     else:
-        combined_context = pre_context
-        combined_summary = pre_summary
+        combined_context = pre.data_context
+        combined_summary = pre.summary
+    as_of = None
+    if not pre.df.empty and "timestamp" in pre.df.columns:
+        as_of = str(pre.df["timestamp"].iloc[-1])
+    return ChatContext(data_context=combined_context, summary=combined_summary, data_version=version, stats=pre.stats,
+                       device_key=device_key, timings=timings, as_of=as_of)
 
-    
-    # 调用 LLM 或本地回退逻辑
-    ai_text = get_ai_response(user_message=user_message, data_context=combined_context, summary_str=combined_summary, system_prompt_template=SYSTEM_PROMPT_TEMPLATE)
-    return JSONResponse({"response": ai_text})
+
+async def _answer(ctx: ChatContext, message: str, **kwargs) -> str:
+    # 按已加载的数据窗口回答一个问题; kwargs 透传给 aget_ai_response (timings / priority / queue_timeout)
+    if ctx.error:
+        return await aget_ai_response(user_message=message, data_context="", summary_str=ctx.error, **kwargs)
+    return await aget_ai_response(user_message=message, data_context=ctx.data_context, summary_str=ctx.summary,
+                                  system_prompt_template=SYSTEM_PROMPT_TEMPLATE, data_version=ctx.data_version,
+                                  summary=ctx.stats, data_scope=ctx.device_key, **kwargs)
+
+
+DIGESTS = DigestService(functools.partial(_load_chat_context, cache=False), _answer)
+
+
+@app.post("/chat")
+async def chat_endpoint(req: Request):
+    t0 = time.perf_counter()
+    payload = await req.json()
+    user_message = payload.get("message", "").strip()
+    if not user_message:
+        return JSONResponse({"response": "请提供问题描述，例如：'我的果树要不要浇水？' "}, status_code=400)
+
+    # 在线程中加载数据窗口: 冷加载不阻塞事件循环, 并发的相同窗口由 data_loader 合并为一次计算
+    ctx = await asyncio.to_thread(_load_chat_context, payload)
+    try:
+        # 调用 LLM 或本地回退逻辑
+        ai_text = await _answer(ctx, user_message, timings=ctx.timings)
+        if ctx.error:
+            return JSONResponse({"response": ai_text, "error": ctx.error}, status_code=200)
+        return JSONResponse({"response": ai_text})
+    finally:
+        observe_stages(ctx.timings)
+        REQUEST_SECONDS.observe(time.perf_counter() - t0, endpoint="/chat")
+
+
+@app.post("/chat/batch")
+async def chat_batch_endpoint(req: Request):
+    """
+    一次提交多个问题 (同一设备、同一参考时间): 数据窗口只加载、编码一次, 各问题的 LLM 调用并发进行
+    返回 {"results": [{"message", "response", "elapsed_ms", "timings_ms"}, ...], "data_load_ms": ...}, 顺序与 messages 一致
+    """
+    t0 = time.perf_counter()
+    payload = await req.json()
+    messages = payload.get("messages")
+    if not isinstance(messages, list) or not messages or not all(isinstance(m, str) and m.strip() for m in messages):
+        return JSONResponse({"error": "messages 应为非空的问题列表, 例如 [\"要不要浇水？\", \"要不要排水？\"]"}, status_code=400)
+    if len(messages) > CHAT_BATCH_MAX:
+        return JSONResponse({"error": f"每批最多 {CHAT_BATCH_MAX} 个问题"}, status_code=400)
+
+    ctx = await asyncio.to_thread(_load_chat_context, payload)
+    load_seconds = time.perf_counter() - t0
+
+    async def answer(message: str) -> dict:
+        t_item = time.perf_counter()
+        timings = {}
+        text = await _answer(ctx, message, timings=timings)
+        observe_stages(timings)
+        return {
+            "message": message,
+            "response": text,
+            "elapsed_ms": _ms(time.perf_counter() - t_item),
+            "timings_ms": {k: _ms(v) for k, v in timings.items()},
+        }
+
+    try:
+        results = await asyncio.gather(*(answer(m.strip()) for m in messages))
+        body = {"results": results, "data_load_ms": _ms(load_seconds),
+                "data_timings_ms": {k: _ms(v) for k, v in (ctx.timings or {}).items()}}
+        if ctx.error:
+            body["error"] = ctx.error
+        return JSONResponse(body)
+    finally:
+        observe_stages(ctx.timings)
+        REQUEST_SECONDS.observe(time.perf_counter() - t0, endpoint="/chat/batch")
+
+
+def _sse_event(data: dict) -> str:
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(req: Request):
+    """
+    流式版本的 /chat：以 Server-Sent Events 逐段推送回复
+    事件格式: data: {"delta": "..."}, 出错时附带 {"error": "..."}, 结束时 data: [DONE]
+    """
+    t0 = time.perf_counter()
+    payload = await req.json()
+    user_message = payload.get("message", "").strip()
+    if not user_message:
+        return JSONResponse({"response": "请提供问题描述，例如：'我的果树要不要浇水？' "}, status_code=400)
+
+    ctx = await asyncio.to_thread(_load_chat_context, payload)
+
+    async def event_source():
+        try:
+            if ctx.error:
+                yield _sse_event({"error": ctx.error})
+                chunks = astream_ai_response(user_message=user_message, data_context="", summary_str=ctx.error,
+                                             timings=ctx.timings)
+            else:
+                chunks = astream_ai_response(user_message=user_message, data_context=ctx.data_context, summary_str=ctx.summary,
+                                             system_prompt_template=SYSTEM_PROMPT_TEMPLATE, data_version=ctx.data_version,
+                                             summary=ctx.stats, data_scope=ctx.device_key, timings=ctx.timings)
+            async for delta in chunks:
+                yield _sse_event({"delta": delta})
+            yield "data: [DONE]\n\n"
+        finally:
+            observe_stages(ctx.timings)
+            REQUEST_SECONDS.observe(time.perf_counter() - t0, endpoint="/chat/stream")
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 def start_server(host: str = "0.0.0.0", port: int = 3000, open_browser: bool = True):
@@ -0,0 +1,235 @@
+"""
+列式传感器历史存储 (NumPy memmap)
+目录结构 (<name>.cols/)：
+ - meta.json           {"format": "fg-cols", "version": 1, "columns": {"timestamp": "<i8", "temp": "<f8", ...}}
+ - <column>.bin        每列一个小端定长二进制文件, timestamp 为 int64 纳秒
+读取时各列以 np.memmap 打开, 只有被切片的窗口会真正从磁盘分页读入;
+追加时 timestamp 列最后写, 读方以 timestamp 文件长度为准, 不会读到半行;
+追加中断时各值列可能比 timestamp 列长, 下次追加前先把每列截断到已提交的行数再写入, 残留行不会与新时间戳错位
+用法(项目根目录)：python -m src.column_store output/pseudo_data/test.json output/pseudo_data/test.cols
+"""
+
+import os
+import json
+import argparse
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+META_FILE = "meta.json"
+FORMAT_NAME = "fg-cols"
+FORMAT_VERSION = 1
+TIMESTAMP_COL = "timestamp"
+VALUE_DTYPE = "<f8"
+TIMESTAMP_DTYPE = "<i8"
+# 与 data_loader.TRUSTED_COLS / SPOIL_COLS 一致: 默认只存加载器使用的列, 场景标签类列不写入
+LOADER_COLUMNS = ["temp", "humidity", "rain", "solar", "soil_water"]
+SPOIL_COLUMNS = ["scene_tag", "scenario", "label", "season"]
+
+
+def is_column_store(path: str) -> bool:
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, META_FILE))
+
+
+def store_signature(path: str) -> Tuple[int, int]:
+    """
+    存储版本 (mtime_ns, size), 以 timestamp 列文件为准 (追加时最后写入)
+    """
+    st = os.stat(os.path.join(path, TIMESTAMP_COL + ".bin"))
+    return st.st_mtime_ns, st.st_size
+
+
+def _read_meta(path: str) -> dict:
+    with open(os.path.join(path, META_FILE), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    if meta.get("format") != FORMAT_NAME:
+        raise ValueError(f"不是列式存储目录: {path}")
+    return meta
+
+
+def _frame_to_arrays(df: pd.DataFrame, columns: List[str]) -> Dict[str, np.ndarray]:
+    ts = pd.to_datetime(df[TIMESTAMP_COL]).to_numpy(dtype="datetime64[ns]").astype(TIMESTAMP_DTYPE)
+    arrays = {TIMESTAMP_COL: ts}
+    for c in columns:
+        if c == TIMESTAMP_COL:
+            continue
+        if c in df.columns:
+            arrays[c] = pd.to_numeric(df[c], errors='coerce').to_numpy(dtype=VALUE_DTYPE)
+        else:
+            arrays[c] = np.full(len(df), np.nan, dtype=VALUE_DTYPE)
+    return arrays
+
+
+class ColumnStore:
+    """
+    只读视图 + 追加写入
+    每个实例在打开时固定行数 (timestamp 文件长度), 追加后需重新打开才能看到新行
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.meta = _read_meta(path)
+        self.columns: List[str] = list(self.meta["columns"].keys())
+        self._n = os.path.getsize(self._col_path(TIMESTAMP_COL)) // np.dtype(TIMESTAMP_DTYPE).itemsize
+        self._maps: Dict[str, np.ndarray] = {}
+
+    def _col_path(self, col: str) -> str:
+        return os.path.join(self.path, col + ".bin")
+
+    def __len__(self) -> int:
+        return self._n
+
+    def _column(self, col: str) -> np.ndarray:
+        arr = self._maps.get(col)
+        if arr is None:
+            if self._n == 0:
+                arr = np.empty(0, dtype=self.meta["columns"][col])
+            else:
+                arr = np.memmap(self._col_path(col), dtype=self.meta["columns"][col], mode='r', shape=(self._n,))
+            self._maps[col] = arr
+        return arr
+
+    def timestamps(self) -> np.ndarray:
+        # int64 纳秒视图为 datetime64[ns], 不拷贝
+        return self._column(TIMESTAMP_COL).view("datetime64[ns]")
+
+    def read(self, lo: int = 0, hi: Optional[int] = None, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        读取行区间 [lo, hi) 的指定列, 只拷贝该区间
+        """
+        hi = self._n if hi is None else min(hi, self._n)
+        lo = max(0, lo)
+        cols = columns or self.columns
+        if lo >= hi:
+            return pd.DataFrame(columns=cols)
+        data = {}
+        for c in cols:
+            if c == TIMESTAMP_COL:
+                data[c] = np.array(self.timestamps()[lo:hi])
+            else:
+                data[c] = np.array(self._column(c)[lo:hi])
+        return pd.DataFrame(data, columns=cols)
+
+    def read_arrays(self, lo: int, hi: int, columns: List[str]) -> Dict[str, np.ndarray]:
+        """
+        读取行区间 [lo, hi) 的指定列为数组 (不存在的列跳过)
+        未打开 memmap 的列按偏移直接从文件读取, 不保留文件映射, 适合一次扫描大量存储
+        """
+        hi = min(hi, self._n)
+        lo = max(0, min(lo, hi))
+        out = {}
+        for c in columns:
+            if c not in self.meta["columns"]:
+                continue
+            if c in self._maps:
+                out[c] = np.array(self._maps[c][lo:hi])
+                continue
+            dtype = np.dtype(self.meta["columns"][c])
+            out[c] = np.fromfile(self._col_path(c), dtype=dtype, count=hi - lo, offset=lo * dtype.itemsize)
+        return out
+
+    @classmethod
+    def create(cls, path: str, df: pd.DataFrame, columns: Optional[List[str]] = None) -> "ColumnStore":
+        """
+        以 df 新建存储 (覆盖已有目录中的同名文件), columns 默认取 df 中存在的 LOADER_COLUMNS
+        """
+        if columns is None:
+            columns = [c for c in LOADER_COLUMNS if c in df.columns]
+        columns = [TIMESTAMP_COL] + [c for c in columns if c != TIMESTAMP_COL and c not in SPOIL_COLUMNS]
+        os.makedirs(path, exist_ok=True)
+
+        df = df.sort_values(TIMESTAMP_COL, kind='stable') if len(df) else df
+        arrays = _frame_to_arrays(df, columns) if len(df) else {c: np.empty(0) for c in columns}
+        for c in columns:
+            dtype = TIMESTAMP_DTYPE if c == TIMESTAMP_COL else VALUE_DTYPE
+            arrays[c].astype(dtype).tofile(os.path.join(path, c + ".bin"))
+
+        meta = {
+            "format": FORMAT_NAME,
+            "version": FORMAT_VERSION,
+            "columns": {c: (TIMESTAMP_DTYPE if c == TIMESTAMP_COL else VALUE_DTYPE) for c in columns},
+        }
+        tmp = os.path.join(path, META_FILE + ".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, os.path.join(path, META_FILE))
+        return cls(path)
+
+    def last_timestamp(self) -> Optional[pd.Timestamp]:
+        if self._n == 0:
+            return None
+        return pd.Timestamp(self.timestamps()[-1])
+
+    def _write_tail(self, col: str, values: np.ndarray) -> None:
+        # 截断到已提交行数 (丢弃上次中断留下的残留行) 后在末尾写入
+        dtype = np.dtype(self.meta["columns"][col])
+        with open(self._col_path(col), 'r+b') as f:
+            f.truncate(self._n * dtype.itemsize)
+            f.seek(0, os.SEEK_END)
+            values.astype(dtype).tofile(f)
+
+    def append(self, df: pd.DataFrame) -> int:
+        """
+        追加时间戳严格晚于当前最后一行的记录 (更早或重复的行被丢弃), 返回实际追加行数
+        已提交行数以磁盘上的 timestamp 文件为准, 追加后本实例行数同步更新
+        """
+        if df.empty:
+            return 0
+        self._n = os.path.getsize(self._col_path(TIMESTAMP_COL)) // np.dtype(TIMESTAMP_DTYPE).itemsize
+        self._maps.clear()
+        df = df.sort_values(TIMESTAMP_COL, kind='stable')
+        arrays = _frame_to_arrays(df, self.columns)
+        ts = arrays[TIMESTAMP_COL]
+
+        # 去掉批内重复时间戳 (保留最后一条) 以及不晚于已有数据的行
+        keep = np.ones(len(ts), dtype=bool)
+        keep[:-1] = ts[1:] != ts[:-1]
+        last = self.timestamps()[-1].astype(np.int64) if self._n else None
+        if last is not None:
+            keep &= ts > last
+        if not keep.any():
+            return 0
+
+        for c in self.columns:
+            if c != TIMESTAMP_COL:
+                self._write_tail(c, arrays[c][keep])
+        self._write_tail(TIMESTAMP_COL, ts[keep])
+
+        added = int(keep.sum())
+        self._n += added
+        self._maps.clear()
+        return added
+
+
+def convert_json_to_store(json_path: str, out_path: str, columns: Optional[List[str]] = None) -> ColumnStore:
+    """
+    把 list 或 {"data": [...]} 结构的 JSON 记录转换为列式存储
+    与 data_loader 读取 JSON 时相同: 去掉场景标签类列, 按时间戳稳定排序; 默认只保留 LOADER_COLUMNS
+    """
+    with open(json_path, 'r', encoding='utf-8') as f:
+        raw = json.load(f)
+    records = raw['data'] if isinstance(raw, dict) and isinstance(raw.get('data'), list) else raw
+    if not isinstance(records, list):
+        raise TypeError('JSON 顶层应为 list 或 dict 且包含 `data` 字段')
+    df = pd.DataFrame(records)
+    if TIMESTAMP_COL not in df.columns:
+        raise ValueError(f"记录缺少 `{TIMESTAMP_COL}` 字段: {json_path}")
+    df = df.drop(columns=[c for c in SPOIL_COLUMNS if c in df.columns])
+    return ColumnStore.create(out_path, df, columns)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="把 JSON 传感器记录转换为列式 memmap 存储")
+    parser.add_argument("json_path", type=str)
+    parser.add_argument("out_path", type=str, help="输出目录, 建议以 .cols 结尾")
+    parser.add_argument("--columns", nargs="+", default=None, help="只保留这些列 (默认 data_loader 使用的列)")
+    args = parser.parse_args(argv)
+
+    store = convert_json_to_store(args.json_path, args.out_path, args.columns)
+    print(f"已写入 {len(store)} 行, 列: {', '.join(store.columns)} -> {args.out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@
 在生产环境中请通过 .env 或 CI/CD 注入 API_KEY
 """
 import os
+import json
 import yaml
 from dotenv import load_dotenv
 
@@ -16,11 +17,63 @@ DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY", "").strip()
 DEEPSEEK_BASE_URL = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
 DEEPSEEK_MODEL = os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
 
+# LLM 异步客户端连接池 (keep-alive 复用连接)
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "10"))
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "20"))
+
+# LLM 调用调度：同时进行的上游调用上限 (默认与连接池一致), 排队上限与排队等待预算 (秒), 超出时回退到本地建议
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", str(LLM_MAX_CONNECTIONS)))
+LLM_QUEUE_MAX = int(os.getenv("LLM_QUEUE_MAX", "256"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "3"))
+# 上游返回 429 且未给出 Retry-After 时暂停放行的秒数
+LLM_RATE_LIMIT_COOLDOWN = float(os.getenv("LLM_RATE_LIMIT_COOLDOWN", "2"))
+
+# POST /chat/batch 每批最多的问题数
+CHAT_BATCH_MAX = int(os.getenv("CHAT_BATCH_MAX", "16"))
+
+# 后台摘要：定期检查各设备数据版本, 有新记录时重新生成摘要 (统计、规则告警, 可选预热常见问题的 LLM 回复)
+DIGEST_ENABLED = os.getenv("DIGEST_ENABLED", "1") == "1"
+DIGEST_POLL_SECONDS = float(os.getenv("DIGEST_POLL_SECONDS", "60"))
+DIGEST_PREWARM = os.getenv("DIGEST_PREWARM", "0") == "1"
+# 同时重建摘要的设备数上限 (数据读取在线程池中进行, 预热回复经 LLM 调度器排队)
+DIGEST_CONCURRENCY = int(os.getenv("DIGEST_CONCURRENCY", "4"))
+DIGEST_QUESTIONS = json.loads(os.getenv("DIGEST_QUESTIONS", "null")) or [
+    "我需要给树浇水吗？",
+    "要不要排水？",
+    "最近会有霜冻吗？",
+]
+
+# LLM 回复缓存：相同 (问题, 数据窗口, 模型参数) 直接复用回复
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "3600"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(4 * 1024 * 1024)))
+
 PROMPT_FILE_PATH = os.getenv("PROMPT_FILE_PATH", os.path.join(PROJECT_ROOT, "prompts/system.yaml"))
 
 # demo数据默认路径（可通过环境变量覆盖）
 DATA_FILE_PATH = os.getenv("DATA_FILE_PATH", os.path.join(PROJECT_ROOT, "output/pseudo_data/test.json"))
 
+# 多设备数据目录：设备 deviceKey 对应 {DATA_DIR}/{deviceKey}.cols 或 {deviceKey}.json
+DATA_DIR = os.getenv("DATA_DIR", os.path.join(PROJECT_ROOT, "output/devices"))
+# 同时驻留内存的设备数据集上限 (LRU)
+DEVICE_CACHE_SIZE = int(os.getenv("DEVICE_CACHE_SIZE", "32"))
+
+# 数据上下文 token 预算 (每个窗口)：超出时近段保留逐小时, 较早的数据降采样为 3h/6h/日聚合
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+# 压缩时优先保留逐小时分辨率的近段小时数
+CONTEXT_FULL_RES_HOURS = int(os.getenv("CONTEXT_FULL_RES_HOURS", "24"))
+# /chat 的 pre_hours / post_hours 上限
+CONTEXT_MAX_HOURS = int(os.getenv("CONTEXT_MAX_HOURS", "720"))
+
+# 平台 QueryHistoryList 记录到 loader 字段的映射："nodeId.寄存器字段" -> 列名, JSON 环境变量
+# 节点与寄存器的含义取决于现场设备的接线, 没有通用默认值; 未配置时 src.ingest 拒绝接入
+INGEST_FIELD_MAP = json.loads(os.getenv("INGEST_FIELD_MAP", "null")) or {}
+# 小时聚合时求和的列 (累计量), 其余列取均值
+INGEST_SUM_COLS = ["rain"]
+# 每次归一化处理的记录条数上限, 控制单批内存占用
+INGEST_CHUNK_RECORDS = int(os.getenv("INGEST_CHUNK_RECORDS", "50000"))
+
 
 def _load_system_prompt(file_path: str) -> str:
     try:
@@ -42,5 +95,37 @@ MOCK_THRESHOLDS = {
     "soil_water_high": 40.0,
     "soil_water_low": 20.0,
     "rain_heavy_total_mm": 10.0,
-    "temp_hot": 30.0
+    "temp_hot": 30.0,
+    "temp_frost": 2.0,
+    "temp_hot_hours": 4,
+    "soil_water_fast_change_per_hour": 0.5
 }
+
+# 告警规则 (见 rules.py)：变量 var 的窗口统计量 stat 与 threshold 按 op 比较, 命中即告警
+# hours 只看窗口末尾若干小时, limit 为 hours_ge / hours_le 的逐小时阈值; message 中的 {value} 替换为统计值
+# 同时用于离线/回退回复与 GET /alerts, 可用 JSON 环境变量 ALERT_RULES 覆盖
+ALERT_RULES = json.loads(os.getenv("ALERT_RULES", "null")) or [
+    {"name": "soil_wet", "var": "soil_water", "stat": "last", "op": ">=",
+     "threshold": MOCK_THRESHOLDS["soil_water_high"], "level": "warning",
+     "message": "土壤已经很湿了, 不要浇水, 必要时检查田间排水, 避免烂根。"},
+    {"name": "soil_dry", "var": "soil_water", "stat": "last", "op": "<=",
+     "threshold": MOCK_THRESHOLDS["soil_water_low"], "level": "warning",
+     "message": "土壤偏干, 建议尽快补水 (小水多次或早晚灌溉) , 注意避免正午直接灌水导致蒸发过快。"},
+    {"name": "heavy_rain", "var": "rain", "stat": "sum", "op": ">=",
+     "threshold": MOCK_THRESHOLDS["rain_heavy_total_mm"], "level": "warning",
+     "message": "近期累计降雨较多, 注意检查排水沟与果园低洼处, 必要时启动抽水或疏导。"},
+    {"name": "heat", "var": "temp", "stat": "hours_ge", "limit": MOCK_THRESHOLDS["temp_hot"], "op": ">=",
+     "threshold": MOCK_THRESHOLDS["temp_hot_hours"], "level": "warning",
+     "message": "近期温度偏高, 建议白天遮阳、补充灌溉和喷薄叶面水以降温。"},
+    {"name": "frost", "var": "temp", "stat": "min", "op": "<=",
+     "threshold": MOCK_THRESHOLDS["temp_frost"], "level": "critical",
+     "message": "最低气温已到 {value}°C, 有霜冻风险, 夜间注意覆盖保温或熏烟防霜。"},
+    {"name": "soil_water_rising", "var": "soil_water", "stat": "trend", "op": ">=",
+     "threshold": MOCK_THRESHOLDS["soil_water_fast_change_per_hour"], "level": "info",
+     "message": "土壤含水上升很快, 留意田间积水, 提前疏通排水沟。"},
+    {"name": "soil_water_falling", "var": "soil_water", "stat": "trend", "op": "<=",
+     "threshold": -MOCK_THRESHOLDS["soil_water_fast_change_per_hour"], "level": "info",
+     "message": "土壤含水下降很快, 注意及时补水。"},
+]
+# GET /alerts 默认扫描的窗口小时数
+ALERT_WINDOW_HOURS = int(os.getenv("ALERT_WINDOW_HOURS", "24"))
@@ -3,21 +3,37 @@
 数据加载与整理
 功能：
  - 支持从 pseudo data JSON (list 或 {"data": [...] })读取记录
+ - 也支持列式 memmap 存储目录 (见 column_store.py), 只有被选中的窗口会从磁盘读入
+ - 多设备：device_key 映射到 DATA_DIR 下的数据文件, 各设备按需加载, 内存中按 LRU 保留 DEVICE_CACHE_SIZE 个
  - 支持通过 config 中的 REFERENCE_TIMESTAMP 指定一个时间点(用于测试)
  - 提取 reference_time 前后各若干小时的窗口(默认各 24h)
  - 删除可能泄露场景/标签的列
  - 以最小 token 成本的紧凑 CSV(短列名)和简短英文 summary 输出, 供 DeepSeek/LLM 使用
- - 返回 (data_context_str, summary_str, df_window)
+ - 长窗口按 token 预算自适应压缩: 近段逐小时, 较早的数据降为 3h/6h/日聚合 (均值/最小/最大, 降雨求和), 恒定列单独列出
+ - 返回 (data_context_str, summary_str, df_window); load_window 另附结构化的 WindowSummary
+ - 进程级数据集缓存: 清洗排序后的 DataFrame 只构建一次, 文件 mtime/size 变化时才重新加载
+ - 窗口结果备忘: 按 (数据文件, 参考时间, 方向, 小时数) 缓存渲染好的 (data_context, summary, df_window),
+   数据更新后只重算受新行影响的窗口
+ - 请求合并: 并发请求同一数据集/窗口时只加载、渲染一次, 其余请求等待并共享结果
 """
 
 import os
+import re
 import json
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import pandas as pd
 import numpy as np
 
+from column_store import ColumnStore, is_column_store, store_signature
+from singleflight import SingleFlight
+from rules import RuleEngine
 
 try:
     # 兼容直接运行或包内导入
@@ -30,6 +46,21 @@ except Exception:
         raise ImportError("请在 config.py 中定义 DATA_FILE_PATH(和可选的 REFERENCE_TIMESTAMP)")
     REFERENCE_TIMESTAMP = None
 
+try:
+    from config import DATA_DIR, DEVICE_CACHE_SIZE
+except Exception:
+    DATA_DIR, DEVICE_CACHE_SIZE = None, 8
+
+try:
+    from config import CONTEXT_TOKEN_BUDGET, CONTEXT_FULL_RES_HOURS
+except Exception:
+    CONTEXT_TOKEN_BUDGET, CONTEXT_FULL_RES_HOURS = 1200, 24
+
+try:
+    from config import ALERT_RULES, MOCK_THRESHOLDS
+except Exception:
+    ALERT_RULES, MOCK_THRESHOLDS = [], {}
+
 
 
 
@@ -83,40 +114,274 @@ def _ensure_timestamp_sorted(df: pd.DataFrame) -> pd.DataFrame:
 
     df = df.copy()
     df['timestamp'] = pd.to_datetime(df['timestamp'])
-    df = df.sort_values('timestamp').reset_index(drop=True)
+    # 稳定排序: 重复时间戳保持原有顺序, 与列式存储的转换结果一致
+    df = df.sort_values('timestamp', kind='stable').reset_index(drop=True)
     return df
 
 
-def _select_window_by_time(df: pd.DataFrame, reference_time: Optional[datetime], hours: int = 24, direction: str = 'past') -> pd.DataFrame:
-    if 'timestamp' not in df.columns:
-        # 无时间戳时，默认按行视作小时序列
-        if direction == 'past':
-            return df.tail(hours).copy().reset_index(drop=True)
-        else:
-            return pd.DataFrame(columns=df.columns)
+def _load_dataset(path: str):
+    # 列式存储只打开 memmap, 不整体读入
+    if is_column_store(path):
+        return ColumnStore(path)
+    records = _load_raw_records(path)
+    df = pd.DataFrame(records)
+    df = _clean_spoilers(df)
+    df = _ensure_timestamp_sorted(df)
+    return df
 
-    
-    if reference_time is None:
-        # 未给参考时间，则默认取最新窗口
+
+def _file_signature(path: str) -> Tuple[int, int]:
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"data file not found: {path}")
+    if is_column_store(path):
+        return store_signature(path)
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+class DatasetCache:
+    """
+    进程级数据集缓存
+    - 以文件路径为 key 保存清洗、排序后的 DataFrame (列式存储则保存 ColumnStore 视图)
+    - 每次访问只做一次 os.stat, mtime 或 size 变化时才重新解析
+    - 超过 max_entries 时按 LRU 淘汰
+    - 解析在锁外进行: 不同文件可并行加载, 同一 (文件, 版本) 的并发加载经 single-flight 合并为一次 (计入 coalesced)
+    - fill=False 供后台批量读取 (全设备告警扫描、摘要): 已缓存且未过期时直接返回 (不调整 LRU 顺序),
+      否则临时加载且不写入缓存 (计入 bypassed), 不会挤掉 /chat 正在使用的设备
+    返回的 DataFrame 为共享对象, 调用方不得原地修改
+    """
+
+    def __init__(self, max_entries: int = 8):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # path -> (signature, df)
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    def snapshot(self, path: str, fill: bool = True) -> Tuple[Tuple[int, int], pd.DataFrame]:
+        """
+        返回 (signature, df), signature 即数据版本
+        """
+        key = os.path.abspath(path)
+        sig = _file_signature(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == sig:
+                if fill:
+                    self.hits += 1
+                    self._entries.move_to_end(key)
+                return entry
+            if not fill:
+                self.bypassed += 1
+
+        if not fill:
+            return sig, _load_dataset(key)
+        return self._flight.do((key, sig), lambda: self._load(key, sig))[0]
+
+    def _load(self, key: str, sig: Tuple[int, int]) -> Tuple[Tuple[int, int], pd.DataFrame]:
+        df = _load_dataset(key)
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = (sig, df)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return sig, df
+
+    def get(self, path: str) -> pd.DataFrame:
+        return self.snapshot(path)[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        coalesced = self._flight.coalesced
+        total = self.hits + self.misses + coalesced
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'coalesced': coalesced,
+            'misses': self.misses,
+            'bypassed': self.bypassed,
+            'hit_ratio': round((self.hits + coalesced) / total, 4) if total else 0.0,
+        }
+
+
+_DATASET_CACHE = DatasetCache(max_entries=DEVICE_CACHE_SIZE)
+
+_DEVICE_KEY_RE = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+
+def resolve_data_path(device_key: Optional[str] = None) -> str:
+    """
+    device_key 为 None 时返回 DATA_FILE_PATH, 否则返回 DATA_DIR 下该设备的数据 (优先列式存储)
+    空字符串、路径 (含 / 或以 . 开头) 等不合法的 key 抛出 ValueError
+    """
+    if device_key is None:
+        return DATA_FILE_PATH
+    if not isinstance(device_key, str) or not _DEVICE_KEY_RE.match(device_key) or device_key.startswith('.'):
+        raise ValueError(f"非法 device_key: {device_key!r}")
+    if not DATA_DIR:
+        raise FileNotFoundError("未配置 DATA_DIR, 无法按 device_key 加载数据")
+    cols_path = os.path.join(DATA_DIR, f"{device_key}.cols")
+    if is_column_store(cols_path):
+        return cols_path
+    json_path = os.path.join(DATA_DIR, f"{device_key}.json")
+    if os.path.exists(json_path):
+        return json_path
+    raise FileNotFoundError(f"未找到设备数据: {device_key} (DATA_DIR={DATA_DIR})")
+
+
+def list_device_keys() -> list:
+    """
+    DATA_DIR 下所有设备的 device_key ({key}.cols 或 {key}.json), 按名称排序
+    """
+    if not DATA_DIR or not os.path.isdir(DATA_DIR):
+        return []
+    keys = set()
+    for name in os.listdir(DATA_DIR):
+        stem, ext = os.path.splitext(name)
+        if ext in ('.cols', '.json') and _DEVICE_KEY_RE.match(stem) and not stem.startswith('.'):
+            keys.add(stem)
+    return sorted(keys)
+
+
+def _store_columns(store: ColumnStore) -> list:
+    # 列式存储只读出可信列, 与 JSON 路径经 _clean_spoilers 后的结果一致 (旧版转换可能写入了标签类列)
+    return [c for c in store.columns if c in TRUSTED_COLS]
+
+
+def get_dataset(path: Optional[str] = None) -> pd.DataFrame:
+    ds = _DATASET_CACHE.get(path or DATA_FILE_PATH)
+    if isinstance(ds, ColumnStore):
+        return ds.read(columns=_store_columns(ds))
+    return ds
+
+
+def dataset_version(device_key: Optional[str] = None) -> Tuple[int, int]:
+    # 设备数据版本标识 (mtime_ns, size), 新数据写入后随之变化
+    return _file_signature(resolve_data_path(device_key))
+
+
+def dataset_cache_stats() -> dict:
+    return _DATASET_CACHE.stats()
+
+
+def _timestamp_index(df: pd.DataFrame) -> np.ndarray:
+    # 已排序的 datetime64 列, to_numpy 不拷贝数据, 可直接做二分查找
+    return df['timestamp'].to_numpy()
+
+
+def _window_bounds(ds, reference_time: Optional[datetime], hours: int = 24, direction: str = 'past') -> Tuple[int, int]:
+    """
+    返回窗口在数据集 (DataFrame 或 ColumnStore) 中的行区间 [lo, hi)
+    """
+    n = len(ds)
+    columnar = isinstance(ds, ColumnStore)
+    if (not columnar and 'timestamp' not in ds.columns) or reference_time is None:
+        # 无时间戳(按行视作小时序列)或未给参考时间：past 取最新窗口, future 为空
         if direction == 'past':
-            return df.tail(hours).copy().reset_index(drop=True)
-        else:
-            return pd.DataFrame(columns=df.columns)
+            return max(0, n - hours), n
+        return n, n
 
     
-    
+    # 时间戳已排序：用二分查找定位窗口边界
+    ts = ds.timestamps() if columnar else _timestamp_index(ds)
+    ref = pd.Timestamp(reference_time).to_datetime64()
+    split = int(np.searchsorted(ts, ref, side='right'))
     if direction == 'past':
-        mask = df['timestamp'] <= reference_time
-        df_past = df[mask]
-        if df_past.empty:
-            return pd.DataFrame(columns=df.columns)
-        return df_past.tail(hours).copy().reset_index(drop=True)
-    else:
-        mask = df['timestamp'] > reference_time
-        df_future = df[mask]
-        if df_future.empty:
-            return pd.DataFrame(columns=df.columns)
-        return df_future.head(hours).copy().reset_index(drop=True)
+        return max(0, split - hours), split
+    return split, min(n, split + hours)
+
+
+def _slice_window(ds, lo: int, hi: int) -> pd.DataFrame:
+    # 只拷贝(或从磁盘读入)窗口内的行
+    if isinstance(ds, ColumnStore):
+        return ds.read(lo, hi, columns=_store_columns(ds))
+    if lo >= hi:
+        return pd.DataFrame(columns=ds.columns)
+    return ds.iloc[lo:hi].reset_index(drop=True)
+
+
+def _select_window_by_time(df: pd.DataFrame, reference_time: Optional[datetime], hours: int = 24, direction: str = 'past') -> pd.DataFrame:
+    lo, hi = _window_bounds(df, reference_time, hours=hours, direction=direction)
+    return _slice_window(df, lo, hi)
+
+
+# 两位数字查表：月/日/时/分补零
+_TWO_DIGITS = np.array([f"{i:02d}" for i in range(100)], dtype=object)
+# 两位小数部分查表(已去掉尾部 0)：0 -> '', 50 -> '.5', 5 -> '.05'
+_FRAC_SUFFIX = np.array([('.' + f"{i:02d}").rstrip('0').rstrip('.') for i in range(100)], dtype=object)
+
+
+def _fmt_num(x) -> str:
+    if pd.isna(x):
+        return ''
+    if isinstance(x, (int, np.integer)):
+        return str(int(x))
+    try:
+        # 保留两位小数，去掉尾部 0
+        s = f"{float(round(float(x), 2)):.2f}"
+        
+        if '.' in s:
+            s = s.rstrip('0').rstrip('.')
+        return s
+    except Exception:
+        return str(x)
+
+
+def _format_float_column(values) -> np.ndarray:
+    x = np.asarray(values, dtype=np.float64)
+    out = np.full(x.shape, '', dtype=object)
+
+    # 超大值、inf, 以及距 .5 过近(乘 100 的浮点误差可能改变进位方向)的元素回退到逐元素格式化
+    with np.errstate(invalid='ignore'):
+        scaled = x * 100.0
+        k = np.rint(scaled)
+        frac = np.abs(scaled - np.trunc(scaled))
+    fast = np.isfinite(x) & (np.abs(x) < 1e9) & (np.abs(frac - 0.5) > 1e-4)
+
+    kf = k[fast]
+    ki = np.abs(kf).astype(np.int64)
+    sign = np.where(np.signbit(kf), '-', '').astype(object)
+    out[fast] = sign + (ki // 100).astype(str).astype(object) + _FRAC_SUFFIX[ki % 100]
+
+    slow = ~fast & ~np.isnan(x)
+    if slow.any():
+        out[slow] = [_fmt_num(v) for v in x[slow]]
+    return out
+
+
+def _format_time_column(values) -> np.ndarray:
+    idx = pd.DatetimeIndex(pd.to_datetime(values))
+    nat = np.asarray(idx.isna())
+
+    def two(part):
+        return _TWO_DIGITS[np.where(nat, 0, np.asarray(part, dtype=np.float64)).astype(np.int64)]
+
+    out = two(idx.month) + '-' + two(idx.day) + ' ' + two(idx.hour) + ':' + two(idx.minute)
+    out[nat] = ''
+    return out
+
+
+def _format_column(series: pd.Series) -> np.ndarray:
+    dtype = series.dtype
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        if not series.hasnans:
+            return series.to_numpy(dtype=np.int64).astype(str).astype(object)
+        return np.array([_fmt_num(v) for v in series], dtype=object)
+    if pd.api.types.is_float_dtype(dtype) and isinstance(dtype, np.dtype):
+        return _format_float_column(series.to_numpy())
+    if pd.api.types.is_numeric_dtype(dtype):
+        return np.array([_fmt_num(v) for v in series], dtype=object)
+
+    values = series.to_numpy(dtype=object)
+    out = values.astype(str).astype(object)
+    out[pd.isna(values)] = ''
+    return out
 
 
 def _compact_csv_from_df(df: pd.DataFrame, cols: list) -> str:
@@ -129,63 +394,229 @@ def _compact_csv_from_df(df: pd.DataFrame, cols: list) -> str:
     if not valid_cols:
         return ''
 
-    dfc = df[valid_cols].copy()
-
     
-    if 'timestamp' in dfc.columns:
-        dfc['timestamp'] = pd.to_datetime(dfc['timestamp']).dt.strftime('%m-%d %H:%M')
+    # 逐列整体格式化为字符串数组, 再按列拼接成行, 避免逐单元格/逐行的 Python 循环
+    columns = []
+    for c in valid_cols:
+        if c == 'timestamp':
+            columns.append(_format_time_column(df[c]))
+        else:
+            columns.append(_format_column(df[c]))
 
-    
-    def fmt_num(x):
-        if pd.isna(x):
-            return ''
-        if isinstance(x, (int, np.integer)):
-            return str(int(x))
-        try:
-            # 保留两位小数，去掉尾部 0
-            s = f"{float(round(float(x), 2)):.2f}"
-            
-            if '.' in s:
-                s = s.rstrip('0').rstrip('.')
-            return s
-        except Exception:
-            return str(x)
-
-    for c in dfc.columns:
-        if c != 'timestamp' and pd.api.types.is_numeric_dtype(dfc[c].dtype):
-            dfc[c] = dfc[c].map(fmt_num)
+    lines = columns[0]
+    for col in columns[1:]:
+        lines = lines + ',' + col
 
-    
-    header = [SHORT_COL_MAP.get(c, c) for c in dfc.columns]
-    rows = [','.join(header)]
-    for _, row in dfc.iterrows():
-        vals = [str(row[c]) if not pd.isna(row[c]) else '' for c in dfc.columns]
-        rows.append(','.join(vals))
-    return '\n'.join(rows)
+    header = ','.join(SHORT_COL_MAP.get(c, c) for c in valid_cols)
+    return '\n'.join([header, *lines.tolist()])
 
 
-def _summarize_window(df: pd.DataFrame) -> str:
+# ---- 按 token 预算自适应压缩 ----
+# 估算用: 数字/逗号为主的 CSV 平均约 3 个字符一个 token
+CHARS_PER_TOKEN = 3.0
+# 聚合时求和的列 (累计量), 其余列输出 均值/最小/最大
+AGG_SUM_COLS = ['rain']
+
+
+def _estimate_tokens(text: str) -> int:
+    return int(np.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+def _split_constant_columns(df: pd.DataFrame, cols: list) -> Tuple[list, dict]:
+    """
+    返回 (窗口内有变化的列, {恒定列: 取值}); 全部缺失的列取值为 None
+    """
+    varying, const = [], {}
+    for c in cols:
+        values = df[c].dropna()
+        if values.nunique() <= 1:
+            const[c] = values.iloc[0] if len(values) else None
+        else:
+            varying.append(c)
+    return varying, const
+
+
+def _compression_plans(full_res_hours: int):
+    """
+    由细到粗的分层方案: ((逐小时跨度, 1), (3h 跨度, 3), (6h 跨度, 6)), 更早的数据按日聚合
+    每个方案的逐小时跨度减半, 最后一个方案全部按日聚合
+    """
+    h = max(0, int(full_res_hours))
+    while True:
+        yield ((h, 1), (-(-2 * h // 3) * 3, 3), (-(-4 * h // 6) * 6, 6))
+        if h == 0:
+            return
+        h //= 2
+
+
+def _aggregate_block(block: pd.DataFrame, cols: list) -> pd.DataFrame:
+    """
+    按 bucket 列聚合: time 为桶内最早时间, X 为均值, X_min/X_max 为桶内范围, 累计量 (降雨) 求和
+    """
+    grouped = block.groupby('bucket', sort=True)
+    out = {'timestamp': grouped['timestamp'].min()}
+    for c in cols:
+        if c in AGG_SUM_COLS:
+            out[c] = grouped[c].sum(min_count=1)
+            continue
+        short = SHORT_COL_MAP.get(c, c)
+        out[c] = grouped[c].mean()
+        out[f'{short}_min'] = grouped[c].min()
+        out[f'{short}_max'] = grouped[c].max()
+    return pd.DataFrame(out).sort_values('timestamp')
+
+
+def _encode_tiers(df: pd.DataFrame, age_h: np.ndarray, cols: list, const: dict, plan, anchor: str) -> str:
+    tiers, start = [], 0.0
+    for span, size in plan:
+        if span > 0:
+            tiers.append((start, start + span, size))
+            start += span
+    tiers.append((start, np.inf, 24))
+
+    blocks = []
+    for lo, hi, size in tiers:
+        mask = (age_h >= lo) & (age_h < hi)
+        if not mask.any():
+            continue
+        block = df.loc[mask, ['timestamp', *cols]]
+        if size == 1:
+            text = _compact_csv_from_df(block, ['timestamp', *cols])
+        else:
+            block = block.assign(bucket=((age_h[mask] - lo) // size).astype(np.int64))
+            agg = _aggregate_block(block, cols)
+            text = _compact_csv_from_df(agg, list(agg.columns))
+        blocks.append(f"[{'1d' if size == 24 else f'{size}h'}]\n{text}")
+
+    # 近段在 anchor 一侧; 输出统一按时间先后排列
+    if anchor == 'end':
+        blocks.reverse()
+    if const:
+        items = [f"{SHORT_COL_MAP.get(c, c)}={'NA' if v is None else _fmt_num(v)}" for c, v in const.items()]
+        blocks.append('CONST: ' + ','.join(items))
+    return '\n'.join(blocks)
+
+
+def _encode_window(df: pd.DataFrame, anchor: str = 'end', budget: Optional[int] = None,
+                   full_res_hours: Optional[int] = None) -> str:
+    """
+    在 token 预算内编码窗口
+    - 完整逐小时 CSV 不超预算时原样返回 (与 _compact_csv_from_df 一致)
+    - 否则去掉恒定列, 距 anchor 最近的若干小时保留逐小时, 更早的依次降为 3h/6h/日聚合,
+      逐步缩短逐小时段直到满足预算; 仍超出时返回最粗的方案
+    anchor='end' 表示最新的数据在窗口末尾 (过去窗口), 'start' 表示在开头 (预报窗口)
+    """
+    budget = CONTEXT_TOKEN_BUDGET if budget is None else budget
+    full_res_hours = CONTEXT_FULL_RES_HOURS if full_res_hours is None else full_res_hours
+    full = _compact_csv_from_df(df, TRUSTED_COLS)
+    if not full or _estimate_tokens(full) <= budget or 'timestamp' not in df.columns:
+        return full
+
+    varying, const = _split_constant_columns(df, [c for c in TRUSTED_COLS[1:] if c in df.columns])
+    ts = pd.to_datetime(df['timestamp']).to_numpy(dtype='datetime64[ns]')
+    ref = ts[-1] if anchor == 'end' else ts[0]
+    age_h = np.abs((ref - ts) / np.timedelta64(1, 'h'))
+
+    text = full
+    for plan in _compression_plans(full_res_hours):
+        text = _encode_tiers(df, age_h, varying, const, plan, anchor)
+        if _estimate_tokens(text) <= budget:
+            break
+    return text
+
+
+SUMMARY_COLS = ['temp', 'humidity', 'rain', 'solar', 'soil_water']
+_ALERT_ENGINE = RuleEngine(ALERT_RULES)
+# 全设备扫描 (read_fleet_windows) 的读取线程数
+FLEET_READ_WORKERS = 8
+# summary 中统计 "气温不低于该值的小时数", 与默认 heat 规则 (hours_ge) 的 limit 一致
+HOT_TEMP_C = MOCK_THRESHOLDS.get('temp_hot', 30.0)
+
+
+@dataclass
+class VariableStats:
+    first: float
+    last: float
+    min: float
+    max: float
+    mean: float
+    total: float
+    trend: float  # 最小二乘斜率, 单位/每条记录(小时)
+    count: int
+
+
+@dataclass
+class WindowSummary:
+    """
+    窗口的结构化摘要, 供 mock 回复与规则引擎直接读取
+    mean_temp / total_rain / last_vwc / hot_hours 与 summary 字符串中的取值(含舍入)一致
+    hot_hours 为气温 >= HOT_TEMP_C 的小时数, 只有 summary 字符串的调用方也能据此评估 heat 规则
+    alerts 为按 ALERT_RULES 对该窗口求得的告警 (见 rules.py), 只对过去窗口计算, 预报窗口为空
+    """
+    records: int = 0
+    mean_temp: Optional[float] = None
+    total_rain: Optional[float] = None
+    last_vwc: Optional[float] = None
+    hot_hours: Optional[int] = None
+    variables: Dict[str, VariableStats] = field(default_factory=dict)
+    alerts: List[dict] = field(default_factory=list)
+
+    def to_text(self) -> str:
+        if self.records == 0:
+            return 'No data available.'
+        lines = []
+        if self.mean_temp is not None:
+            lines.append(f"Mean temp: {self.mean_temp} C over {self.records} records")
+        if self.total_rain is not None:
+            lines.append(f"Total rain: {self.total_rain} mm")
+        if self.last_vwc is not None:
+            lines.append(f"Latest soil VWC: {self.last_vwc} %")
+        if self.hot_hours is not None:
+            lines.append(f"Hours >= {_fmt_num(HOT_TEMP_C)} C: {self.hot_hours}")
+        return ' | '.join(lines) if lines else 'No numeric summary.'
+
+
+def _variable_stats(values: np.ndarray) -> VariableStats:
+    n = len(values)
+    if n > 1:
+        x = np.arange(n, dtype=np.float64)
+        x -= x.mean()
+        trend = float(np.dot(x, values - values.mean()) / np.dot(x, x))
+    else:
+        trend = 0.0
+    return VariableStats(
+        first=float(values[0]), last=float(values[-1]),
+        min=float(values.min()), max=float(values.max()),
+        mean=float(values.mean()), total=float(values.sum()),
+        trend=trend, count=n,
+    )
+
+
+def _summarize_window_stats(df: pd.DataFrame, alerts: bool = False) -> WindowSummary:
+    summary = WindowSummary(records=len(df))
     if df.empty:
-        return 'No data available.'
+        return summary
+
+    for c in SUMMARY_COLS:
+        if c in df.columns and pd.api.types.is_numeric_dtype(df[c].dtype):
+            values = df[c].dropna().to_numpy(dtype=np.float64)
+            if len(values):
+                summary.variables[c] = _variable_stats(values)
+
+    if 'temp' in summary.variables:
+        summary.mean_temp = round(summary.variables['temp'].mean, 1)
+        summary.hot_hours = int((df['temp'].to_numpy(dtype=np.float64) >= HOT_TEMP_C).sum())
+    if 'rain' in summary.variables:
+        summary.total_rain = round(summary.variables['rain'].total, 2)
+    if 'soil_water' in summary.variables:
+        summary.last_vwc = round(summary.variables['soil_water'].last, 2)
+    if alerts:
+        summary.alerts = _ALERT_ENGINE.evaluate_frames([df], len(df))[0]
+    return summary
 
-    lines = []
-    
-    if 'temp' in df.columns and pd.api.types.is_numeric_dtype(df['temp'].dtype):
-        s = df['temp'].dropna()
-        if not s.empty:
-            lines.append(f"Mean temp: {round(float(s.mean()),1)} C over {len(df)} records")
-    
-    if 'rain' in df.columns and pd.api.types.is_numeric_dtype(df['rain'].dtype):
-        s = df['rain'].dropna()
-        if not s.empty:
-            lines.append(f"Total rain: {round(float(s.sum()),2)} mm")
-    
-    if 'soil_water' in df.columns and pd.api.types.is_numeric_dtype(df['soil_water'].dtype):
-        s = df['soil_water'].dropna()
-        if not s.empty:
-            lines.append(f"Latest soil VWC: {round(float(s.iloc[-1]),2)} %")
 
-    return ' | '.join(lines) if lines else 'No numeric summary.'
+def _summarize_window(df: pd.DataFrame) -> str:
+    return _summarize_window_stats(df).to_text()
 
 
 
@@ -197,46 +628,220 @@ def _get_reference_time_from_config_or_arg(reference_time: Optional[str or datet
     rt = reference_time if reference_time is not None else REFERENCE_TIMESTAMP
     if isinstance(rt, datetime):
         return rt
+    try:
+        # pd.Timestamp 解析常见格式远快于 pd.to_datetime 的格式推断
+        return pd.Timestamp(str(rt))
+    except Exception:
+        pass
     try:
         return pd.to_datetime(str(rt))
     except Exception:
         raise ValueError('reference_time 无法解析为 datetime')
 
 
-def load_recent_window(pre_hours: int = 24, reference_time: Optional[str or datetime] = None) -> Tuple[str, str, pd.DataFrame]:
-    records = _load_raw_records(DATA_FILE_PATH)
-    df = pd.DataFrame(records)
-    df = _clean_spoilers(df)
-    df = _ensure_timestamp_sorted(df)
+@dataclass
+class WindowResult:
+    data_context: str
+    summary: str
+    df: pd.DataFrame
+    stats: WindowSummary
 
-    ref_dt = _get_reference_time_from_config_or_arg(reference_time)
-    df_window = _select_window_by_time(df, ref_dt, hours=pre_hours, direction='past')
+    def as_tuple(self) -> Tuple[str, str, pd.DataFrame]:
+        return self.data_context, self.summary, self.df
 
-    
-    compact = _compact_csv_from_df(df_window, TRUSTED_COLS)
-    summary = _summarize_window(df_window)
-    data_context = compact + ('\n' + summary if summary else '')
-    return data_context, summary, df_window
 
+def _add_timing(timings: Optional[Dict[str, float]], stage: str, t0: float) -> None:
+    # 调用方传入 timings 字典时累加该阶段耗时 (秒), 供 /metrics 统计
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + (time.perf_counter() - t0)
 
-def load_forecast_window(post_hours: int = 24, reference_time: Optional[str or datetime] = None) -> Tuple[str, str, pd.DataFrame]:
-    records = _load_raw_records(DATA_FILE_PATH)
-    df = pd.DataFrame(records)
-    df = _clean_spoilers(df)
-    df = _ensure_timestamp_sorted(df)
 
+def _render_window(df_window: pd.DataFrame, timings: Optional[Dict[str, float]] = None,
+                   anchor: str = 'end') -> WindowResult:
+    t0 = time.perf_counter()
+    compact = _encode_window(df_window, anchor=anchor)
+    _add_timing(timings, 'csv_encode', t0)
+    t0 = time.perf_counter()
+    # 告警只用于过去窗口 (离线回复与摘要), 预报窗口不评估
+    stats = _summarize_window_stats(df_window, alerts=anchor == 'end')
+    summary = stats.to_text()
+    _add_timing(timings, 'summarize', t0)
+    data_context = compact + ('\n' + summary if summary else '')
+    return WindowResult(data_context, summary, df_window, stats)
+
+
+class WindowMemo:
+    """
+    窗口渲染结果备忘
+    - key: (数据文件, 参考时间, 方向, 小时数), value: WindowResult
+    - 数据版本未变时直接命中, 不做任何计算
+    - 数据版本变化时 (如追加了新的小时记录) 先用二分查找重算窗口边界,
+      边界不变且窗口内的行与缓存一致则沿用旧结果, 只有受新数据影响的窗口才重新渲染
+    - 未命中时按 (key, 数据版本) 做 single-flight: 并发的相同窗口只渲染一次, 其余请求等待并共享结果 (计入 coalesced)
+    返回的 df_window 为共享对象, 调用方不得原地修改
+    传入 timings 时累加 data_load / window_select / csv_encode / summarize 各阶段耗时 (等待合并结果计入 window_select)
+    cache=False 时只读取已有的最新结果 (不调整 LRU 顺序), 未命中则直接渲染且不写入备忘与数据集缓存 (计入 bypassed)
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (version, lo, hi, result)
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    def get(self, path: str, reference_time: Optional[datetime], hours: int, direction: str,
+            timings: Optional[Dict[str, float]] = None, cache: bool = True) -> WindowResult:
+        ref_key = None if reference_time is None else pd.Timestamp(reference_time).value
+        key = (os.path.abspath(path), ref_key, direction, hours)
+        t0 = time.perf_counter()
+        version, ds = _DATASET_CACHE.snapshot(path, fill=cache)
+        _add_timing(timings, 'data_load', t0)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                if cache:
+                    self.hits += 1
+                    self._entries.move_to_end(key)
+                return entry[3]
+            if not cache:
+                self.bypassed += 1
+
+        if not cache:
+            t0 = time.perf_counter()
+            lo, hi = _window_bounds(ds, reference_time, hours=hours, direction=direction)
+            df_window = _slice_window(ds, lo, hi)
+            _add_timing(timings, 'window_select', t0)
+            return _render_window(df_window, timings, anchor='end' if direction == 'past' else 'start')
+
+        t0 = time.perf_counter()
+        result, shared = self._flight.do(
+            (key, version), lambda: self._compute(key, version, ds, entry, reference_time, hours, direction, timings))
+        if shared:
+            _add_timing(timings, 'window_select', t0)
+        return result
+
+    def _compute(self, key: tuple, version, ds, entry, reference_time: Optional[datetime], hours: int, direction: str,
+                 timings: Optional[Dict[str, float]]) -> WindowResult:
+        t0 = time.perf_counter()
+        lo, hi = _window_bounds(ds, reference_time, hours=hours, direction=direction)
+        df_window = _slice_window(ds, lo, hi)
+        reuse = entry is not None and (entry[1], entry[2]) == (lo, hi) and entry[3].df.equals(df_window)
+        _add_timing(timings, 'window_select', t0)
+        if reuse:
+            result = entry[3]
+            counter = 'revalidated'
+        else:
+            result = _render_window(df_window, timings, anchor='end' if direction == 'past' else 'start')
+            counter = 'misses'
+
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+            self._entries[key] = (version, lo, hi, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return result
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        coalesced = self._flight.coalesced
+        total = self.hits + self.revalidated + coalesced + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'revalidated': self.revalidated,
+            'coalesced': coalesced,
+            'misses': self.misses,
+            'bypassed': self.bypassed,
+            'hit_ratio': round((self.hits + self.revalidated + coalesced) / total, 4) if total else 0.0,
+        }
+
+
+_WINDOW_MEMO = WindowMemo(max_entries=max(256, DEVICE_CACHE_SIZE * 8))
+
+
+def window_memo_stats() -> dict:
+    return _WINDOW_MEMO.stats()
+
+
+def load_window(hours: int = 24, reference_time: Optional[str or datetime] = None, direction: str = 'past',
+                device_key: Optional[str] = None, timings: Optional[Dict[str, float]] = None,
+                cache: bool = True) -> WindowResult:
+    """
+    direction='past' 取 reference_time 及之前的窗口, 'future' 取之后的窗口
+    device_key 为空时读取 DATA_FILE_PATH; timings / cache 见 WindowMemo
+    """
     ref_dt = _get_reference_time_from_config_or_arg(reference_time)
-    df_window = _select_window_by_time(df, ref_dt, hours=post_hours, direction='future')
+    return _WINDOW_MEMO.get(resolve_data_path(device_key), ref_dt, hours=hours, direction=direction, timings=timings,
+                            cache=cache)
 
-    compact = _compact_csv_from_df(df_window, TRUSTED_COLS)
-    summary = _summarize_window(df_window)
-    data_context = compact + ('\n' + summary if summary else '')
-    return data_context, summary, df_window
+
+def _read_fleet_rows(device_keys: List[str], rows: range, hours: int, ref_dt: Optional[datetime],
+                     windows: Dict[str, np.ndarray], errors: Dict[str, str]) -> None:
+    for i in rows:
+        key = device_keys[i]
+        try:
+            _, ds = _DATASET_CACHE.snapshot(resolve_data_path(key or None), fill=False)
+            lo, hi = _window_bounds(ds, ref_dt, hours=hours, direction='past')
+            if isinstance(ds, ColumnStore):
+                arrays = ds.read_arrays(lo, hi, list(windows))
+            else:
+                arrays = {v: pd.to_numeric(ds[v].iloc[lo:hi], errors='coerce').to_numpy(dtype=np.float64)
+                          for v in windows if v in ds.columns}
+            for v, x in arrays.items():
+                if len(x):
+                    windows[v][i, hours - len(x):] = x
+        except Exception as e:
+            errors[key] = str(e)
+
+
+def read_fleet_windows(device_keys: List[str], hours: int = 24, reference_time: Optional[str or datetime] = None,
+                       variables: Optional[List[str]] = None) -> Tuple[Dict[str, np.ndarray], Dict[str, str]]:
+    """
+    读取多个设备 reference_time 及之前 hours 小时的窗口, 右对齐堆叠为 {var: (设备数, hours)} (缺失为 NaN),
+    供规则引擎一次向量化评估; device_key 为空字符串表示 DATA_FILE_PATH
+    - 不经过 LRU: 已缓存的设备直接读取, 其余设备临时打开且不写入缓存; 列式存储只按偏移读取窗口行, 不做 CSV 编码与摘要
+    - 耗时主要在文件系统调用, 设备按行分片由 FLEET_READ_WORKERS 个线程并行读取 (各线程写入不同的行)
+    - 读取失败的设备整行为 NaN, 返回 (windows, {device_key: 错误描述})
+    """
+    variables = SUMMARY_COLS if variables is None else variables
+    hours = max(1, int(hours))
+    ref_dt = _get_reference_time_from_config_or_arg(reference_time)
+    n = len(device_keys)
+    windows = {v: np.full((n, hours), np.nan) for v in variables}
+    errors = {}
+    workers = max(1, min(FLEET_READ_WORKERS, n // 64))
+    if workers == 1:
+        _read_fleet_rows(device_keys, range(n), hours, ref_dt, windows, errors)
+        return windows, errors
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lambda k: _read_fleet_rows(device_keys, range(k, n, workers), hours, ref_dt, windows, errors),
+                      range(workers)))
+    return windows, errors
+
+
+def load_recent_window(pre_hours: int = 24, reference_time: Optional[str or datetime] = None,
+                       device_key: Optional[str] = None) -> Tuple[str, str, pd.DataFrame]:
+    return load_window(pre_hours, reference_time, direction='past', device_key=device_key).as_tuple()
+
+
+def load_forecast_window(post_hours: int = 24, reference_time: Optional[str or datetime] = None,
+                         device_key: Optional[str] = None) -> Tuple[str, str, pd.DataFrame]:
+    return load_window(post_hours, reference_time, direction='future', device_key=device_key).as_tuple()
 
 
-def load_both_windows(pre_hours: int = 24, post_hours: int = 24, reference_time: Optional[str or datetime] = None) -> dict:
-    pre = load_recent_window(pre_hours, reference_time)
-    post = load_forecast_window(post_hours, reference_time)
+def load_both_windows(pre_hours: int = 24, post_hours: int = 24, reference_time: Optional[str or datetime] = None,
+                      device_key: Optional[str] = None) -> dict:
+    pre = load_recent_window(pre_hours, reference_time, device_key)
+    post = load_forecast_window(post_hours, reference_time, device_key)
     return {'pre': pre, 'post': post}
 
 
@@ -0,0 +1,170 @@
+"""
+后台摘要 (digest)
+- DigestService 在 FastAPI lifespan 中作为后台任务运行, 每 DIGEST_POLL_SECONDS 检查一次各设备的数据版本 (只做 stat)
+- 数据版本变化 (新的小时记录落地) 的设备重新生成摘要: 最近窗口的统计、规则告警 (rules.py, config.ALERT_RULES),
+  以及可选 (DIGEST_PREWARM) 预热 DIGEST_QUESTIONS 的回复; 预热经 aget_ai_response 写入回复缓存,
+  之后不带 reference_time 的相同问题直接命中缓存
+- 最多 DIGEST_CONCURRENCY 个设备同时重建; 窗口读取不写入数据集缓存与窗口备忘 (app 传入 cache=False 的加载函数),
+  全设备刷新不会挤掉 /chat 正在使用的设备
+- 摘要只保存在内存中, 由 GET /digest 读取
+窗口与回复的构建由 app 传入 (与 /chat 使用同一套参数), 保证预热结果与 /chat 的缓存 key 一致
+"""
+
+import time
+import asyncio
+from dataclasses import dataclass, field, asdict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from .config import DIGEST_POLL_SECONDS, DIGEST_PREWARM, DIGEST_QUESTIONS, DIGEST_CONCURRENCY, LLM_REQUEST_TIMEOUT
+from .data_loader import dataset_version, list_device_keys
+
+DEFAULT_DEVICE = ""  # DATA_FILE_PATH 对应的默认数据源
+PREWARM_PRIORITY = 2  # 低于交互请求, 由调度器排在后面
+
+
+@dataclass
+class Digest:
+    device_key: str
+    data_version: Optional[tuple]
+    generated_at: float
+    as_of: Optional[str] = None  # 窗口中最新记录的时间
+    summary: str = ""
+    stats: Optional[dict] = None
+    alerts: List[dict] = field(default_factory=list)
+    answers: List[dict] = field(default_factory=list)  # [{"question", "response", "source"}], source 为 llm 或 local
+    error: Optional[str] = None
+    build_ms: float = 0.0
+
+    def to_dict(self) -> dict:
+        d = asdict(self)
+        d["generated_at"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.generated_at))
+        return d
+
+
+class DigestService:
+    """
+    load_context(payload) -> ChatContext (同步, 在线程中执行); answer(ctx, question, **kwargs) -> 回复文本
+    """
+
+    def __init__(self, load_context: Callable[[dict], object], answer: Callable[..., Awaitable[str]],
+                 questions: Optional[List[str]] = None, interval: float = DIGEST_POLL_SECONDS,
+                 prewarm: bool = DIGEST_PREWARM, concurrency: int = DIGEST_CONCURRENCY):
+        self.load_context = load_context
+        self.answer = answer
+        self.questions = list(DIGEST_QUESTIONS if questions is None else questions)
+        self.interval = interval
+        self.prewarm = prewarm
+        self.concurrency = max(1, concurrency)
+        self._digests: Dict[str, Digest] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.builds = 0
+        self.errors = 0
+        self.last_run: Optional[float] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                self.errors += 1
+                print(f"digest 刷新失败: {e}")
+            await asyncio.sleep(self.interval)
+
+    @staticmethod
+    def _scan() -> Dict[str, Optional[tuple]]:
+        # 默认数据源 + DATA_DIR 下的所有设备; 数据缺失的设备版本为 None
+        versions = {}
+        for key in [DEFAULT_DEVICE, *list_device_keys()]:
+            try:
+                versions[key] = dataset_version(key or None)
+            except (FileNotFoundError, ValueError):
+                versions[key] = None
+        return versions
+
+    async def refresh(self) -> int:
+        """
+        重建数据版本有变化的设备摘要, 返回重建的数量
+        """
+        versions = await asyncio.to_thread(self._scan)
+        stale = []
+        for key, version in versions.items():
+            if version is None:
+                self._digests.pop(key, None)
+                continue
+            current = self._digests.get(key)
+            if current is not None and current.data_version == version and current.error is None:
+                continue
+            stale.append((key, version))
+        for key in set(self._digests) - set(versions):
+            del self._digests[key]
+
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def rebuild(key: str, version: tuple) -> None:
+            async with slots:
+                self._digests[key] = await self.build(key, version)
+
+        results = await asyncio.gather(*(rebuild(k, v) for k, v in stale), return_exceptions=True)
+        built = 0
+        for (key, _), result in zip(stale, results):
+            if isinstance(result, BaseException):
+                self.errors += 1
+                print(f"digest 生成失败 ({key or 'default'}): {result}")
+            else:
+                built += 1
+        self.runs += 1
+        self.last_run = time.time()
+        return built
+
+    async def build(self, key: str, version: Optional[tuple]) -> Digest:
+        t0 = time.perf_counter()
+        ctx = await asyncio.to_thread(self.load_context, {"device_key": key or None})
+        digest = Digest(device_key=key, data_version=version, generated_at=time.time(),
+                        as_of=getattr(ctx, "as_of", None), summary=ctx.summary, error=ctx.error)
+        if ctx.error is None:
+            digest.stats = asdict(ctx.stats) if ctx.stats is not None else None
+            if digest.stats is not None:
+                digest.stats.pop("alerts", None)
+            digest.alerts = list(ctx.stats.alerts) if ctx.stats is not None else []
+            if self.prewarm and self.questions:
+                digest.answers = await asyncio.gather(*(self._prewarm(ctx, q) for q in self.questions))
+        digest.build_ms = round((time.perf_counter() - t0) * 1e3, 3)
+        self.builds += 1
+        return digest
+
+    async def _prewarm(self, ctx, question: str) -> dict:
+        timings = {}
+        text = await self.answer(ctx, question, timings=timings, priority=PREWARM_PRIORITY,
+                                 queue_timeout=LLM_REQUEST_TIMEOUT)
+        # 本地回复 (mock / 降级 / 上游失败) 都会记录 fallback 阶段
+        return {"question": question, "response": text, "source": "local" if "fallback" in timings else "llm"}
+
+    def get(self, device_key: Optional[str] = None) -> Optional[Digest]:
+        return self._digests.get(device_key or DEFAULT_DEVICE)
+
+    def all(self) -> List[Digest]:
+        return [self._digests[k] for k in sorted(self._digests)]
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "devices": len(self._digests),
+            "runs": self.runs,
+            "builds": self.builds,
+            "errors": self.errors,
+            "last_run": self.last_run,
+        }
@@ -1,8 +1,14 @@
 import requests
+import os
 import json
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from abc import ABC, abstractmethod
-from typing import Union, List, Dict, Any,Optional,Protocol
+from typing import Union, List, Dict, Any,Optional,Protocol,Iterable
+from requests.adapters import HTTPAdapter
 
 DateTime = datetime
 JsonType = Union[Dict[str, Any], List[Any]]
@@ -27,17 +33,217 @@ class BaseDownloader(Protocol):
     # 获取历史传感器数据
     def getHistoricalSensorData(self, device_key:str,begin_time:DateTime,end_time:DateTime) -> JsonType:...
     
+# 批量下载的默认并发参数
+BULK_MAX_WORKERS = 8        # 线程池大小
+BULK_MAX_PER_HOST = 4       # 同一服务器的最大并发请求数
+BULK_RETRIES = 3            # 网络错误/5xx 的重试次数
+BULK_BACKOFF = 0.5          # 指数退避基数(秒)
+
+# 登录凭证缓存：userId 连同过期时间保存在本地文件，进程重启后无需重新登录
+# 默认放在用户缓存目录（不在仓库内），避免凭证被误提交
+TOKEN_CACHE_FILE = os.getenv("DOWNLOADER_TOKEN_CACHE",
+                             os.path.join(os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+                                          "fg-llm", "downloader_token.json"))
+TOKEN_TTL_SECONDS = int(os.getenv("DOWNLOADER_TOKEN_TTL", str(12 * 3600)))
+# 服务器返回这些 code 表示 userId 失效，需要重新登录后重试；逗号分隔，设为空则不自动重新登录
+# 平台接口文档只约定了成功为 1000，默认的 1001 是 test/mock_iot_server.py 的约定，接入真实平台时按其返回值配置
+AUTH_FAIL_CODES = frozenset(int(c) for c in os.getenv("DOWNLOADER_AUTH_FAIL_CODES", "1001").split(",") if c.strip())
+
+class TokenCache:
+    """
+    {"ip:port|username": {"userId": ..., "expires_at": 时间戳}}，原子替换写入，权限 0600
+    """
+    def __init__(self, path:str = TOKEN_CACHE_FILE, ttl:int = TOKEN_TTL_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, data:dict) -> None:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), mode=0o700, exist_ok=True)
+            tmp = self.path + ".tmp"
+            # 创建时即为 0600，写入过程中其他用户也读不到
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.chmod(tmp, 0o600)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            printLog(f"写入登录凭证缓存失败: {e}")
+
+    def get(self, key:str) -> Optional[str]:
+        with self._lock:
+            entry = self._read().get(key)
+        if not entry or entry.get("expires_at", 0) <= time.time():
+            return None
+        return entry.get("userId")
+
+    def put(self, key:str, userid:str) -> None:
+        with self._lock:
+            data = self._read()
+            now = time.time()
+            data = {k: v for k, v in data.items() if v.get("expires_at", 0) > now}
+            data[key] = {"userId": userid, "expires_at": now + self.ttl}
+            self._write(data)
+
+    def drop(self, key:str) -> None:
+        with self._lock:
+            data = self._read()
+            if data.pop(key, None) is not None:
+                self._write(data)
+
+class EndpointStats:
+    """
+    每个接口的调用次数、失败次数与耗时统计
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def record(self, endpoint:str, seconds:float, ok:bool) -> None:
+        with self._lock:
+            s = self._stats.setdefault(endpoint, {"count": 0, "errors": 0, "total_s": 0.0, "max_s": 0.0})
+            s["count"] += 1
+            s["errors"] += 0 if ok else 1
+            s["total_s"] += seconds
+            s["max_s"] = max(s["max_s"], seconds)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            out = {}
+            for endpoint, s in self._stats.items():
+                out[endpoint] = {
+                    "count": int(s["count"]),
+                    "errors": int(s["errors"]),
+                    "avg_ms": round(s["total_s"] / s["count"] * 1000, 2) if s["count"] else 0.0,
+                    "max_ms": round(s["max_s"] * 1000, 2),
+                    "total_s": round(s["total_s"], 3),
+                }
+            return out
+
 class Downloader(BaseDownloader):
-    def __init__(self, server_ip:str = "192.168.1.100" , server_port:str = "9001"):
+    def __init__(self, server_ip:str = "192.168.1.100" , server_port:str = "9001", max_per_host:int = BULK_MAX_PER_HOST,
+                 token_cache:Optional[TokenCache] = None, auth_fail_codes:Optional[Iterable[int]] = None):
         self.server_ip = server_ip
         self.server_port = server_port     
         self.username = None     
         self.userid = None
+        self.max_per_host = max_per_host
+        self._password = None
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._auth_lock = threading.Lock()
+        self._host_slots = threading.BoundedSemaphore(max_per_host)
+        self._token_cache = token_cache if token_cache is not None else TokenCache()
+        self.auth_fail_codes = frozenset(AUTH_FAIL_CODES if auth_fail_codes is None else auth_fail_codes)
+        self._stats = EndpointStats()
+
+    # 共享的 keep-alive 会话，连接池大小与单服务器并发上限一致
+    def _getSession(self) -> requests.Session:
+        with self._session_lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, self.max_per_host))
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._session = session
+            return self._session
+
+    def close(self) -> None:
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def _baseUrl(self) -> str:
+        return f"http://{self.server_ip}:{self.server_port}"
+
+    def _tokenKey(self) -> str:
+        return f"{self.server_ip}:{self.server_port}|{self.username}"
+
+    # 向服务器登录并写入凭证缓存；网络错误/5xx/429 与 _fetchHistory 一样指数退避重试，账号错误不重试
+    def _authenticate(self, retries:int = BULK_RETRIES, backoff:float = BULK_BACKOFF) -> Optional[str]:
+        attempt = 0
+        while True:
+            t0 = time.perf_counter()
+            userid = None
+            try:
+                userid = requestUserId(self.server_ip, self.server_port, self.username, self._password,
+                                       session=self._getSession())
+                break
+            except (requests.exceptions.RequestException, ValueError) as e:
+                if attempt >= retries:
+                    printLog(f"登录时 网络请求错误: {e}")
+                    break
+                delay = backoff * (2 ** attempt) * (0.5 + random.random())
+                printLog(f"登录失败({e})，{delay:.2f}s 后第 {attempt + 1} 次重试")
+                time.sleep(delay)
+                attempt += 1
+            except KeyError as e:
+                printLog(f"登录时 响应数据格式错误，缺少字段: {e}")
+                break
+            finally:
+                self._stats.record("/app/Login", time.perf_counter() - t0, bool(userid))
+        if userid:
+            self._token_cache.put(self._tokenKey(), userid)
+        return userid
 
-    def logIn(self,username:str,password:str) -> None:
+    # userId 失效时重新登录；多个线程同时失效只登录一次
+    def _reauthenticate(self, stale_userid:Optional[str]) -> bool:
+        with self._auth_lock:
+            if self.userid and self.userid != stale_userid:
+                return True
+            self._token_cache.drop(self._tokenKey())
+            if not self._password:
+                self.userid = None
+                return False
+            printLog("登录凭证失效，正在重新登录")
+            self.userid = self._authenticate()
+            return bool(self.userid)
+
+    # 共享会话上的 GET 请求，返回解析后的 JSON；记录接口耗时，userId 失效时自动重新登录后重试一次
+    def _get(self, endpoint:str, params:Optional[dict] = None, timeout:float = 10) -> dict:
+        session = self._getSession()
+        url = self._baseUrl() + endpoint
+        for attempt in range(2):
+            userid = self.userid
+            ok = False
+            t0 = time.perf_counter()
+            try:
+                response = session.get(url, headers={"userId": userid}, params=params, timeout=timeout)
+                if response.status_code >= 500 or response.status_code == 429:
+                    raise requests.exceptions.HTTPError(f"HTTP {response.status_code}", response=response)
+                result = response.json()
+                ok = result.get('code') == 1000
+            finally:
+                self._stats.record(endpoint, time.perf_counter() - t0, ok)
+            if result.get('code') in self.auth_fail_codes and attempt == 0 and self._reauthenticate(userid):
+                continue
+            return result
+        return result
+
+    # 各接口的调用次数与耗时 {endpoint: {count, errors, avg_ms, max_ms, total_s}}
+    def latencyStats(self) -> Dict[str, Dict[str, float]]:
+        return self._stats.snapshot()
+
+    def logIn(self,username:str,password:str,use_cache:bool = True) -> None:
         printLog(f"正在登录服务器")
         self.username = username
-        self.userid =  getUserId(self.server_ip,self.server_port,self.username,password)
+        self._password = password
+        cached = self._token_cache.get(self._tokenKey()) if use_cache else None
+        if cached:
+            self.userid = cached
+            printLog(f"登录成功（使用缓存的登录凭证）")
+            return
+        self.userid = self._authenticate()
         if (self.userid):
             printLog(f"登录成功")
         else:    
@@ -50,15 +256,8 @@ class Downloader(BaseDownloader):
             return []
 
         printLog(f"正在获取用户设备分组列表下设备")
-        base_url = f"http://{self.server_ip}:{self.server_port}"
-        headers = {"userId": self.userid}
         try:
-            response = requests.get(
-                f"{base_url}/app/GetUserDeviceGroups",
-                headers=headers,
-                timeout=10
-            )
-            result = response.json()
+            result = self._get("/app/GetUserDeviceGroups", timeout=10)
             
             if result.get('code') == 1000:
                 groups = result.get('data', [])
@@ -84,16 +283,7 @@ class Downloader(BaseDownloader):
         try:
             printLog(f"正在获取 {group_id} 分组下设备")
             params = {"groupId": group_id}
-            base_url = f"http://{self.server_ip}:{self.server_port}"
-            headers = {"userId": self.userid}
-            
-            response = requests.get(
-                f"{base_url}/app/GetDeviceData",
-                headers=headers,
-                params=params,
-                timeout=10
-            )
-            result = response.json()
+            result = self._get("/app/GetDeviceData", params=params, timeout=10)
             
             if result.get('code') == 1000:
                 devices = result.get('data', [])
@@ -116,16 +306,7 @@ class Downloader(BaseDownloader):
         try:
             printLog(f"正在获取设备软件参数")
             params = {"deviceKey": device_key}
-            base_url = f"http://{self.server_ip}:{self.server_port}"
-            headers = {"userId": self.userid}
-
-            response = requests.get(
-                f"{base_url}/app/GetDeviceSoftParam",
-                headers=headers,
-                params=params,
-                timeout=10
-            )
-            result = response.json()
+            result = self._get("/app/GetDeviceSoftParam", params=params, timeout=10)
             
             if result.get('code') == 1000:
                 printLog("获取设备参数成功")
@@ -154,16 +335,7 @@ class Downloader(BaseDownloader):
                 "endTime": end_time.strftime("%Y-%m-%d %H:%M:%S"),# (YYYY-MM-dd HH:mm:ss)
                 "isAlarmData": -1  # -1全部，0正常数据，1报警数据
             }
-            base_url = f"http://{self.server_ip}:{self.server_port}"
-            headers = {"userId": self.userid}
-
-            response = requests.get(
-                f"{base_url}/app/QueryHistoryList",
-                headers=headers,
-                params=params,
-                timeout=30  # 历史数据查询可能较慢
-            )
-            result = response.json()
+            result = self._get("/app/QueryHistoryList", params=params, timeout=30)  # 历史数据查询可能较慢
             
             if result.get('code') == 1000:
                 history_data = result.get('data', [])
@@ -177,40 +349,98 @@ class Downloader(BaseDownloader):
             printLog(f"获取历史数据异常: {e}")
             return []
 
+    # 单设备单时间段的历史数据请求，网络错误/5xx 时指数退避重试，失败抛出异常
+    def _fetchHistory(self, device_key:str, begin_time:DateTime, end_time:DateTime, node_id:int = -1,
+                      retries:int = BULK_RETRIES, backoff:float = BULK_BACKOFF) -> JsonType:
+        params = {
+            "deviceKey": device_key,
+            "nodeId": node_id,
+            "beginTime": begin_time.strftime("%Y-%m-%d %H:%M:%S"),
+            "endTime": end_time.strftime("%Y-%m-%d %H:%M:%S"),
+            "isAlarmData": -1
+        }
+        attempt = 0
+        while True:
+            try:
+                with self._host_slots:
+                    result = self._get("/app/QueryHistoryList", params=params, timeout=30)
+                if result.get('code') != 1000:
+                    # 业务错误不重试
+                    raise RuntimeError(result.get('message') or f"code {result.get('code')}")
+                return result.get('data', [])
+            except (requests.exceptions.RequestException, ValueError) as e:
+                if attempt >= retries:
+                    raise
+                delay = backoff * (2 ** attempt) * (0.5 + random.random())
+                printLog(f"获取 {device_key} 历史数据失败({e})，{delay:.2f}s 后第 {attempt + 1} 次重试")
+                time.sleep(delay)
+                attempt += 1
+
+    # 批量获取多个设备同一时间段的历史数据，返回 {device_key: 记录列表}，失败的设备为 []
+    def downloadMany(self, device_keys:List[str], begin_time:DateTime, end_time:DateTime, node_id:int = -1,
+                     max_workers:int = BULK_MAX_WORKERS, retries:int = BULK_RETRIES, backoff:float = BULK_BACKOFF) -> Dict[str, JsonType]:
+        if (self.isLogIn() == False):
+            printLog("批量获取历史数据时，尚未登录")
+            return {k: [] for k in device_keys}
+
+        printLog(f"正在批量获取 {len(device_keys)} 个设备的历史数据")
+        results: Dict[str, JsonType] = {}
+
+        def task(device_key):
+            try:
+                return device_key, self._fetchHistory(device_key, begin_time, end_time, node_id, retries, backoff)
+            except Exception as e:
+                printLog(f"获取 {device_key} 历史数据异常: {e}")
+                return device_key, []
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            for device_key, data in pool.map(task, device_keys):
+                results[device_key] = data
+
+        total = sum(len(v) for v in results.values())
+        failed = sum(1 for v in results.values() if not v)
+        printLog(f"批量获取完成，共 {total} 条记录，{failed} 个设备无数据或失败")
+        return results
+
     def isLogIn(self) -> bool:
         b = bool(self.username and self.userid)
         return b
 
-def getUserId(ip:str,port:str,username:str,password:str) -> Optional[str]:
+# 登录请求；账号错误等业务失败返回 None，网络错误/5xx/429 抛出异常（由调用方决定是否重试）
+def requestUserId(ip:str,port:str,username:str,password:str,session:Optional[requests.Session] = None) -> Optional[str]:
     login_url = f"http://{ip}:{port}/app/Login"
     login_data = {
         "loginName": username,
         "password": password
     }
-    
+
+    # 发送POST请求
+    response = (session or requests).post(
+        login_url,
+        json=login_data,
+        headers={'Content-Type': 'application/json'},
+        timeout=10
+    )
+    if response.status_code >= 500 or response.status_code == 429:
+        raise requests.exceptions.HTTPError(f"HTTP {response.status_code}", response=response)
+
+    # 解析响应
+    result = response.json()
+
+    # 检查登录是否成功
+    if result.get('code') == 1000:
+        userid = result['data']['userId']
+        user_name = result['data']['userName']
+        printLog(f"登陆成功，用户名 {user_name}，uid {userid}，权限列表: {result['data'].get('authList', [])}")
+        return userid
+    else:
+        error_msg = result.get('message', '未知错误')
+        printLog(f"登录失败: {error_msg}")
+        return None
+
+def getUserId(ip:str,port:str,username:str,password:str,session:Optional[requests.Session] = None) -> Optional[str]:
     try:
-        # 发送POST请求
-        response = requests.post(
-            login_url,
-            json=login_data,
-            headers={'Content-Type': 'application/json'},
-            timeout=10
-        )
-        
-        # 解析响应
-        result = response.json()
-        
-        # 检查登录是否成功
-        if result.get('code') == 1000:
-            userid = result['data']['userId']
-            user_name = result['data']['userName']
-            printLog(f"登陆成功，用户名 {user_name}，uid {userid}，权限列表: {result['data'].get('authList', [])}")
-            return userid
-        else:
-            error_msg = result.get('message', '未知错误')
-            printLog(f"登录失败: {error_msg}")
-            return None
-            
+        return requestUserId(ip, port, username, password, session=session)
     except requests.exceptions.RequestException as e:
         printLog(f"登录时 网络请求错误: {e}")
         return None
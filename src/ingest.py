@@ -0,0 +1,255 @@
+"""
+平台历史数据接入：把 QueryHistoryList 原始记录归一化为 data_loader 使用的小时级数据
+- 按 INGEST_FIELD_MAP 把 (nodeId, 寄存器字段) 映射到 temp/humidity/rain/solar/soil_water (无默认值, 必须按现场接线配置)
+- 同一节点同一时刻的报警/正常重复记录只保留一条 (优先正常记录)
+- 每个节点先按小时聚合 (INGEST_SUM_COLS 求和, 其余取均值), 再对映射到同一列的多个节点取均值
+- 只输出已完整的小时, 未完整的小时留在缓冲区等待后续记录; 输入按 INGEST_CHUNK_RECORDS 分批处理,
+  逐批追加到 {DATA_DIR}/{deviceKey}.cols
+输入记录需按时间升序 (QueryHistoryList 与增量同步均满足)
+用法(项目根目录)：INGEST_FIELD_MAP='{"1.tem": "temp", ...}' python -m src.ingest raw_history.json --device DEV001
+"""
+
+import os
+import json
+import argparse
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from .config import DATA_DIR, INGEST_FIELD_MAP, INGEST_SUM_COLS, INGEST_CHUNK_RECORDS
+from .column_store import ColumnStore, is_column_store, TIMESTAMP_COL
+
+
+LOADER_COLS = ['temp', 'humidity', 'rain', 'solar', 'soil_water']
+TIME_FMT = "%Y-%m-%d %H:%M:%S"
+_LONG_COLS = [TIMESTAMP_COL, 'node', 'col', 'value', 'alarm']
+
+
+def parse_field_map(field_map: Dict[str, str]) -> Dict[int, Dict[str, str]]:
+    """
+    {"1.tem": "temp", "1.hum": "humidity"} -> {1: {"tem": "temp", "hum": "humidity"}}
+    映射为空或目标列不是 loader 字段时抛出 ValueError, 不猜测寄存器含义
+    """
+    if not field_map:
+        raise ValueError('未配置 INGEST_FIELD_MAP: 请按现场设备接线设置 "nodeId.寄存器字段" -> 列名 的 JSON 映射')
+    unknown = sorted({col for col in field_map.values() if col not in LOADER_COLS})
+    if unknown:
+        raise ValueError(f"INGEST_FIELD_MAP 的目标列 {unknown} 不是 loader 字段, 可选 {LOADER_COLS}")
+    out: Dict[int, Dict[str, str]] = {}
+    for key, col in field_map.items():
+        node, field = str(key).split('.', 1)
+        out.setdefault(int(node), {})[field] = col
+    return out
+
+
+def _empty_long() -> pd.DataFrame:
+    return pd.DataFrame({
+        TIMESTAMP_COL: pd.Series(dtype='datetime64[ns]'),
+        'node': pd.Series(dtype='int64'),
+        'col': pd.Series(dtype='object'),
+        'value': pd.Series(dtype='float64'),
+        'alarm': pd.Series(dtype='int64'),
+    })
+
+
+def _empty_hourly() -> pd.DataFrame:
+    return pd.DataFrame(columns=[TIMESTAMP_COL] + LOADER_COLS)
+
+
+def _record_times(raw: pd.DataFrame) -> pd.Series:
+    # 优先 recordTimeStr (平台本地时间), 缺失时用 recordTime 毫秒时间戳换算为本地时间
+    if 'recordTimeStr' in raw.columns:
+        ts = pd.to_datetime(raw['recordTimeStr'], format=TIME_FMT, errors='coerce')
+    else:
+        ts = pd.Series(pd.NaT, index=raw.index, dtype='datetime64[ns]')
+    if 'recordTime' in raw.columns:
+        missing = ts.isna() & raw['recordTime'].notna()
+        if missing.any():
+            ts[missing] = [datetime.fromtimestamp(int(ms) / 1000) for ms in raw.loc[missing, 'recordTime']]
+    return ts
+
+
+def records_to_long(records: List[dict], node_fields: Dict[int, Dict[str, str]]) -> pd.DataFrame:
+    """
+    原始记录 -> 长表 (timestamp, node, col, value, alarm), 未映射的节点/字段被忽略
+    """
+    if not records:
+        return _empty_long()
+    raw = pd.DataFrame.from_records(records)
+    if 'nodeId' not in raw.columns:
+        return _empty_long()
+    ts = _record_times(raw)
+    node = pd.to_numeric(raw['nodeId'], errors='coerce')
+    if 'isAlarmData' in raw.columns:
+        alarm = pd.to_numeric(raw['isAlarmData'], errors='coerce').fillna(0).astype('int64')
+    else:
+        alarm = pd.Series(0, index=raw.index, dtype='int64')
+
+    parts = []
+    for n, fields in node_fields.items():
+        mask = (node == n) & ts.notna()
+        if not mask.any():
+            continue
+        for field, col in fields.items():
+            if field not in raw.columns:
+                continue
+            parts.append(pd.DataFrame({
+                TIMESTAMP_COL: ts[mask].to_numpy(),
+                'node': n,
+                'col': col,
+                'value': pd.to_numeric(raw.loc[mask, field], errors='coerce').to_numpy(dtype='float64'),
+                'alarm': alarm[mask].to_numpy(),
+            }))
+    if not parts:
+        return _empty_long()
+    long = pd.concat(parts, ignore_index=True)
+    return long[long['value'].notna()]
+
+
+def aggregate_hourly(long: pd.DataFrame, sum_cols: List[str]) -> pd.DataFrame:
+    """
+    长表 -> 小时宽表 (timestamp 为整点, 表示 [整点, 整点+1h) 区间)
+    """
+    if long.empty:
+        return _empty_hourly()
+    # 报警记录与正常记录重复上报同一时刻时保留正常记录
+    long = long.sort_values('alarm', kind='stable').drop_duplicates([TIMESTAMP_COL, 'node', 'col'], keep='first')
+    g = long.assign(hour=long[TIMESTAMP_COL].dt.floor('h')).groupby(['hour', 'col', 'node'])['value']
+    per_node = g.mean()
+    is_sum = per_node.index.get_level_values('col').isin(sum_cols)
+    per_node = per_node.where(~is_sum, g.sum())
+
+    wide = per_node.groupby(level=['hour', 'col']).mean().unstack('col').reindex(columns=LOADER_COLS)
+    wide.index.name = TIMESTAMP_COL
+    wide.columns.name = None
+    return wide.reset_index()
+
+
+class HourlyAggregator:
+    """
+    有状态的小时聚合器, 跨批次保留未完整小时的记录
+    """
+
+    def __init__(self, field_map: Optional[Dict[str, str]] = None, sum_cols: Optional[List[str]] = None):
+        self.node_fields = parse_field_map(field_map or INGEST_FIELD_MAP)
+        self.sum_cols = list(INGEST_SUM_COLS if sum_cols is None else sum_cols)
+        self._pending = _empty_long()
+
+    def pending_since(self) -> Optional[datetime]:
+        if self._pending.empty:
+            return None
+        return self._pending[TIMESTAMP_COL].min().to_pydatetime()
+
+    def feed(self, records: List[dict], through: Optional[datetime] = None) -> pd.DataFrame:
+        """
+        加入一批记录, 返回已完整的小时
+        through 为已查询区间的结束时间 (含): 结束于 through 之前的小时视为完整;
+        未给出时以本批最新记录所在小时为界 (该小时可能还有后续记录)
+        """
+        long = records_to_long(records, self.node_fields)
+        if not self._pending.empty:
+            long = pd.concat([self._pending, long], ignore_index=True) if not long.empty else self._pending
+        if long.empty:
+            return _empty_hourly()
+        if through is None:
+            cutoff = long[TIMESTAMP_COL].max().floor('h')
+        else:
+            cutoff = (pd.Timestamp(through) + pd.Timedelta(seconds=1)).floor('h')
+        done = long[TIMESTAMP_COL] < cutoff
+        self._pending = long[~done]
+        return aggregate_hourly(long[done], self.sum_cols)
+
+    def flush(self) -> pd.DataFrame:
+        """
+        输出缓冲区中剩余的 (可能不完整的) 小时
+        """
+        long, self._pending = self._pending, _empty_long()
+        return aggregate_hourly(long, self.sum_cols)
+
+
+class IngestSink:
+    """
+    IncrementalSync 的默认 sink：原始记录 -> 小时数据 -> {data_dir}/{device_key}.cols
+    每台设备一个 HourlyAggregator, 未完整的小时暂存在内存中 (pending_since 供同步引擎回退高水位)
+    """
+
+    def __init__(self, data_dir: str = DATA_DIR, field_map: Optional[Dict[str, str]] = None,
+                 sum_cols: Optional[List[str]] = None, chunk_records: int = INGEST_CHUNK_RECORDS):
+        self.data_dir = data_dir
+        self.field_map = field_map or INGEST_FIELD_MAP
+        parse_field_map(self.field_map)  # 构造时校验, 避免同步进行到一半才失败
+        self.sum_cols = sum_cols
+        self.chunk_records = max(1, chunk_records)
+        self._aggregators: Dict[str, HourlyAggregator] = {}
+
+    def store_path(self, device_key: str) -> str:
+        return os.path.join(self.data_dir, f"{device_key}.cols")
+
+    def _aggregator(self, device_key: str) -> HourlyAggregator:
+        agg = self._aggregators.get(device_key)
+        if agg is None:
+            agg = self._aggregators[device_key] = HourlyAggregator(self.field_map, self.sum_cols)
+        return agg
+
+    def _write(self, device_key: str, hourly: pd.DataFrame) -> int:
+        if hourly.empty:
+            return 0
+        path = self.store_path(device_key)
+        if not is_column_store(path):
+            os.makedirs(self.data_dir, exist_ok=True)
+            ColumnStore.create(path, hourly.iloc[:0], LOADER_COLS)
+        return ColumnStore(path).append(hourly)
+
+    def append(self, device_key: str, records: List[dict], through: Optional[datetime] = None) -> int:
+        agg = self._aggregator(device_key)
+        added = 0
+        n = len(records)
+        for i in range(0, max(n, 1), self.chunk_records):
+            last = i + self.chunk_records >= n
+            added += self._write(device_key, agg.feed(records[i:i + self.chunk_records], through if last else None))
+        return added
+
+    def pending_since(self, device_key: str) -> Optional[datetime]:
+        agg = self._aggregators.get(device_key)
+        return agg.pending_since() if agg else None
+
+    def flush(self, device_key: str) -> int:
+        agg = self._aggregators.get(device_key)
+        return self._write(device_key, agg.flush()) if agg else 0
+
+
+def ingest_batches(device_key: str, batches: Iterable[List[dict]], sink: Optional[IngestSink] = None,
+                   final: bool = True) -> int:
+    """
+    逐批接入同一设备按时间升序的记录, final=True 时最后把剩余小时也写入
+    """
+    sink = sink or IngestSink()
+    added = sum(sink.append(device_key, batch) for batch in batches)
+    if final:
+        added += sink.flush(device_key)
+    return added
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="把 QueryHistoryList 原始记录接入为小时级列式存储")
+    parser.add_argument("json_path", type=str, help="原始记录 JSON (list 或 {\"data\": [...]})")
+    parser.add_argument("--device", type=str, required=True, help="deviceKey, 写入 {DATA_DIR}/{deviceKey}.cols")
+    parser.add_argument("--data-dir", type=str, default=DATA_DIR)
+    parser.add_argument("--chunk-records", type=int, default=INGEST_CHUNK_RECORDS)
+    args = parser.parse_args(argv)
+
+    with open(args.json_path, 'r', encoding='utf-8') as f:
+        raw = json.load(f)
+    records = raw['data'] if isinstance(raw, dict) and isinstance(raw.get('data'), list) else raw
+    if not isinstance(records, list):
+        raise TypeError('JSON 顶层应为 list 或 dict 且包含 `data` 字段')
+    records.sort(key=lambda r: (r.get('recordTimeStr') or '', r.get('recordTime') or 0))
+
+    sink = IngestSink(args.data_dir, chunk_records=args.chunk_records)
+    added = ingest_batches(args.device, [records], sink)
+    print(f"已接入 {len(records)} 条原始记录, 追加 {added} 个小时 -> {sink.store_path(args.device)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,21 +3,48 @@ LLM 服务模块
 职责: 
  - 把 system prompt (含数据) 与用户消息组合成 messages
  - 调用 DeepSeek/OpenAI-compatible chat/completions endpoint
- - 若未配置 API_KEY, 使用内置启发式 mock 策略快速返回 (便于离线测试) 
+ - 异步接口 aget_ai_response 基于连接池化的 httpx.AsyncClient, 不阻塞事件循环
+ - 流式接口 astream_ai_response 转发上游 stream=true 的增量内容 (mock 同样分段输出)
+ - ResponseCache: 相同 (归一化问题, 数据上下文, 模型参数) 的回复按 TTL/LRU 缓存, 数据版本变化时整体失效
+ - 若未配置 API_KEY, 使用内置启发式 mock 策略快速返回 (便于离线测试), 优先读取 data_loader 给出的 WindowSummary
+ - LLMScheduler: 限制同时进行的上游调用数, 超出时按优先级 (紧急问题优先) 排队; 排队超过预算或队列已满时
+   立即回退到本地建议; 上游 429 时减半并发并暂停放行
+ - 请求合并: 并发的相同请求 (同一缓存 key) 共享一次进行中的上游调用, 只合并进行中的调用, 不引入过期结果
+ - 异步接口传入 timings 时记录 prompt_format / llm_call / fallback 阶段耗时; 回复来源、上游错误与 token 用量写入 metrics
 注意: 生产请务必配置真实 API_KEY, 并使用安全存储方式。
 """
 
 import os
 import re
 import json
+import time
+import heapq
+import asyncio
+import hashlib
+import itertools
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+import httpx
 import requests
-from typing import Tuple, Optional
-from .config import DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL, DEEPSEEK_MODEL, SYSTEM_PROMPT_TEMPLATE, MOCK_THRESHOLDS
+from typing import AsyncIterator, Tuple, Optional
+from .config import (
+    DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL, DEEPSEEK_MODEL, SYSTEM_PROMPT_TEMPLATE, MOCK_THRESHOLDS,
+    LLM_MAX_CONNECTIONS, LLM_MAX_KEEPALIVE, LLM_REQUEST_TIMEOUT,
+    LLM_MAX_IN_FLIGHT, LLM_QUEUE_MAX, LLM_QUEUE_TIMEOUT, LLM_RATE_LIMIT_COOLDOWN,
+    LLM_CACHE_TTL_SECONDS, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_MAX_BYTES, ALERT_RULES,
+)
+from .data_loader import WindowSummary
+from .rules import RuleEngine
+from .singleflight import SingleFlight, AsyncSingleFlight
+from .metrics import LLM_RESPONSES, UPSTREAM_ERRORS, LLM_QUEUE_WAIT, LLM_QUEUE_REJECTED, record_usage, timed, add_timing, upstream_error_kind
 
 
-REQUEST_TIMEOUT = 20
+REQUEST_TIMEOUT = LLM_REQUEST_TIMEOUT
+_ALERT_ENGINE = RuleEngine(ALERT_RULES)
 
 def _extract_numbers_from_summary(summary_str: str) -> dict:
+    # 仅用于没有 WindowSummary 的旧调用方式 (例如只拿到 summary 字符串)
     res = {}
     if not summary_str:
         return res
@@ -40,82 +67,667 @@ def _extract_numbers_from_summary(summary_str: str) -> dict:
             res['last_vwc'] = float(m.group(1))
         except:
             pass
+    m = re.search(r"Hours\s*>=\s*([0-9.+-]+)\s*C[:\s]*([0-9]+)", summary_str, flags=re.IGNORECASE)
+    if m:
+        try:
+            res['hot_hours'] = (float(m.group(1)), int(m.group(2)))
+        except:
+            pass
 
     return res
 
 
-def get_ai_response(user_message: str, data_context: str, summary_str: str, system_prompt_template: Optional[str] = None) -> str:
-    """
-    将 user_message 与 data_context 组合到 prompt
-    调用远端 LLM
-    如果没有 DEEPSEEK_API_KEY, 就使用本地 _mock_response
-    """
+def _build_messages(user_message: str, data_context: str, system_prompt_template: Optional[str] = None) -> list:
     template = system_prompt_template if system_prompt_template is not None else SYSTEM_PROMPT_TEMPLATE
     system_prompt = template.format(data_context=data_context)
-
-    
-    if not DEEPSEEK_API_KEY:
-        return _mock_response(user_message, summary_str)
-
-    
-    messages = [
+    return [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": user_message}
     ]
 
+
+def _build_payload(messages: list, model: str = DEEPSEEK_MODEL, stream: bool = False) -> dict:
     payload = {
-        "model": DEEPSEEK_MODEL,
+        "model": model,
         "messages": messages,
         "temperature": 0.3,
         "max_tokens": 500
     }
+    if stream:
+        payload["stream"] = True
+    return payload
+
+
+def _extract_content(j: dict) -> str:
+    if 'choices' in j and len(j['choices']) > 0:
+        c = j['choices'][0]
+        if isinstance(c, dict):
+            # 兼容 OpenAI/DeepSeek 的返回格式
+            if 'message' in c and isinstance(c['message'], dict) and 'content' in c['message']:
+                return c['message']['content']
+            
+            if 'text' in c:
+                return c['text']
+    
+    return json.dumps(j, ensure_ascii=False, indent=2)
+
+
+def _fallback_response(error: Exception, user_message: str, summary_str: str, summary: Optional[WindowSummary] = None) -> str:
+    # 远端异常时回退到本地启发式
+    return f"LLM API 调用失败: {error}\n\n (已使用本地启发式建议代替) \n\n" + _mock_response(user_message, summary_str, summary)
+
+
+def get_ai_response(user_message: str, data_context: str, summary_str: str, system_prompt_template: Optional[str] = None,
+                    summary: Optional[WindowSummary] = None) -> str:
+    """
+    将 user_message 与 data_context 组合到 prompt
+    调用远端 LLM (同步, 供脚本使用; 服务端请用 aget_ai_response)
+    如果没有 DEEPSEEK_API_KEY, 就使用本地 _mock_response
+    """
+    if not DEEPSEEK_API_KEY:
+        return _mock_response(user_message, summary_str, summary)
+
+    messages = _build_messages(user_message, data_context, system_prompt_template)
+    payload = _build_payload(messages)
     headers = {
         "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
         "Content-Type": "application/json"
     }
 
     url = DEEPSEEK_BASE_URL.rstrip("/") + "/chat/completions"
-    try:
+
+    def call():
         resp = requests.post(url, headers=headers, data=json.dumps(payload), timeout=REQUEST_TIMEOUT)
         resp.raise_for_status()
-        j = resp.json()
-        
-        if 'choices' in j and len(j['choices']) > 0:
-            c = j['choices'][0]
-            if isinstance(c, dict):
-                # 兼容 OpenAI/DeepSeek 的返回格式
-                if 'message' in c and isinstance(c['message'], dict) and 'content' in c['message']:
-                    return c['message']['content']
-                
-                if 'text' in c:
-                    return c['text']
-        
-        return json.dumps(j, ensure_ascii=False, indent=2)
+        return _extract_content(resp.json())
+
+    try:
+        # 多线程并发调用相同请求时只请求一次上游
+        return _SYNC_FLIGHT.do(make_cache_key(user_message, messages, DEEPSEEK_MODEL), call)[0]
     except Exception as e:
-        # 远端异常时回退到本地启发式
-        return f"LLM API 调用失败: {e}\n\n (已使用本地启发式建议代替) \n\n" + _mock_response(user_message, summary_str)
+        return _fallback_response(e, user_message, summary_str, summary)
 
 
-def _mock_response(user_message: str, summary_str: str) -> str:
-    nums = _extract_numbers_from_summary(summary_str)
-    mean_temp = nums.get('mean_temp')
-    total_rain = nums.get('total_rain')
-    last_vwc = nums.get('last_vwc')
+_PUNCT_RE = re.compile(r"[\s，,。.！!？?、~～]+")
 
-    tips = []
-    
-    if last_vwc is not None:
-        if last_vwc >= MOCK_THRESHOLDS['soil_water_high']:
-            tips.append("土壤已经很湿了, 不要浇水, 必要时检查田间排水, 避免烂根。")
-        elif last_vwc <= MOCK_THRESHOLDS['soil_water_low']:
-            tips.append("土壤偏干, 建议尽快补水 (小水多次或早晚灌溉) , 注意避免正午直接灌水导致蒸发过快。")
+
+def _normalize_message(user_message: str) -> str:
+    # 忽略大小写、空白与标点差异："要不要浇水？" 与 "要不要浇水" 视为同一问题
+    return _PUNCT_RE.sub("", user_message.lower())
+
+
+def make_cache_key(user_message: str, messages: list, model: str) -> str:
+    payload = _build_payload(messages, model)
+    payload["messages"] = [m["content"] for m in messages[:-1]]
+    raw = json.dumps([_normalize_message(user_message), payload], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    LLM 回复缓存
+    - key 为 make_cache_key 生成的哈希 (归一化问题 + system prompt(含数据) + 模型参数)
+    - 条目超过 ttl 秒过期; 条目数或总字节数超限时按 LRU 淘汰
+    - observe_data_version 发现某个数据源 (scope, 如设备) 的版本变化 (新的小时记录落地) 时清空该数据源的条目
+    """
+
+    def __init__(self, ttl: float = LLM_CACHE_TTL_SECONDS, max_entries: int = LLM_CACHE_MAX_ENTRIES,
+                 max_bytes: int = LLM_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (expires_at, text, nbytes, scope)
+        self._bytes = 0
+        self._data_versions = {}  # scope -> version
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0 and self.max_bytes > 0
+
+    def _drop(self, key: str) -> None:
+        nbytes = self._entries.pop(key)[2]
+        self._bytes -= nbytes
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] < time.monotonic():
+                self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, text: str, scope: Optional[str] = None) -> None:
+        nbytes = len(text.encode("utf-8"))
+        if not self.enabled or nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, text, nbytes, scope)
+            self._bytes += nbytes
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def observe_data_version(self, version, scope: Optional[str] = None) -> None:
+        with self._lock:
+            previous = self._data_versions.get(scope)
+            if version == previous:
+                return
+            if previous is not None:
+                for key in [k for k, e in self._entries.items() if e[3] == scope]:
+                    self._drop(key)
+                self.invalidations += 1
+            self._data_versions[scope] = version
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+_RESPONSE_CACHE = ResponseCache()
+_SYNC_FLIGHT = SingleFlight()
+_LLM_FLIGHT = AsyncSingleFlight()
+
+
+def response_cache_stats() -> dict:
+    # 附带上游调用的请求合并统计: coalesced 为共享进行中调用的请求数, in_flight 为当前进行中的调用数
+    return {**_RESPONSE_CACHE.stats(), "coalesced": _LLM_FLIGHT.coalesced, "in_flight": _LLM_FLIGHT.in_flight()}
+
+
+class AsyncLLMClient:
+    """
+    DeepSeek/OpenAI-compatible 异步客户端
+    - 内部持有一个 httpx.AsyncClient, keep-alive 复用连接
+    - max_connections / max_keepalive 控制连接池大小
+    - base_url / api_key 可指向本地 stub 服务 (见 test/stub_llm.py)
+    """
+
+    def __init__(self, base_url: str = DEEPSEEK_BASE_URL, api_key: str = DEEPSEEK_API_KEY, model: str = DEEPSEEK_MODEL,
+                 max_connections: int = LLM_MAX_CONNECTIONS, max_keepalive: int = LLM_MAX_KEEPALIVE,
+                 timeout: float = REQUEST_TIMEOUT, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.model = model
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+        self.timeout = timeout
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.api_key)
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"},
+                limits=self.limits,
+                timeout=self.timeout,
+                transport=self._transport,
+            )
+        return self._client
+
+    async def chat(self, messages: list) -> dict:
+        resp = await self._get_client().post("/chat/completions", json=_build_payload(messages, self.model))
+        resp.raise_for_status()
+        return resp.json()
+
+    async def stream_chat(self, messages: list) -> AsyncIterator[str]:
+        """
+        以 stream=true 调用 chat/completions, 逐个产出 delta.content
+        """
+        payload = _build_payload(messages, self.model, stream=True)
+        async with self._get_client().stream("POST", "/chat/completions", json=payload) as resp:
+            resp.raise_for_status()
+            async for line in resp.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    chunk = json.loads(data)
+                except ValueError:
+                    continue
+                record_usage(chunk.get("usage"))
+                for c in chunk.get("choices") or []:
+                    delta = c.get("delta") or {}
+                    content = delta.get("content") or c.get("text")
+                    if content:
+                        yield content
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+_ASYNC_CLIENT: Optional[AsyncLLMClient] = None
+
+
+def get_llm_client() -> AsyncLLMClient:
+    global _ASYNC_CLIENT
+    if _ASYNC_CLIENT is None:
+        _ASYNC_CLIENT = AsyncLLMClient()
+    return _ASYNC_CLIENT
+
+
+async def close_llm_client() -> None:
+    if _ASYNC_CLIENT is not None:
+        await _ASYNC_CLIENT.aclose()
+
+
+class QueueRejected(Exception):
+    """
+    调度器拒绝请求: reason 为 full (队列已满) 或 deadline (排队超过等待预算)
+    """
+
+    def __init__(self, reason: str):
+        super().__init__("LLM 排队已满" if reason == "full" else "LLM 排队等待超时")
+        self.reason = reason
+
+
+def _retry_after(response) -> Optional[float]:
+    # 只支持秒数形式的 Retry-After
+    try:
+        return max(0.0, float(response.headers.get("retry-after", "")))
+    except ValueError:
+        return None
+
+
+class LLMScheduler:
+    """
+    上游 LLM 调用调度器 (单个事件循环内使用)
+    - 同时进行的调用不超过 limit; 默认与连接池大小一致, 请求不会在 httpx 连接池内无界排队
+    - 超出时进入优先队列: priority 小者先放行 (紧急问题为 0), 同优先级先到先出
+    - 每个排队请求有截止时间, 到期仍未放行则抛出 QueueRejected("deadline"); 队列已满立即抛出 QueueRejected("full"),
+      若队列中有优先级更低的请求则由后者让出位置
+    - 上游返回 429 时 limit 减半并暂停放行 (Retry-After 或 cooldown 秒); 之后每次成功调用 limit 加 1, 直到 max_in_flight
+    """
+
+    def __init__(self, max_in_flight: int = LLM_MAX_IN_FLIGHT, max_queue: int = LLM_QUEUE_MAX,
+                 queue_timeout: float = LLM_QUEUE_TIMEOUT, cooldown: float = LLM_RATE_LIMIT_COOLDOWN):
+        self.max_in_flight = max(1, max_in_flight)
+        self.limit = self.max_in_flight
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.cooldown = cooldown
+        self._in_flight = 0
+        self._queue = []  # 堆: [priority, seq, future]
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._resume_handle = None
+        self._loop = None
+        self.admitted = 0
+        self.rejected = {"full": 0, "deadline": 0}
+        self.rate_limited = 0
+
+    def _bind_loop(self) -> asyncio.AbstractEventLoop:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # 新的事件循环 (如脚本中多次 asyncio.run): 旧循环中的排队与占用已失效
+            self._loop = loop
+            self._in_flight = 0
+            self._queue.clear()
+            self._paused_until = 0.0
+            self._resume_handle = None
+        return loop
+
+    def _can_admit(self) -> bool:
+        return self._in_flight < self.limit and self._loop.time() >= self._paused_until
+
+    def _admit(self, priority: int, waited: float) -> None:
+        self._in_flight += 1
+        self.admitted += 1
+        LLM_QUEUE_WAIT.observe(waited, priority=str(priority))
+
+    def _reject(self, reason: str) -> QueueRejected:
+        self.rejected[reason] += 1
+        LLM_QUEUE_REJECTED.inc(reason=reason)
+        return QueueRejected(reason)
+
+    async def acquire(self, priority: int = 1, timeout: Optional[float] = None) -> float:
+        """
+        等待一个调用名额, 返回排队耗时 (秒); 成功后调用方必须 release()
+        """
+        loop = self._bind_loop()
+        if not self._queue and self._can_admit():
+            self._admit(priority, 0.0)
+            return 0.0
+        if len(self._queue) >= self.max_queue:
+            # 队列已满: 优先级更高的请求挤掉最低优先级中最晚到达的排队请求, 否则直接拒绝
+            worst = max(self._queue, default=None)
+            if worst is None or worst[0] <= priority:
+                raise self._reject("full")
+            self._remove(worst)
+            worst[2].set_exception(self._reject("full"))
+
+        t0 = loop.time()
+        fut = loop.create_future()
+        entry = [priority, next(self._seq), fut]
+        heapq.heappush(self._queue, entry)
+        self._schedule_resume()
+        try:
+            await asyncio.wait_for(fut, self.queue_timeout if timeout is None else max(0.0, timeout))
+        except asyncio.TimeoutError:
+            # 超时与放行同时发生时 fut 已有结果, 视为放行
+            if not (fut.done() and not fut.cancelled()):
+                self._remove(entry)
+                raise self._reject("deadline")
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release()
+            else:
+                self._remove(entry)
+            raise
+        waited = loop.time() - t0
+        LLM_QUEUE_WAIT.observe(waited, priority=str(priority))
+        return waited
+
+    def _remove(self, entry: list) -> None:
+        try:
+            self._queue.remove(entry)
+            heapq.heapify(self._queue)
+        except ValueError:
+            pass
+
+    def _dispatch(self) -> None:
+        while self._queue and self._can_admit():
+            _, _, fut = heapq.heappop(self._queue)
+            if fut.done():
+                continue
+            self._in_flight += 1
+            self.admitted += 1
+            fut.set_result(None)
+        self._schedule_resume()
+
+    def _schedule_resume(self) -> None:
+        # 暂停期间有请求排队时, 在暂停结束时重新放行
+        if self._queue and self._resume_handle is None and self._loop.time() < self._paused_until:
+            self._resume_handle = self._loop.call_at(self._paused_until, self._resume)
+
+    def _resume(self) -> None:
+        self._resume_handle = None
+        self._dispatch()
+
+    def release(self, ok: bool = False) -> None:
+        self._in_flight = max(0, self._in_flight - 1)
+        if ok and self.limit < self.max_in_flight:
+            self.limit += 1
+        if self._loop is not None:
+            self._dispatch()
+
+    def on_rate_limited(self, retry_after: Optional[float] = None) -> None:
+        self.rate_limited += 1
+        self.limit = max(1, self.limit // 2)
+        pause = self.cooldown if retry_after is None else retry_after
+        self._paused_until = max(self._paused_until, self._loop.time() + pause)
+
+    @asynccontextmanager
+    async def slot(self, priority: int = 1, timeout: Optional[float] = None):
+        """
+        async with scheduler.slot(priority): 占用一个名额完成一次上游调用; 上游 429 时触发退避
+        """
+        await self.acquire(priority, timeout)
+        ok = False
+        try:
+            yield
+            ok = True
+        except Exception as e:
+            response = getattr(e, "response", None)
+            if getattr(response, "status_code", None) == 429:
+                self.on_rate_limited(_retry_after(response))
+            raise
+        finally:
+            self.release(ok)
+
+    def stats(self) -> dict:
+        paused = self._paused_until - self._loop.time() if self._loop is not None and not self._loop.is_closed() else 0.0
+        return {
+            "limit": self.limit,
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self._in_flight,
+            "queue_depth": len(self._queue),
+            "admitted": self.admitted,
+            "rejected_full": self.rejected["full"],
+            "rejected_deadline": self.rejected["deadline"],
+            "rate_limited": self.rate_limited,
+            "paused_seconds": round(max(0.0, paused), 3),
+        }
+
+
+_SCHEDULER = LLMScheduler()
+
+
+def scheduler_stats() -> dict:
+    return _SCHEDULER.stats()
+
+
+# 紧急类问题优先放行: 暴雨/积水/霜冻/高温等关键词, 或数据窗口已出现强降雨、霜冻
+EMERGENCY_KEYWORDS = ("暴雨", "大雨", "积水", "涝", "淹", "霜", "冻", "冰雹", "高温", "热害", "紧急")
+
+
+def request_priority(user_message: str, summary: Optional[WindowSummary] = None) -> int:
+    """
+    0 为紧急, 1 为普通
+    """
+    if any(k in user_message for k in EMERGENCY_KEYWORDS):
+        return 0
+    if summary is not None:
+        if summary.total_rain is not None and summary.total_rain >= MOCK_THRESHOLDS['rain_heavy_total_mm']:
+            return 0
+        temp = summary.variables.get('temp')
+        if temp is not None and temp.min <= MOCK_THRESHOLDS['temp_frost']:
+            return 0
+    return 1
+
+
+def _degraded_response(user_message: str, summary_str: str, summary: Optional[WindowSummary] = None) -> str:
+    # 排队超出预算时立即给出本地建议, 不再等待上游
+    return "(当前咨询较多, 先给出本地快速建议)\n\n" + _mock_response(user_message, summary_str, summary)
+
+
+async def aget_ai_response(user_message: str, data_context: str, summary_str: str, system_prompt_template: Optional[str] = None,
+                           client: Optional[AsyncLLMClient] = None, data_version=None, summary: Optional[WindowSummary] = None,
+                           data_scope: Optional[str] = None, timings: Optional[dict] = None,
+                           priority: Optional[int] = None, queue_timeout: Optional[float] = None) -> str:
+    """
+    get_ai_response 的异步版本, 在事件循环中等待远端 LLM 而不阻塞其他请求
+    data_version 为数据版本, 变化时 data_scope (设备) 下的缓存回复失效; 仅缓存远端成功的回复
+    缓存未命中时, 同一 key 的并发请求共享一次上游调用 (来源计为 coalesced); 上游失败时各自回退到本地启发式
+    上游调用经 _SCHEDULER 排队: priority 默认由 request_priority 判断, queue_timeout 默认 LLM_QUEUE_TIMEOUT,
+    排队超时或队列已满时立即返回本地建议 (来源计为 degraded)
+    """
+    client = client or get_llm_client()
+    if not client.enabled:
+        LLM_RESPONSES.inc(source="mock")
+        with timed(timings, "fallback"):
+            return _mock_response(user_message, summary_str, summary)
+
+    with timed(timings, "prompt_format"):
+        messages = _build_messages(user_message, data_context, system_prompt_template)
+        key = _cache_lookup_key(user_message, messages, client, data_version, data_scope)
+    if key is not None:
+        cached = _RESPONSE_CACHE.get(key)
+        if cached is not None:
+            LLM_RESPONSES.inc(source="cache")
+            return cached
+
+    if priority is None:
+        priority = request_priority(user_message, summary)
+    flight_key = (id(client), key or make_cache_key(user_message, messages, client.model))
+    try:
+        with timed(timings, "llm_call"):
+            text, shared = await _LLM_FLIGHT.do(
+                flight_key, lambda: _complete(client, messages, key, data_scope, priority, queue_timeout))
+    except QueueRejected:
+        LLM_RESPONSES.inc(source="degraded")
+        with timed(timings, "fallback"):
+            return _degraded_response(user_message, summary_str, summary)
+    except Exception as e:
+        LLM_RESPONSES.inc(source="fallback")
+        with timed(timings, "fallback"):
+            return _fallback_response(e, user_message, summary_str, summary)
+
+    LLM_RESPONSES.inc(source="coalesced" if shared else "llm")
+    return text
+
+
+async def _complete(client: AsyncLLMClient, messages: list, key: Optional[str], data_scope: Optional[str],
+                    priority: int = 1, queue_timeout: Optional[float] = None) -> str:
+    # 一次上游调用, 由 _LLM_FLIGHT 在并发的相同请求间共享; 在调用结束前写入缓存, 之后到达的请求直接命中
+    async with _SCHEDULER.slot(priority, queue_timeout):
+        try:
+            j = await client.chat(messages)
+        except Exception as e:
+            UPSTREAM_ERRORS.inc(kind=upstream_error_kind(e))
+            raise
+    record_usage(j.get("usage"))
+    text = _extract_content(j)
+    if key is not None:
+        _RESPONSE_CACHE.put(key, text, data_scope)
+    return text
+
+
+def _cache_lookup_key(user_message: str, messages: list, client: AsyncLLMClient, data_version,
+                      data_scope: Optional[str] = None) -> Optional[str]:
+    if not _RESPONSE_CACHE.enabled:
+        return None
+    if data_version is not None:
+        _RESPONSE_CACHE.observe_data_version(data_version, data_scope)
+    return make_cache_key(user_message, messages, client.model)
+
+
+MOCK_STREAM_CHUNK_CHARS = 8
+
+
+async def _stream_text(text: str, chunk_chars: int = MOCK_STREAM_CHUNK_CHARS) -> AsyncIterator[str]:
+    # 把整段文本切成小段逐个产出, 让 mock 路径也能离线验证流式渲染
+    for i in range(0, len(text), chunk_chars):
+        yield text[i:i + chunk_chars]
+        await asyncio.sleep(0)
+
+
+async def astream_ai_response(user_message: str, data_context: str, summary_str: str, system_prompt_template: Optional[str] = None,
+                              client: Optional[AsyncLLMClient] = None, data_version=None,
+                              summary: Optional[WindowSummary] = None, data_scope: Optional[str] = None,
+                              timings: Optional[dict] = None, priority: Optional[int] = None,
+                              queue_timeout: Optional[float] = None) -> AsyncIterator[str]:
+    """
+    aget_ai_response 的流式版本, 逐段产出回复文本
+    上游在输出前失败时回退到本地启发式; 输出中途失败则追加错误说明
+    缓存命中时直接分段输出缓存内容; 完整输出后写入缓存
+    上游流式调用同样经 _SCHEDULER 排队, 输出期间占用一个名额; 排队超时或队列已满时分段输出本地建议
+    timings 另记 llm_first_token (放行后首段到达耗时), llm_call 为放行后上游输出完毕的总耗时
+    """
+    client = client or get_llm_client()
+    if not client.enabled:
+        LLM_RESPONSES.inc(source="mock")
+        with timed(timings, "fallback"):
+            text = _mock_response(user_message, summary_str, summary)
+        async for piece in _stream_text(text):
+            yield piece
+        return
+
+    with timed(timings, "prompt_format"):
+        messages = _build_messages(user_message, data_context, system_prompt_template)
+        key = _cache_lookup_key(user_message, messages, client, data_version, data_scope)
+    if key is not None:
+        cached = _RESPONSE_CACHE.get(key)
+        if cached is not None:
+            LLM_RESPONSES.inc(source="cache")
+            async for piece in _stream_text(cached):
+                yield piece
+            return
+
+    if priority is None:
+        priority = request_priority(user_message, summary)
+    pieces = []
+    t0 = time.perf_counter()
+    try:
+        async with _SCHEDULER.slot(priority, queue_timeout):
+            t0 = time.perf_counter()
+            async for piece in client.stream_chat(messages):
+                if not pieces:
+                    add_timing(timings, "llm_first_token", time.perf_counter() - t0)
+                pieces.append(piece)
+                yield piece
+    except QueueRejected:
+        LLM_RESPONSES.inc(source="degraded")
+        with timed(timings, "fallback"):
+            text = _degraded_response(user_message, summary_str, summary)
+        async for piece in _stream_text(text):
+            yield piece
+        return
+    except Exception as e:
+        add_timing(timings, "llm_call", time.perf_counter() - t0)
+        UPSTREAM_ERRORS.inc(kind=upstream_error_kind(e))
+        if pieces:
+            LLM_RESPONSES.inc(source="llm_partial")
+            yield f"\n\n(LLM 流式输出中断: {e})"
         else:
-            tips.append("土壤水分在可接受范围, 保持常规管理。")
-    
-    if total_rain is not None and total_rain >= MOCK_THRESHOLDS['rain_heavy_total_mm']:
-        tips.append("近期累计降雨较多, 注意检查排水沟与果园低洼处, 必要时启动抽水或疏导。")
-    if mean_temp is not None and mean_temp >= MOCK_THRESHOLDS['temp_hot']:
-        tips.append("近期温度偏高, 建议白天遮阳、补充灌溉和喷薄叶面水以降温。")
+            LLM_RESPONSES.inc(source="fallback")
+            with timed(timings, "fallback"):
+                text = _fallback_response(e, user_message, summary_str, summary)
+            async for piece in _stream_text(text):
+                yield piece
+        return
+    add_timing(timings, "llm_call", time.perf_counter() - t0)
+    LLM_RESPONSES.inc(source="llm")
+
+    if key is not None and pieces:
+        _RESPONSE_CACHE.put(key, "".join(pieces), data_scope)
+
+
+def _mock_response(user_message: str, summary_str: str, summary: Optional[WindowSummary] = None) -> str:
+    # 告警来自规则引擎 (config.ALERT_RULES): 有 WindowSummary 时直接读取其 alerts, 否则按 summary 字符串中的数值评估
+    # 下面的 "要不要浇水" 直接回答同样以 soil_wet / soil_dry 是否命中为准, 与告警提示不会互相矛盾
+    if summary is not None:
+        last_vwc = summary.last_vwc
+        alerts = summary.alerts
+    else:
+        nums = _extract_numbers_from_summary(summary_str)
+        last_vwc = nums.get('last_vwc')
+        values = {
+            ('temp', 'mean'): nums.get('mean_temp'),
+            ('rain', 'sum'): nums.get('total_rain'),
+            ('soil_water', 'last'): last_vwc,
+        }
+        if 'hot_hours' in nums:
+            limit, hours = nums['hot_hours']
+            values[('temp', 'hours_ge', limit)] = hours
+        alerts = _ALERT_ENGINE.evaluate_values(values)
+
+    tips = [a['message'] for a in alerts]
+    fired = {a['rule'] for a in alerts}
+    if last_vwc is not None and not fired & {'soil_wet', 'soil_dry'}:
+        tips.insert(0, "土壤水分在可接受范围, 保持常规管理。")
 
     if not tips:
         tips = ["数据不足以自动判断, 请提供更多观测 (例如近 24 小时的温度/土壤水分/降雨数值) 或允许连接云端模型。"]
@@ -125,9 +737,9 @@ def _mock_response(user_message: str, summary_str: str) -> str:
     q = user_message.lower()
     if "浇水" in q or "要浇水" in q or "灌溉" in q:
         if last_vwc is not None:
-            if last_vwc >= MOCK_THRESHOLDS['soil_water_high']:
+            if 'soil_wet' in fired:
                 direct = "不要浇水, 现在土壤已经很湿, 先排水。"
-            elif last_vwc <= MOCK_THRESHOLDS['soil_water_low']:
+            elif 'soil_dry' in fired:
                 direct = "应该浇水, 推荐早晚各小量补水或持续滴灌至土壤水分回升。"
             else:
                 direct = "目前可以按常规管理, 如若有干点可适量补水。"
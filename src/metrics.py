@@ -0,0 +1,227 @@
+"""
+进程内指标 (Prometheus 文本格式, 无第三方依赖)
+- Counter / Histogram 支持标签, 线程安全
+- Registry.render() 输出 text/plain; version=0.0.4, 供 GET /metrics 使用
+- Registry.add_collector 注册回调, 在导出时读取缓存命中率等现有统计
+各阶段耗时以秒为单位记录在 fg_chat_stage_seconds{stage=...}
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 60.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _fmt_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    if float(v).is_integer():
+        return str(int(v))
+    return repr(float(v))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} 需要标签 {self.labelnames}, 实际为 {tuple(labels)}")
+        return tuple(str(labels[k]) for k in self.labelnames)
+
+    def samples(self) -> List[Sample]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, dict(zip(self.labelnames, k)), v) for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], list] = {}  # key -> [bucket_counts..., sum, count]
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    s[i] += 1
+            s[-2] += value
+            s[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def count(self, **labels) -> int:
+        s = self._series.get(self._key(labels))
+        return s[-1] if s else 0
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        out = []
+        for key, s in items:
+            labels = dict(zip(self.labelnames, key))
+            for i, b in enumerate(self.buckets):
+                out.append((self.name + "_bucket", {**labels, "le": _fmt_value(b)}, s[i]))
+            out.append((self.name + "_bucket", {**labels, "le": "+Inf"}, s[-1]))
+            out.append((self.name + "_sum", labels, s[-2]))
+            out.append((self.name + "_count", labels, s[-1]))
+        return out
+
+
+class Registry:
+    """
+    指标注册表; collector 为返回 [(name, kind, help, [(labels, value), ...]), ...] 的回调
+    """
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], list]] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def add_collector(self, fn: Callable[[], list]) -> None:
+        with self._lock:
+            self._collectors.append(fn)
+
+    def render(self) -> str:
+        lines = []
+        for m in self._metrics:
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            for name, labels, value in m.samples():
+                lines.append(f"{name}{_labels_text(labels)} {_fmt_value(value)}")
+        for fn in self._collectors:
+            for name, kind, help, series in fn():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in series:
+                    lines.append(f"{name}{_labels_text(labels)} {_fmt_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "fg_chat_stage_seconds", "Time spent in each /chat stage", ["stage"])
+REQUEST_SECONDS = REGISTRY.histogram(
+    "fg_http_request_seconds", "End-to-end request latency", ["endpoint"])
+LLM_RESPONSES = REGISTRY.counter(
+    "fg_llm_responses_total", "Replies by source (llm, llm_partial, coalesced, cache, mock, degraded, fallback)", ["source"])
+UPSTREAM_ERRORS = REGISTRY.counter(
+    "fg_llm_upstream_errors_total", "Failed upstream LLM calls by kind", ["kind"])
+LLM_QUEUE_WAIT = REGISTRY.histogram(
+    "fg_llm_queue_wait_seconds", "Time requests waited for an upstream LLM slot", ["priority"])
+LLM_QUEUE_REJECTED = REGISTRY.counter(
+    "fg_llm_queue_rejected_total", "Requests degraded to local advice by the scheduler", ["reason"])
+LLM_TOKENS = REGISTRY.counter(
+    "fg_llm_tokens_total", "Token usage reported by the LLM response", ["type"])
+
+
+def observe_stages(timings: Optional[Dict[str, float]]) -> None:
+    if not timings:
+        return
+    for stage, seconds in timings.items():
+        STAGE_SECONDS.observe(seconds, stage=stage)
+
+
+def add_timing(timings: Optional[Dict[str, float]], stage: str, seconds: float) -> None:
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(timings: Optional[Dict[str, float]], stage: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_timing(timings, stage, time.perf_counter() - t0)
+
+
+def upstream_error_kind(error: Exception) -> str:
+    """
+    把上游异常归类为 timeout / connect / http_429 / http_4xx / http_5xx / other
+    """
+    name = type(error).__name__.lower()
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    if status is not None:
+        if status == 429:
+            return "http_429"
+        return f"http_{status // 100}xx"
+    if "timeout" in name:
+        return "timeout"
+    if "connect" in name:
+        return "connect"
+    return "other"
+
+
+def record_usage(usage: Optional[dict]) -> None:
+    if not isinstance(usage, dict):
+        return
+    for key, label in (("prompt_tokens", "prompt"), ("completion_tokens", "completion")):
+        value = usage.get(key)
+        if isinstance(value, (int, float)) and value > 0:
+            LLM_TOKENS.inc(value, type=label)
@@ -0,0 +1,171 @@
+"""
+向量化阈值告警规则引擎
+- 规则: 变量 var 的窗口统计量 stat 与 threshold 按 op 比较, 命中即产生一条告警
+  stat: last / first / min / max / mean / sum / delta (末值-首值) / trend (最小二乘斜率, 单位/小时) /
+        hours_ge / hours_le (逐小时值 >= / <= limit 的小时数)
+  hours: 只看窗口末尾若干小时 (如滚动 6 小时降雨), 省略为整个窗口
+- 多个设备的窗口右对齐堆叠成 (设备数, 小时数) 矩阵, 缺失值为 NaN;
+  每个 (var, stat, hours, limit) 只计算一次, 全部设备、全部规则一次向量化完成
+- 单个窗口 (离线/回退回复) 与全部设备 (GET /alerts) 使用同一套规则 (config.ALERT_RULES)
+告警格式: {"rule", "level", "value", "threshold", "message"}
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+STATS = ("last", "first", "min", "max", "mean", "sum", "delta", "trend", "hours_ge", "hours_le")
+OPS = {">=": np.greater_equal, "<=": np.less_equal, ">": np.greater, "<": np.less}
+
+
+@dataclass(frozen=True)
+class Rule:
+    name: str
+    var: str
+    stat: str
+    op: str
+    threshold: float
+    level: str = "warning"
+    message: str = ""
+    hours: Optional[int] = None
+    limit: Optional[float] = None
+
+    def __post_init__(self):
+        if self.stat not in STATS:
+            raise ValueError(f"规则 {self.name}: 未知的 stat {self.stat!r}, 可选 {STATS}")
+        if self.op not in OPS:
+            raise ValueError(f"规则 {self.name}: 未知的 op {self.op!r}, 可选 {tuple(OPS)}")
+        if self.stat in ("hours_ge", "hours_le") and self.limit is None:
+            raise ValueError(f"规则 {self.name}: {self.stat} 需要 limit")
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "Rule":
+        return cls(**d)
+
+    @property
+    def key(self) -> Tuple:
+        return self.var, self.stat, self.hours, self.limit
+
+    def alert(self, value: float) -> dict:
+        return {
+            "rule": self.name,
+            "level": self.level,
+            "value": round(float(value), 2),
+            "threshold": self.threshold,
+            "message": self.message.format(value=round(float(value), 1)),
+        }
+
+
+def _column_values(df: pd.DataFrame, var: str) -> np.ndarray:
+    try:
+        return np.asarray(df[var], dtype=np.float64)
+    except (TypeError, ValueError):
+        return pd.to_numeric(df[var], errors="coerce").to_numpy(dtype=np.float64)
+
+
+def stack_windows(frames: Sequence[Optional[pd.DataFrame]], variables: Sequence[str], hours: int) -> Dict[str, np.ndarray]:
+    """
+    把每个设备窗口的最后 hours 行右对齐堆叠为 {var: (设备数, hours)}; None、空表或缺列对应 NaN
+    """
+    hours = max(1, int(hours))
+    out = {v: np.full((len(frames), hours), np.nan) for v in variables}
+    for i, df in enumerate(frames):
+        if df is None or len(df) == 0:
+            continue
+        for v in variables:
+            if v in df.columns:
+                col = _column_values(df, v)[-hours:]
+                out[v][i, hours - len(col):] = col
+    return out
+
+
+def window_stat(x: np.ndarray, stat: str, limit: Optional[float] = None) -> np.ndarray:
+    """
+    x: (设备数, 小时数), 返回每行的统计量; 整行缺失时为 NaN
+    """
+    valid = ~np.isnan(x)
+    n = valid.sum(axis=1)
+    has = n > 0
+    rows = np.arange(x.shape[0])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if stat in ("last", "first", "delta"):
+            last = x[rows, x.shape[1] - 1 - np.argmax(valid[:, ::-1], axis=1)]
+            first = x[rows, np.argmax(valid, axis=1)]
+            value = {"last": last, "first": first, "delta": last - first}[stat]
+        elif stat == "min":
+            value = np.where(valid, x, np.inf).min(axis=1)
+        elif stat == "max":
+            value = np.where(valid, x, -np.inf).max(axis=1)
+        elif stat == "sum":
+            value = np.nansum(x, axis=1)
+        elif stat == "mean":
+            value = np.nansum(x, axis=1) / n
+        elif stat == "hours_ge":
+            value = (x >= limit).sum(axis=1).astype(np.float64)
+        elif stat == "hours_le":
+            value = (x <= limit).sum(axis=1).astype(np.float64)
+        elif stat == "trend":
+            t = np.arange(x.shape[1], dtype=np.float64)
+            tm = (valid * t).sum(axis=1) / n
+            ym = np.nansum(x, axis=1) / n
+            dt = np.where(valid, t - tm[:, None], 0.0)
+            dy = np.where(valid, x - ym[:, None], 0.0)
+            den = (dt * dt).sum(axis=1)
+            value = np.where(den > 0, (dt * dy).sum(axis=1) / np.where(den > 0, den, 1.0), 0.0)
+        else:
+            raise ValueError(f"未知的 stat {stat!r}")
+    return np.where(has, value, np.nan)
+
+
+class RuleEngine:
+    """
+    evaluate_windows / evaluate_frames 返回与设备顺序一致的告警列表 [[alert, ...], ...]
+    """
+
+    def __init__(self, rules: Sequence):
+        self.rules = [r if isinstance(r, Rule) else Rule.from_dict(r) for r in rules]
+        self.variables = sorted({r.var for r in self.rules})
+
+    def stat_table(self, windows: Dict[str, np.ndarray]) -> Dict[Tuple, np.ndarray]:
+        table = {}
+        for r in self.rules:
+            if r.key in table or r.var not in windows:
+                continue
+            x = windows[r.var]
+            if r.hours:
+                x = x[:, -r.hours:]
+            table[r.key] = window_stat(x, r.stat, r.limit)
+        return table
+
+    def evaluate_table(self, table: Dict[Tuple, np.ndarray], n: int) -> List[List[dict]]:
+        alerts = [[] for _ in range(n)]
+        for r in self.rules:
+            values = table.get(r.key)
+            if values is None:
+                continue
+            with np.errstate(invalid="ignore"):
+                hit = OPS[r.op](values, r.threshold)  # NaN 不命中
+            for i in np.flatnonzero(hit):
+                alerts[i].append(r.alert(values[i]))
+        return alerts
+
+    def evaluate_windows(self, windows: Dict[str, np.ndarray]) -> List[List[dict]]:
+        n = len(next(iter(windows.values()))) if windows else 0
+        return self.evaluate_table(self.stat_table(windows), n)
+
+    def evaluate_frames(self, frames: Sequence[Optional[pd.DataFrame]], hours: int) -> List[List[dict]]:
+        return self.evaluate_windows(stack_windows(frames, self.variables, hours))
+
+    def evaluate_values(self, values: Dict[Tuple, Optional[float]]) -> List[dict]:
+        """
+        单个设备只有标量统计量时 (如只拿到 summary 字符串): values 为 {(var, stat): 取值},
+        hours_ge / hours_le 的取值以 (var, stat, limit) 为 key; 只评估不带 hours 且给出了取值的规则
+        """
+        table = {}
+        for r in self.rules:
+            v = values.get((r.var, r.stat) if r.limit is None else (r.var, r.stat, float(r.limit)))
+            if r.hours is None and v is not None:
+                table[r.key] = np.array([float(v)])
+        return self.evaluate_table(table, 1)[0]
@@ -0,0 +1,289 @@
+"""
+历史传感器数据增量同步
+- 把 [begin, end] 切成固定长度的时间块, 用线程池并行调用 Downloader 获取
+- 每台设备持久化一个高水位 (已同步到的最新记录时间), 之后只拉取比它更新的记录
+- 每台设备的块一到齐 (前面的块都已完成) 就按时间顺序交给 sink 追加到本地存储并推进检查点 (默认经 ingest 归一化为小时数据, 写入 DATA_DIR 下 data_loader 读取的 {deviceKey}.cols)
+- sink 暂存的未完整小时之前才算已同步, 高水位不会越过它
+- 某个时间块失败时, 只提交它之前连续成功的块, 高水位停在那里, 下次从断点继续
+用法(项目根目录)：
+  python -m src.sync --server 127.0.0.1 --port 9001 --user demo --password demo --devices MOCK0000 MOCK0001 --since 2025-01-01
+"""
+
+import os
+import json
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from .config import DATA_DIR, PROJECT_ROOT
+from .downloader import Downloader, JsonType, printLog, BULK_MAX_WORKERS
+from .column_store import ColumnStore, is_column_store, TIMESTAMP_COL
+from .ingest import IngestSink
+
+
+SYNC_STATE_DIR = os.getenv("SYNC_STATE_DIR", os.path.join(PROJECT_ROOT, "output/sync"))
+SYNC_CHUNK_HOURS = int(os.getenv("SYNC_CHUNK_HOURS", "24"))
+CHECKPOINT_FILE = "checkpoints.json"
+TIME_FMT = "%Y-%m-%d %H:%M:%S"
+
+LOADER_COLS = ['temp', 'humidity', 'rain', 'solar', 'soil_water']
+
+
+def record_time(rec: dict) -> Optional[datetime]:
+    """
+    平台记录的时间: 优先 recordTimeStr, 其次 recordTime (毫秒时间戳), 最后 timestamp
+    """
+    if rec.get("recordTimeStr"):
+        return datetime.strptime(rec["recordTimeStr"], TIME_FMT)
+    if rec.get("recordTime") is not None:
+        return datetime.fromtimestamp(int(rec["recordTime"]) / 1000)
+    if rec.get("timestamp"):
+        return pd.Timestamp(rec["timestamp"]).to_pydatetime()
+    return None
+
+
+def records_to_frame(records: JsonType) -> pd.DataFrame:
+    """
+    默认归一化: 记录已是 data_loader 字段 (temp/humidity/...) 时按时间戳合并成一行
+    """
+    rows = []
+    for rec in records:
+        t = record_time(rec)
+        if t is None:
+            continue
+        row = {TIMESTAMP_COL: t}
+        row.update({c: rec[c] for c in LOADER_COLS if c in rec})
+        rows.append(row)
+    df = pd.DataFrame(rows)
+    present = [c for c in LOADER_COLS if c in df.columns]
+    if not present:
+        return pd.DataFrame(columns=[TIMESTAMP_COL] + LOADER_COLS)
+    df = df.dropna(how='all', subset=present)
+    return df.groupby(TIMESTAMP_COL, as_index=False)[present].mean()
+
+
+class ColumnStoreSink:
+    """
+    把一台设备的新记录归一化后追加到 {data_dir}/{device_key}.cols
+    适用于记录已是 loader 字段的数据源; 平台原始记录请用 ingest.IngestSink
+    """
+
+    def __init__(self, data_dir: str = DATA_DIR, normalize: Callable[[JsonType], pd.DataFrame] = records_to_frame):
+        self.data_dir = data_dir
+        self.normalize = normalize
+
+    def store_path(self, device_key: str) -> str:
+        return os.path.join(self.data_dir, f"{device_key}.cols")
+
+    def append(self, device_key: str, records: JsonType, through: Optional[datetime] = None) -> int:
+        df = self.normalize(records)
+        if df.empty:
+            return 0
+        path = self.store_path(device_key)
+        if not is_column_store(path):
+            os.makedirs(self.data_dir, exist_ok=True)
+            ColumnStore.create(path, df.iloc[:0], [c for c in LOADER_COLS])
+        return ColumnStore(path).append(df)
+
+
+class CheckpointStore:
+    """
+    每台设备的高水位检查点, 保存在 {state_dir}/checkpoints.json (原子替换写入)
+    """
+
+    def __init__(self, state_dir: str = SYNC_STATE_DIR):
+        self.path = os.path.join(state_dir, CHECKPOINT_FILE)
+        self._lock = threading.Lock()
+        self._data = self._read()
+
+    def _read(self) -> dict:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def high_water_mark(self, device_key: str) -> Optional[datetime]:
+        entry = self._data.get(device_key)
+        if not entry or not entry.get("high_water_mark"):
+            return None
+        return datetime.strptime(entry["high_water_mark"], TIME_FMT)
+
+    def update(self, device_key: str, hwm: datetime, added: int) -> None:
+        with self._lock:
+            entry = self._data.setdefault(device_key, {"records": 0})
+            entry["high_water_mark"] = hwm.strftime(TIME_FMT)
+            entry["records"] = entry.get("records", 0) + added
+            entry["updated_at"] = datetime.now().strftime(TIME_FMT)
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self._data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.path)
+
+
+def split_range(begin: datetime, end: datetime, chunk_hours: int = SYNC_CHUNK_HOURS) -> List[Tuple[datetime, datetime]]:
+    """
+    把闭区间 [begin, end] 切成首尾不重叠的闭区间块 (接口的 beginTime/endTime 均包含端点)
+    """
+    chunks = []
+    step = timedelta(hours=chunk_hours)
+    t = begin
+    while t <= end:
+        chunk_end = min(end, t + step - timedelta(seconds=1))
+        chunks.append((t, chunk_end))
+        t = chunk_end + timedelta(seconds=1)
+    return chunks
+
+
+class IncrementalSync:
+    """
+    增量同步引擎
+    sync_devices 对每台设备计算起点 (高水位 + 1s, 无检查点时为 since), 切块并行下载, 按序追加
+    """
+
+    def __init__(self, downloader: Downloader, sink=None, checkpoints: Optional[CheckpointStore] = None,
+                 chunk_hours: int = SYNC_CHUNK_HOURS, max_workers: int = BULK_MAX_WORKERS):
+        self.downloader = downloader
+        self.sink = sink or IngestSink()
+        self.checkpoints = checkpoints or CheckpointStore()
+        self.chunk_hours = chunk_hours
+        self.max_workers = max_workers
+
+    def _start_for(self, device_key: str, since: datetime) -> datetime:
+        hwm = self.checkpoints.high_water_mark(device_key)
+        if hwm is None:
+            return since
+        return max(since, hwm + timedelta(seconds=1))
+
+    def sync_devices(self, device_keys: List[str], since: datetime, until: Optional[datetime] = None) -> Dict[str, dict]:
+        """
+        各设备的时间块按完成顺序到达, 每台设备一旦拿到下一个连续的块就立即提交并推进检查点;
+        已下载未提交的块最多 2 * max_workers 个, 长时间回补时内存占用与总时长无关
+        """
+        until = until or datetime.now()
+        progress = {}
+        for key in device_keys:
+            start = self._start_for(key, since)
+            chunks = split_range(start, until, self.chunk_hours) if start <= until else []
+            progress[key] = _DeviceProgress(self, key, chunks)
+
+        tasks = deque((key, i, chunk) for key, p in progress.items() for i, chunk in enumerate(p.chunks))
+        printLog(f"增量同步 {len(device_keys)} 个设备，共 {len(tasks)} 个时间块")
+
+        def fetch(task):
+            key, i, (b, e) = task
+            try:
+                return key, i, self.downloader._fetchHistory(key, b, e), None
+            except Exception as ex:
+                return key, i, None, ex
+
+        workers = max(1, self.max_workers)
+        window = 2 * workers
+        running = set()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while tasks or running:
+                buffered = sum(p.buffered for p in progress.values())
+                while tasks and len(running) + buffered < window:
+                    task = tasks.popleft()
+                    if progress[task[0]].error is None:  # 设备已失败则不再下载其后的块
+                        running.add(pool.submit(fetch, task))
+                if not running:
+                    break
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    key, i, records, err = fut.result()
+                    progress[key].offer(i, records, err)
+
+        return {key: p.report() for key, p in progress.items()}
+
+
+class _DeviceProgress:
+    """
+    单台设备的按序提交状态: 乱序到达的块先暂存, 按时间顺序逐块交给 sink 并推进检查点
+    遇到第一个失败的块即停止, 保证高水位之前的数据完整
+    """
+
+    def __init__(self, engine: IncrementalSync, device_key: str, chunks: list):
+        self.engine = engine
+        self.device_key = device_key
+        self.chunks = chunks
+        self.next = 0
+        self.ready: Dict[int, tuple] = {}
+        self.added = 0
+        self.fetched = 0
+        self.error = None
+        self.hwm = self.seen = engine.checkpoints.high_water_mark(device_key)
+
+    @property
+    def buffered(self) -> int:
+        return len(self.ready)
+
+    def offer(self, i: int, records: Optional[JsonType], err: Optional[Exception]) -> None:
+        if self.error is not None:
+            return
+        self.ready[i] = (records, err)
+        while self.error is None and self.next in self.ready:
+            records, err = self.ready.pop(self.next)
+            if err is not None:
+                self.error = f"{self.chunks[self.next][0]:%Y-%m-%d %H:%M} 起的时间块失败: {err}"
+                printLog(f"{self.device_key} {self.error}")
+                self.ready.clear()
+                return
+            self._apply(records or [], self.chunks[self.next][1])
+            self.next += 1
+
+    def _apply(self, records: JsonType, through: datetime) -> None:
+        sink, key = self.engine.sink, self.device_key
+        self.fetched += len(records)
+        n = sink.append(key, records, through=through)
+        self.added += n
+        times = [t for t in (record_time(r) for r in records) if t is not None]
+        if times:
+            self.seen = max(times) if self.seen is None else max(self.seen, max(times))
+        # sink 暂存 (尚未落盘) 的记录之前才算已同步
+        pending_since = getattr(sink, "pending_since", None)
+        pending = pending_since(key) if pending_since else None
+        new_hwm = min(self.seen, pending - timedelta(seconds=1)) if self.seen and pending else self.seen
+        if new_hwm is not None and (new_hwm != self.hwm or n):
+            self.hwm = new_hwm
+            self.engine.checkpoints.update(key, self.hwm, n)
+
+    def report(self) -> dict:
+        return {"fetched": self.fetched, "appended": self.added,
+                "high_water_mark": self.hwm.strftime(TIME_FMT) if self.hwm else None, "error": self.error}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="增量同步设备历史数据到本地列式存储")
+    parser.add_argument("--server", type=str, default=os.getenv("IOT_SERVER_IP", "192.168.1.100"))
+    parser.add_argument("--port", type=str, default=os.getenv("IOT_SERVER_PORT", "9001"))
+    parser.add_argument("--user", type=str, default=os.getenv("IOT_USERNAME", ""))
+    parser.add_argument("--password", type=str, default=os.getenv("IOT_PASSWORD", ""))
+    parser.add_argument("--devices", nargs="*", default=None, help="deviceKey 列表 (默认同步账户下全部设备)")
+    parser.add_argument("--since", type=str, required=True, help="无检查点时的起始时间, 如 2025-01-01")
+    parser.add_argument("--until", type=str, default=None)
+    parser.add_argument("--chunk-hours", type=int, default=SYNC_CHUNK_HOURS)
+    parser.add_argument("--workers", type=int, default=BULK_MAX_WORKERS)
+    args = parser.parse_args(argv)
+
+    d = Downloader(args.server, args.port)
+    d.logIn(args.user, args.password)
+    if not d.isLogIn():
+        return 1
+    device_keys = args.devices or [dev["deviceKey"] for dev in d.getDevicesInGroup("")]
+
+    engine = IncrementalSync(d, chunk_hours=args.chunk_hours, max_workers=args.workers)
+    report = engine.sync_devices(device_keys, pd.Timestamp(args.since).to_pydatetime(),
+                                 pd.Timestamp(args.until).to_pydatetime() if args.until else None)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    d.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
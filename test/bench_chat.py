@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+/chat 请求路径基准：按数据规模 (1 天 ~ 5 年, 由 gen_data 的 BatchSimulator 生成) 分阶段计时
+- _load_raw_records / _select_window_by_time / _compact_csv_from_df / _summarize_window
+- 完整 /chat 处理 (mock LLM 模式, 经 ASGI 直接调用 app, 参考时间随机、问题各不相同以避开回复缓存)
+每个阶段给出 p50/p95/p99/mean (ms) 与单次调用的峰值内存 (tracemalloc), 结果以 JSON 输出, 便于跨提交对比
+用法(项目根目录)：python -m test.bench_chat --days 1 30 365 1825 --out bench_chat.json
+  与之前的结果对比：python -m test.bench_chat --out new.json --baseline bench_chat.json
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import shutil
+import argparse
+import platform
+import subprocess
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+SRC_DIR = ROOT_DIR / "src"
+sys.path.insert(0, str(SRC_DIR))
+
+# 必须在导入 app 之前设置：强制 mock LLM, 数据目录指向临时目录
+os.environ["DEEPSEEK_API_KEY"] = ""
+BENCH_DIR = tempfile.mkdtemp(prefix="bench_chat_")
+os.environ["DATA_DIR"] = BENCH_DIR
+
+import httpx  # noqa: E402
+
+from src import data_loader as dl  # noqa: E402
+from src.app import app  # noqa: E402
+from .gen_data import BatchSimulator, chunk_to_frame  # noqa: E402
+from .gen_data_config import DEFAULT_STORYLINE, RNG  # noqa: E402
+
+WINDOW_HOURS = 24
+STAGES = ["load_raw_records", "select_window", "compact_csv", "summarize_window", "chat"]
+
+
+def make_dataset(days: int, seed: int) -> Path:
+    """
+    生成 days 天的单站点数据, 写成与 output/pseudo_data/test.json 相同格式的 JSON
+    """
+    scene_days = sum(d for _, d in DEFAULT_STORYLINE)
+    storyline = DEFAULT_STORYLINE * (int(np.ceil(days / scene_days)))
+    sim = BatchSimulator(storyline, stations=1, seed=seed)
+    df = chunk_to_frame(sim.step_chunk(days * 24)).drop(columns=["station"])
+    df["timestamp"] = df["timestamp"].dt.strftime("%Y-%m-%d %H:%M:%S")
+    path = Path(BENCH_DIR) / f"bench-{days}d.json"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(df.to_dict(orient="records"), f, ensure_ascii=False)
+    return path
+
+
+def percentiles(samples: list) -> dict:
+    arr = np.asarray(samples) * 1e3
+    return {
+        "n": len(samples),
+        "p50_ms": round(float(np.percentile(arr, 50)), 4),
+        "p95_ms": round(float(np.percentile(arr, 95)), 4),
+        "p99_ms": round(float(np.percentile(arr, 99)), 4),
+        "mean_ms": round(float(arr.mean()), 4),
+    }
+
+
+def peak_kib(fn) -> float:
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(peak / 1024, 1)
+
+
+def time_sync(fn, args_list: list) -> list:
+    samples = []
+    for args in args_list:
+        t0 = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+async def time_chat(client: httpx.AsyncClient, payloads: list) -> list:
+    samples = []
+    for payload in payloads:
+        t0 = time.perf_counter()
+        resp = await client.post("/chat", json=payload)
+        samples.append(time.perf_counter() - t0)
+        resp.raise_for_status()
+    return samples
+
+
+def bench_size(days: int, iterations: int, load_iterations: int, seed: int) -> dict:
+    path = make_dataset(days, seed)
+    device_key = path.stem
+    rng = np.random.default_rng(seed)
+
+    # 以 _load_dataset 的方式准备 DataFrame, 供窗口相关阶段使用
+    df = dl._ensure_timestamp_sorted(dl._clean_spoilers(pd.DataFrame(dl._load_raw_records(str(path)))))
+    ts = df["timestamp"]
+    refs = [ts.iloc[i].to_pydatetime() for i in rng.integers(0, len(df), size=iterations)]
+    windows = [dl._select_window_by_time(df, r, WINDOW_HOURS, "past") for r in refs]
+
+    stages = {}
+    stages["load_raw_records"] = percentiles(time_sync(dl._load_raw_records, [(str(path),)] * load_iterations))
+    stages["select_window"] = percentiles(time_sync(dl._select_window_by_time, [(df, r, WINDOW_HOURS, "past") for r in refs]))
+    stages["compact_csv"] = percentiles(time_sync(dl._compact_csv_from_df, [(w, dl.TRUSTED_COLS) for w in windows]))
+    stages["summarize_window"] = percentiles(time_sync(dl._summarize_window, [(w,) for w in windows]))
+
+    mid = windows[len(windows) // 2]
+    stages["load_raw_records"]["peak_kib"] = peak_kib(lambda: dl._load_raw_records(str(path)))
+    stages["select_window"]["peak_kib"] = peak_kib(lambda: dl._select_window_by_time(df, refs[0], WINDOW_HOURS, "past"))
+    stages["compact_csv"]["peak_kib"] = peak_kib(lambda: dl._compact_csv_from_df(mid, dl.TRUSTED_COLS))
+    stages["summarize_window"]["peak_kib"] = peak_kib(lambda: dl._summarize_window(mid))
+
+    # 完整 /chat：首个请求含冷加载, 单独记录
+    payloads = [{
+        "message": f"果树要不要浇水 {i}",
+        "reference_time": r.strftime("%Y-%m-%d %H:%M:%S"),
+        "include_forecast": bool(i % 2),
+        "device_key": device_key,
+    } for i, r in enumerate(refs)]
+
+    async def run_chat():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            cold = await time_chat(client, payloads[:1])
+            warm = await time_chat(client, payloads[1:])
+            tracemalloc.start()
+            try:
+                await time_chat(client, [dict(payloads[0], message="果树要不要浇水 peak")])
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            return cold, warm, peak
+
+    cold, warm, peak = asyncio.run(run_chat())
+    stages["chat"] = percentiles(warm)
+    stages["chat"]["cold_ms"] = round(cold[0] * 1e3, 4)
+    stages["chat"]["peak_kib"] = round(peak / 1024, 1)
+
+    return {"days": days, "rows": len(df), "file_bytes": path.stat().st_size, "stages": stages}
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+                                capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> int:
+    """
+    按 (days, stage) 对比 p50/p95, 返回变慢超过 threshold 倍的条目数
+    """
+    base = {r["days"]: r["stages"] for r in baseline.get("results", [])}
+    regressions = 0
+    print(f"{'days':>6} {'stage':>18} {'p50_ratio':>10} {'p95_ratio':>10}", file=sys.stderr)
+    for r in report["results"]:
+        old = base.get(r["days"])
+        if not old:
+            continue
+        for s in STAGES:
+            if s not in old:
+                continue
+            p50 = r["stages"][s]["p50_ms"] / max(old[s]["p50_ms"], 1e-9)
+            p95 = r["stages"][s]["p95_ms"] / max(old[s]["p95_ms"], 1e-9)
+            mark = " !" if max(p50, p95) > threshold else ""
+            regressions += bool(mark)
+            print(f"{r['days']:>6} {s:>18} {p50:>10.2f} {p95:>10.2f}{mark}", file=sys.stderr)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="/chat 请求路径分阶段基准")
+    parser.add_argument("--days", nargs="+", type=int, default=[1, 7, 30, 365, 1825])
+    parser.add_argument("--iterations", type=int, default=200, help="窗口相关阶段与 /chat 的采样次数")
+    parser.add_argument("--load-iterations", type=int, default=10, help="_load_raw_records 的采样次数")
+    parser.add_argument("--seed", type=int, default=RNG.get("seed", 2026))
+    parser.add_argument("--out", type=str, default=None, help="结果 JSON 路径 (默认打印到标准输出)")
+    parser.add_argument("--baseline", type=str, default=None, help="之前的结果 JSON, 给出耗时比值")
+    parser.add_argument("--threshold", type=float, default=1.2, help="比值超过该值视为回退, 以非零状态码退出")
+    args = parser.parse_args(argv)
+
+    results = []
+    try:
+        for days in args.days:
+            r = bench_size(days, max(2, args.iterations), max(1, args.load_iterations), args.seed)
+            results.append(r)
+            summary = ", ".join(f"{s} p50={r['stages'][s]['p50_ms']:.3f}ms" for s in STAGES)
+            print(f"[{days}d, {r['rows']} 行] {summary}", file=sys.stderr)
+    finally:
+        shutil.rmtree(BENCH_DIR, ignore_errors=True)
+
+    report = {"env": environment(), "window_hours": WINDOW_HOURS, "results": results}
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        Path(args.out).write_text(text, encoding="utf-8")
+        print(f"已写入 {args.out}", file=sys.stderr)
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            return 1 if compare(report, json.load(f), args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+紧凑 CSV 编码器基准：对比向量化实现与旧版 iterrows 实现
+- 校验两者输出逐字节一致 (含 NaN、负零、.xx5 边界、整数/布尔列等)
+- 打印不同窗口长度下的耗时与加速比
+用法(项目根目录)：python -m test.bench_compact_csv
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+SRC_DIR = Path(__file__).resolve().parents[1] / "src"
+sys.path.insert(0, str(SRC_DIR))
+
+import data_loader  # noqa: E402
+from data_loader import TRUSTED_COLS, SHORT_COL_MAP, get_dataset, _compact_csv_from_df  # noqa: E402
+
+
+def legacy_compact_csv_from_df(df: pd.DataFrame, cols: list) -> str:
+    """
+    向量化之前的实现, 原样保留作为对照
+    """
+    if df.empty:
+        return ''
+
+    valid_cols = [c for c in cols if c in df.columns]
+    if not valid_cols:
+        return ''
+
+    dfc = df[valid_cols].copy()
+
+    if 'timestamp' in dfc.columns:
+        dfc['timestamp'] = pd.to_datetime(dfc['timestamp']).dt.strftime('%m-%d %H:%M')
+
+    def fmt_num(x):
+        if pd.isna(x):
+            return ''
+        if isinstance(x, (int, np.integer)):
+            return str(int(x))
+        try:
+            s = f"{float(round(float(x), 2)):.2f}"
+            if '.' in s:
+                s = s.rstrip('0').rstrip('.')
+            return s
+        except Exception:
+            return str(x)
+
+    for c in dfc.columns:
+        if c != 'timestamp' and pd.api.types.is_numeric_dtype(dfc[c].dtype):
+            dfc[c] = dfc[c].map(fmt_num)
+
+    header = [SHORT_COL_MAP.get(c, c) for c in dfc.columns]
+    rows = [','.join(header)]
+    for _, row in dfc.iterrows():
+        vals = [str(row[c]) if not pd.isna(row[c]) else '' for c in dfc.columns]
+        rows.append(','.join(vals))
+    return '\n'.join(rows)
+
+
+def synthetic_frame(hours: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "timestamp": pd.date_range("2025-01-10", periods=hours, freq="h"),
+        "temp": np.round(rng.normal(20, 8, hours), 1),
+        "humidity": rng.uniform(5, 100, hours),
+        "rain": np.round(rng.gamma(0.3, 2.0, hours), 2),
+        "solar": rng.uniform(-1, 900, hours),
+        "soil_water": np.round(rng.uniform(10, 45, hours), 2),
+    })
+    return df
+
+
+def edge_case_frames() -> list:
+    floats = [0.125, 2.675, 1.005, -0.001, -0.0, 0.0, 0.5, 1.5, 2.5, -2.345, 1e12, -1e12,
+              np.inf, -np.inf, np.nan, 9.995, 0.015, 123456.785, 1e-9, 33.3]
+    n = len(floats)
+    ts = pd.Series(pd.date_range("2025-03-01 06:30", periods=n, freq="37min"))
+    ts.iloc[3] = pd.NaT
+    return [
+        pd.DataFrame({"timestamp": ts, "temp": floats, "rain": np.arange(n), "solar": [True, False] * (n // 2)}),
+        pd.DataFrame({"temp": floats, "humidity": ["a", None] * (n // 2)}),
+        pd.DataFrame({"timestamp": ts, "soil_water": pd.array([1, None] * (n // 2), dtype="Int64")}),
+    ]
+
+
+def check_equivalence(frames: list) -> int:
+    failures = 0
+    for i, df in enumerate(frames):
+        cols = TRUSTED_COLS + [c for c in df.columns if c not in TRUSTED_COLS]
+        new = _compact_csv_from_df(df, cols)
+        old = legacy_compact_csv_from_df(df, cols)
+        if new.encode("utf-8") != old.encode("utf-8"):
+            failures += 1
+            print(f"[MISMATCH] frame #{i}")
+            for a, b in zip(old.splitlines(), new.splitlines()):
+                if a != b:
+                    print(f"  legacy: {a}\n  new:    {b}")
+                    break
+    return failures
+
+
+def time_call(fn, df, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(df, TRUSTED_COLS)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="紧凑 CSV 编码器基准")
+    parser.add_argument("--hours", nargs="+", type=int, default=[24, 168, 720, 8760])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    frames = edge_case_frames() + [synthetic_frame(h, seed=h) for h in args.hours]
+    try:
+        frames.append(get_dataset(data_loader.DATA_FILE_PATH))
+    except Exception as e:
+        print(f"跳过 demo 数据文件: {e}")
+
+    failures = check_equivalence(frames)
+    print(f"逐字节一致性: {len(frames) - failures}/{len(frames)} 个数据帧一致")
+
+    print(f"{'hours':>8} {'legacy_ms':>12} {'vector_ms':>12} {'speedup':>8}")
+    for h in args.hours:
+        df = synthetic_frame(h, seed=h)
+        t_old = time_call(legacy_compact_csv_from_df, df, args.repeat)
+        t_new = time_call(_compact_csv_from_df, df, args.repeat)
+        print(f"{h:>8} {t_old * 1e3:>12.2f} {t_new * 1e3:>12.2f} {t_old / t_new:>7.1f}x")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
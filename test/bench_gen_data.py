@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+demo 数据生成器基准：对比批量向量化模拟 (BatchSimulator) 与逐小时循环 (gen)
+- 统计等价性：多次独立运行的各变量均值/标准差、降雨小时占比、雨时平均雨强, 给出两者差异
+- 耗时：gen 逐站点循环 vs BatchSimulator 一次模拟全部站点
+用法(项目根目录)：python -m test.bench_gen_data --stations 200 --days 365
+"""
+
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from .gen_data import gen, BatchSimulator
+from .gen_data_config import DEFAULT_STORYLINE, RNG
+
+VARS = ["temp", "humidity", "rain", "solar", "soil_water"]
+
+
+def describe(arrays: dict) -> dict:
+    """
+    arrays: {列名: (runs, hours)}, 返回按小时序列汇总的统计量
+    """
+    out = {}
+    for c in VARS:
+        out[f"{c}_mean"] = float(np.mean(arrays[c]))
+        out[f"{c}_std"] = float(np.std(arrays[c]))
+    rain = arrays["rain"]
+    out["rain_hours_frac"] = float(np.mean(rain > 0))
+    out["rain_wet_mean"] = float(rain[rain > 0].mean()) if (rain > 0).any() else 0.0
+    return out
+
+
+def legacy_runs(storyline, runs: int, seed: int) -> dict:
+    np.random.seed(seed)
+    frames = [gen(storyline) for _ in range(runs)]
+    return {c: np.stack([df[c].to_numpy() for df in frames]) for c in VARS}
+
+
+def batch_runs(storyline, runs: int, seed: int) -> dict:
+    chunk = BatchSimulator(storyline, stations=runs, seed=seed).run()
+    return {c: chunk[c] for c in VARS}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="demo 数据生成器基准")
+    parser.add_argument("--runs", type=int, default=400, help="统计对比时每种实现的独立运行次数")
+    parser.add_argument("--stations", type=int, default=200, help="耗时对比的站点数")
+    parser.add_argument("--days", type=float, default=365, help="耗时对比的模拟天数")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="相对差异告警阈值")
+    args = parser.parse_args(argv)
+    seed = RNG.get("seed", 2026)
+
+    # 统计等价性
+    legacy = describe(legacy_runs(DEFAULT_STORYLINE, args.runs, seed))
+    batch = describe(batch_runs(DEFAULT_STORYLINE, args.runs, seed))
+    print(f"{'stat':>20} {'legacy':>10} {'batch':>10} {'rel_diff':>9}")
+    flagged = 0
+    for k in legacy:
+        rel = abs(batch[k] - legacy[k]) / max(abs(legacy[k]), 1e-9)
+        mark = " !" if rel > args.tolerance else ""
+        flagged += bool(mark)
+        print(f"{k:>20} {legacy[k]:>10.3f} {batch[k]:>10.3f} {rel:>9.3f}{mark}")
+
+    # 耗时：gen 按单站点测量后外推
+    storyline = [("normal_spring", args.days)]
+    np.random.seed(seed)
+    t0 = time.perf_counter()
+    gen(storyline)
+    t_legacy = (time.perf_counter() - t0) * args.stations
+    t0 = time.perf_counter()
+    sim = BatchSimulator(storyline, stations=args.stations, seed=seed)
+    for _ in sim.iter_chunks(24 * 30):
+        pass
+    t_batch = time.perf_counter() - t0
+    hours = int(args.days * 24)
+    print(f"\n{args.stations} 站点 x {hours} 小时: gen ≈ {t_legacy:.2f}s (单站点外推), "
+          f"BatchSimulator {t_batch:.2f}s, 加速 {t_legacy / t_batch:.0f}x")
+    return 1 if flagged else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+规则引擎基准：向量化 RuleEngine.evaluate_windows 与逐设备循环对比
+- 用 BatchSimulator 生成 N 个站点的最近窗口 (多个剧情轮流分配, 保证各类规则都有命中)
+- 逐设备循环: 每个站点单独组成 (1, hours) 窗口调用一次引擎, 相当于向量化之前逐设备评估
+- 校验两者的告警完全一致, 不一致时以非零状态码退出
+- 端到端 (--fleet): 在临时 DATA_DIR 下为每个站点写一个列式存储, 计时 GET /alerts 的完整路径
+  (data_loader.read_fleet_windows 读取 + evaluate_windows), 确认扫描不写入数据集缓存,
+  并与逐设备 ColumnStore.read + evaluate_frames 的结果比对
+用法(项目根目录)：python -m test.bench_rules --stations 1000 5000 20000 --hours 24 --fleet 1000 5000
+"""
+
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from .gen_data import BatchSimulator  # noqa: E402
+from src.rules import RuleEngine  # noqa: E402
+from src.config import ALERT_RULES  # noqa: E402
+from src.column_store import ColumnStore  # noqa: E402
+import data_loader  # noqa: E402
+
+STORYLINES = ["normal_spring", "summer_heatwave", "rainy_season", "sudden_cooling", "typhoon_heavy"]
+
+
+def make_windows(stations: int, hours: int, variables: list) -> dict:
+    """
+    每个剧情模拟一批站点, 拼成 {var: (stations, hours)}
+    """
+    parts = np.array_split(np.arange(stations), len(STORYLINES))
+    blocks = []
+    for scene, idx in zip(STORYLINES, parts):
+        if len(idx) == 0:
+            continue
+        days = hours // 24 + 1
+        chunk = BatchSimulator([(scene, days)], stations=len(idx)).run()
+        blocks.append({v: chunk[v][:, -hours:] for v in variables})
+    return {v: np.concatenate([b[v] for b in blocks]) for v in variables}
+
+
+def loop_evaluate(engine: RuleEngine, windows: dict) -> list:
+    n = len(next(iter(windows.values())))
+    return [engine.evaluate_windows({v: x[i:i + 1] for v, x in windows.items()})[0] for i in range(n)]
+
+
+def write_fleet(out_dir: str, stations: int, days: int) -> list:
+    """
+    每个站点写一个 {key}.cols, 剧情轮流分配; 返回 device_key 列表
+    """
+    keys, parts = [], np.array_split(np.arange(stations), len(STORYLINES))
+    for scene, idx in zip(STORYLINES, parts):
+        if len(idx) == 0:
+            continue
+        chunk = BatchSimulator([(scene, days)], stations=len(idx)).run()
+        for row, station in enumerate(idx):
+            key = f"st{station:05d}"
+            df = pd.DataFrame({"timestamp": chunk["timestamp"],
+                               **{c: chunk[c][row] for c in ("temp", "humidity", "rain", "solar", "soil_water")}})
+            ColumnStore.create(str(Path(out_dir) / f"{key}.cols"), df)
+            keys.append(key)
+    return sorted(keys)
+
+
+def bench_fleet(engine: RuleEngine, stations: int, hours: int, days: int, repeat: int) -> bool:
+    out_dir = tempfile.mkdtemp(prefix="bench_rules_")
+    try:
+        t0 = time.perf_counter()
+        keys = write_fleet(out_dir, stations, days)
+        write_s = time.perf_counter() - t0
+        data_loader.DATA_DIR = out_dir
+        keys = data_loader.list_device_keys()
+        reference = None  # 默认 REFERENCE_TIMESTAMP 不在模拟数据范围内时取最新窗口
+        data_loader.REFERENCE_TIMESTAMP = None
+        before = data_loader.dataset_cache_stats()
+
+        best_load = best_eval = float("inf")
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            windows, errors = data_loader.read_fleet_windows(keys, hours, reference, engine.variables)
+            t1 = time.perf_counter()
+            vec = engine.evaluate_windows(windows)
+            t2 = time.perf_counter()
+            best_load, best_eval = min(best_load, t1 - t0), min(best_eval, t2 - t1)
+        after = data_loader.dataset_cache_stats()
+
+        frames = [ColumnStore(str(Path(out_dir) / f"{k}.cols")).read() for k in keys]
+        same = not errors and vec == engine.evaluate_frames(frames, hours)
+        untouched = after["entries"] == before["entries"] and after["misses"] == before["misses"]
+        print(f"[fleet {len(keys)} stores x {days}d, window {hours}h] load {best_load * 1e3:.1f}ms + "
+              f"evaluate {best_eval * 1e3:.2f}ms = {(best_load + best_eval) * 1e3:.1f}ms "
+              f"({(best_load + best_eval) / len(keys) * 1e6:.0f}us/device), write {write_s:.1f}s, "
+              f"cache entries {before['entries']}->{after['entries']}, bypassed +{after['bypassed'] - before['bypassed']}, "
+              f"{'一致' if same else '不一致'}{'' if untouched else ', 缓存被写入'}")
+        return same and untouched
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="规则引擎向量化基准")
+    parser.add_argument("--stations", nargs="+", type=int, default=[1000, 5000, 20000])
+    parser.add_argument("--hours", type=int, default=24)
+    parser.add_argument("--repeat", type=int, default=3, help="向量化评估重复次数, 取最快一次")
+    parser.add_argument("--fleet", nargs="*", type=int, default=[], help="端到端测试的列式存储设备数")
+    parser.add_argument("--history-days", type=int, default=30, help="端到端测试每个设备的历史天数")
+    args = parser.parse_args(argv)
+
+    engine = RuleEngine(ALERT_RULES)
+    ok = True
+    for n in args.stations:
+        windows = make_windows(n, args.hours, engine.variables)
+
+        best = float("inf")
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            vec = engine.evaluate_windows(windows)
+            best = min(best, time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        loop = loop_evaluate(engine, windows)
+        loop_s = time.perf_counter() - t0
+
+        same = vec == loop
+        ok &= same
+        alerting = sum(1 for a in vec if a)
+        print(f"[{n} stations x {args.hours}h] vectorized {best * 1e3:.2f}ms, loop {loop_s * 1e3:.1f}ms, "
+              f"x{loop_s / best:.1f}, alerting {alerting}, alerts {sum(map(len, vec))}, "
+              f"{'一致' if same else '不一致'}")
+    for n in args.fleet:
+        ok &= bench_fleet(engine, n, args.hours, args.history_days, args.repeat)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,14 @@
+"""
+单元测试公共设置
+src 下的模块既有包内相对导入 (src.app / src.llm_service ...), 也有 data_loader 的绝对导入 (from config import ...),
+因此项目根目录与 src 都加入 sys.path
+用法(项目根目录)：python -m pytest -q test
+"""
+
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+for p in (ROOT_DIR / "src", ROOT_DIR):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
@@ -11,6 +11,7 @@ import argparse
 
 from .gen_data_config import SCENARIOS, DEFAULT_STORYLINE, OUTPUT, RNG, SOIL, ET, INFILTRATION, MEMORY, SLOW_CYCLE, RAIN_MODEL, PLOT_SETTINGS
 from .plot_utils import plot_sequence
+from src.column_store import ColumnStore
 
 # 工具函数
 def diurnal_temp(hour, amp, phase_shift=8):
@@ -238,6 +239,167 @@ def gen(timeline_config, start_date="2025-01-10"):
     })
     return df
 
+# 批量向量化生成
+class BatchSimulator:
+    """
+    N 个独立站点同时模拟，状态为长度 N 的向量，输出形状为 (stations, hours)
+    - 与 gen 相同的马尔可夫降雨、AR(1) 更新与土壤水桶模型，只在站点维度上向量化
+    - 随机数来自 np.random.Generator (默认由 RNG["seed"] 构造)，相同 seed 结果可复现；
+      均匀/正态/Gamma 各用一个由同一 SeedSequence 派生的 Generator，结果与分块大小无关
+    - 有状态：iter_chunks 逐块推进并产出结果，块之间状态连续
+    """
+
+    def __init__(self, timeline_config, stations=1, start_date="2025-01-10", seed=None):
+        cfgs, tags = [], []
+        for scene_key, days in timeline_config:
+            if scene_key not in SCENARIOS:
+                raise ValueError(f"Unknown: {scene_key}")
+            hours = int(days * 24)
+            cfgs.extend([SCENARIOS[scene_key]] * hours)
+            tags.extend([scene_key] * hours)
+        if not cfgs:
+            raise ValueError("剧情为空")
+
+        self.stations = int(stations)
+        self.total_hours = len(cfgs)
+        self.dates = pd.date_range(start=start_date, periods=self.total_hours, freq="h")
+        self.scene_tags = np.array(tags, dtype=object)
+        seq = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(RNG.get("seed", 2026) if seed is None else seed)
+        self._rng_u, self._rng_z, self._rng_g = [np.random.default_rng(s) for s in seq.spawn(3)]
+        self.pos = 0
+
+        # 每小时的场景参数与确定性目标 (与站点无关)
+        idx = np.arange(self.total_hours)
+        hour_of_day = idx % 24
+        temp_base = np.array([c["temp_base"] for c in cfgs], dtype=float)
+        temp_amp = np.array([c["temp_amp"] for c in cfgs], dtype=float)
+        self.rain_prob = np.array([c["rain_prob"] for c in cfgs], dtype=float)
+        self.rain_intensity = np.array([c["rain_intensity"] for c in cfgs], dtype=float)
+
+        self.base_t = temp_base + diurnal_temp(hour_of_day, temp_amp) + slow_cycle(idx, SLOW_CYCLE["slow_period"], SLOW_CYCLE["slow_amp_temp"])
+        slow_s = slow_cycle(idx, SLOW_CYCLE["slow_period"], SLOW_CYCLE["slow_amp_solar"])
+        daylight = (hour_of_day >= 7.5) & (hour_of_day <= 19.5)
+        base_solar_day = np.maximum(0.0, 800.0 * np.sin(np.pi * (hour_of_day - 7.5) / 12.0))
+        self.base_solar = np.where(daylight, np.maximum(0.0, base_solar_day + slow_s), 0.0)
+        self.base_humidity = 80 - 1.0 * (self.base_t - 15.0) + slow_cycle(idx, SLOW_CYCLE["slow_period"], SLOW_CYCLE["slow_amp_humidity"])
+        self.solar_on = (hour_of_day >= 6) & (hour_of_day <= 18)
+
+        # 站点状态向量
+        n = self.stations
+        self.soil_water = np.full(n, float(cfgs[0]["init_soil_water"]))
+        self.is_raining = np.zeros(n, dtype=bool)
+        self.rain = np.zeros(n)
+        self.temp = np.full(n, float(cfgs[0]["temp_base"]))
+        self.solar = np.zeros(n)
+        self.humidity = np.full(n, 60.0)
+        self.cloud = np.full(n, 0.1)
+
+    def step_chunk(self, hours):
+        """
+        推进 hours 小时，返回 {列名: (stations, hours) 数组}，以及 timestamp / scene_tag (hours,)
+        """
+        lo = self.pos
+        hi = min(self.total_hours, lo + int(hours))
+        k, n = hi - lo, self.stations
+        out = {c: np.empty((n, k)) for c in ("temp", "humidity", "rain", "solar", "soil_water")}
+
+        # 整块预先抽取随机数
+        u = self._rng_u.random((k, 3, n))                # 降雨起停 / 云 / 雨时湿度
+        z = self._rng_z.standard_normal((k, 4, n))       # 温度目标 / 温度 / 光照 / 湿度噪声
+        g = self._rng_g.standard_gamma(RAIN_MODEL["gamma_shape"], (k, n))
+
+        p_stop = RAIN_MODEL["base_stop_prob"]
+        start_scale = RAIN_MODEL["start_scale"]
+        runoff_scale = RAIN_MODEL["runoff_scale"]
+        max_runoff_frac = RAIN_MODEL["max_runoff_frac"]
+        a_t, a_s, a_h, a_c = MEMORY["alpha_temp"], MEMORY["alpha_solar"], MEMORY["alpha_humidity"], MEMORY["alpha_cloud"]
+        fc, wilt, sat = SOIL["soil_water_fc"], SOIL["soil_water_wilt"], SOIL["soil_water_sat"]
+
+        for j in range(k):
+            i = lo + j
+            intensity = self.rain_intensity[i]
+
+            # 马尔可夫降雨
+            target = g[j] * (intensity / 2.0)
+            cont = self.is_raining & (u[j, 0] >= p_stop)
+            start = ~self.is_raining & (u[j, 0] < self.rain_prob[i] * start_scale)
+            smoothed = np.where(self.rain > 0, 0.7 * self.rain + 0.3 * target, target)
+            self.rain = np.round(np.where(cont, smoothed, np.where(start, target, 0.0)), 2)
+            self.is_raining = cont | start
+            wet = self.rain > 0.1
+
+            # 云
+            cloud_target = np.where(wet, 0.80 + 0.10 * u[j, 1], np.minimum(0.05 + 0.35 * u[j, 1], 0.6))
+            self.cloud = np.clip(a_c * self.cloud + (1.0 - a_c) * cloud_target, 0.0, 0.99)
+            s_target = self.base_solar[i] * np.maximum(0.0, 1.0 - self.cloud ** 1.5)
+
+            # 湿度与温度目标
+            soil_effect = np.where(self.soil_water > fc, 0.015, 0.01) * (self.soil_water - fc)
+            cooling = 2.0 + np.minimum(3.0, self.rain / max(0.1, intensity + 1e-6) * 2.0)
+            t_target = np.where(wet, self.base_t[i] - cooling, self.base_t[i] + 0.3 * z[j, 0])
+            h_target = np.where(wet, 85.0 + 15.0 * u[j, 2], np.clip(self.base_humidity[i] + soil_effect, 5.0, 99.0))
+
+            # AR(1)
+            self.temp = a_t * self.temp + (1.0 - a_t) * t_target + 0.5 * z[j, 1]
+            solar = a_s * self.solar + (1.0 - a_s) * s_target + 5.0 * z[j, 2]
+            self.solar = np.maximum(0.0, solar) if self.solar_on[i] else np.zeros(n)
+            self.humidity = np.clip(a_h * self.humidity + (1.0 - a_h) * h_target + 0.5 * z[j, 3], 5.0, 100.0)
+
+            # 土壤入渗与蒸散
+            runoff = np.clip(self.rain / (self.rain + runoff_scale), 0.0, max_runoff_frac)
+            inflow = np.where(self.rain > 0.0, self.rain * INFILTRATION["base_rate"] * (1.0 - 0.5 * runoff), 0.0)
+            solar_scale = np.where(self.solar > 0, self.solar / 200.0, 0.0)
+            temp_scale = np.maximum(0.5, 1.0 + 0.2 * (self.temp - 20.0))
+            et = np.where(self.solar > 100, ET["day"], ET["night"]) * (0.7 + 0.3 * solar_scale) * temp_scale
+            et *= np.clip((self.soil_water - wilt) / (fc - wilt), 0.05, 1.0)
+            self.soil_water = np.clip(self.soil_water + inflow - et, 0.0, sat)
+
+            out["rain"][:, j] = self.rain
+            out["temp"][:, j] = self.temp
+            out["solar"][:, j] = self.solar
+            out["humidity"][:, j] = self.humidity
+            out["soil_water"][:, j] = self.soil_water
+
+        # 与 gen 相同的小数位
+        for c, nd in (("temp", 1), ("solar", 1), ("humidity", 1), ("soil_water", 2)):
+            np.round(out[c], nd, out=out[c])
+        self.pos = hi
+        out["timestamp"] = self.dates[lo:hi]
+        out["scene_tag"] = self.scene_tags[lo:hi]
+        return out
+
+    def iter_chunks(self, chunk_hours=24 * 30):
+        while self.pos < self.total_hours:
+            yield self.step_chunk(chunk_hours)
+
+    def run(self):
+        """
+        一次生成剩余全部小时
+        """
+        return self.step_chunk(self.total_hours - self.pos)
+
+def chunk_to_frame(chunk, station_ids=None):
+    """
+    (stations, hours) 结果展开为长表 DataFrame(station, timestamp, scene_tag, temp, humidity, rain, solar, soil_water)
+    """
+    n, k = chunk["temp"].shape
+    station_ids = np.arange(n) if station_ids is None else np.asarray(station_ids)
+    data = {
+        "station": np.repeat(station_ids, k),
+        "timestamp": np.tile(chunk["timestamp"].values, n),
+        "scene_tag": np.tile(chunk["scene_tag"], n),
+    }
+    for c in ("temp", "humidity", "rain", "solar", "soil_water"):
+        data[c] = chunk[c].reshape(-1)
+    return pd.DataFrame(data)
+
+def gen_batch(timeline_config, stations=1, start_date="2025-01-10", seed=None):
+    """
+    批量版 gen: 返回多站点长表
+    """
+    sim = BatchSimulator(timeline_config, stations=stations, start_date=start_date, seed=seed)
+    return chunk_to_frame(sim.run())
+
 # 保存/绘图/CLI
 def save_results(df, json_path: Path, csv_path: Path):
     json_path.parent.mkdir(parents=True, exist_ok=True)
@@ -249,10 +411,18 @@ def save_results(df, json_path: Path, csv_path: Path):
     df.to_csv(csv_path, index=False)
     return json_path, csv_path
 
+def save_columnar(df, cols_path: Path):
+    """
+    额外写出列式 memmap 存储 (只保留 data_loader 使用的列，场景标签不写入)
+    """
+    ColumnStore.create(str(cols_path), df)
+    return cols_path
+
 def main(argv=None):
     parser = argparse.ArgumentParser(description="生成demo气象与土壤水分时间序列（小时) ")
     parser.add_argument("--story", nargs="+", help="剧情: scene_name days ...，例如 normal_spring 2 rainy_season 3", default=None)
     parser.add_argument("--start", type=str, default="2025-01-10")
+    parser.add_argument("--columnar", action="store_true", help="同时写出列式存储 {TAG}.cols")
     args = parser.parse_args(argv)
 
     # 解析情景
@@ -281,6 +451,9 @@ def main(argv=None):
 
     # 保存数据
     save_results(df, json_path, csv_path)
+    if args.columnar:
+        save_columnar(df, OUTPUT["cols_path"])
+        print(f"Columnar: {OUTPUT['cols_path']}")
 
     # 绘图配置
     plot_cfg = dict(PLOT_SETTINGS)
@@ -11,10 +11,18 @@ OUTPUT = {
 
     "json_path": BASE_DIR / "output" / "pseudo_data" / f"{TAG}.json",
     "csv_path": BASE_DIR / "output" / "pseudo_data" / f"{TAG}.csv",
+    "cols_path": BASE_DIR / "output" / "pseudo_data" / f"{TAG}.cols",
     "pdf_path": BASE_DIR / "output" / "pseudo_data" / "plots" / f"{TAG}.pdf",
     "png_path": BASE_DIR / "output" / "pseudo_data" / "plots" / f"{TAG}.png",
 }
 
+# 批量夹具数据 (python -m test.gen_fixtures)
+FIXTURES = {
+    "out_dir": BASE_DIR / "output" / "fixtures",
+    "block_stations": 64,      # 每个任务模拟的站点数
+    "chunk_hours": 24 * 30,    # 每次推进并写出的小时数
+}
+
 RNG = {
     "seed": 2026
 }
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+并行批量生成多站点、多剧情的 demo 数据，用于 loader/缓存层基准
+- 剧情 0 为 DEFAULT_STORYLINE (或 --story)，其余为其场景段的确定性随机重排；--repeat 把剧情重复多次拉长时间
+- 每个 (剧情, 站点块) 是一个任务，在进程池中用 BatchSimulator 模拟
+- 每个任务的随机种子由 SeedSequence(RNG["seed"]).spawn 派生，结果与进程数无关
+- 逐块 (FIXTURES["chunk_hours"]) 写出，内存占用与总数据量无关：
+    jsonl    每个任务一个 .jsonl 文件，每行一条记录 (含 station 字段)
+    columnar 每个站点一个 {station}.cols 列式存储，可直接作为 DATA_DIR 设备目录
+用法(项目根目录)：python -m test.gen_fixtures --stations 1000 --storylines 4 --repeat 26 --workers 8 --format columnar
+"""
+
+import os
+import json
+import time
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from .gen_data import BatchSimulator, chunk_to_frame
+from .gen_data_config import SCENARIOS, DEFAULT_STORYLINE, RNG, FIXTURES
+from src.column_store import ColumnStore
+
+VARS = ["temp", "humidity", "rain", "solar", "soil_water"]
+
+
+def build_storylines(count, base, seed, repeat=1):
+    """
+    剧情 0 为 base 重复 repeat 次；其余剧情每次重复都对 base 的场景段做一次随机重排
+    """
+    rng = np.random.default_rng(seed)
+    storylines = [list(base) * repeat]
+    for _ in range(1, count):
+        story = []
+        for _ in range(repeat):
+            story.extend(base[i] for i in rng.permutation(len(base)))
+        storylines.append(story)
+    return storylines
+
+
+def station_id(story_idx, station_idx):
+    return f"st{story_idx:02d}-{station_idx:05d}"
+
+
+def _write_jsonl(path, chunk, ids):
+    df = chunk_to_frame(chunk, ids)
+    df["timestamp"] = df["timestamp"].dt.strftime("%Y-%m-%d %H:%M:%S")
+    with open(path, "a", encoding="utf-8") as f:
+        df.to_json(f, orient="records", lines=True, force_ascii=False)
+    return len(df)
+
+
+def _write_columnar(out_dir, chunk, ids, first):
+    # 第一块重建存储 (覆盖之前运行的结果), 之后的块追加
+    rows = 0
+    for i, sid in enumerate(ids):
+        df = pd.DataFrame({"timestamp": chunk["timestamp"], **{c: chunk[c][i] for c in VARS}})
+        path = os.path.join(out_dir, f"{sid}.cols")
+        if first:
+            rows += len(ColumnStore.create(path, df, VARS))
+        else:
+            rows += ColumnStore(path).append(df)
+    return rows
+
+
+def run_unit(unit):
+    """
+    进程池任务：模拟一个 (剧情, 站点块) 并逐块写出，返回统计信息
+    """
+    t0 = time.perf_counter()
+    ids = [station_id(unit["story"], s) for s in range(unit["first_station"], unit["first_station"] + unit["stations"])]
+    sim = BatchSimulator(unit["storyline"], stations=unit["stations"], start_date=unit["start"], seed=unit["seed"])
+    rows = 0
+    if unit["format"] == "jsonl":
+        path = os.path.join(unit["out_dir"], f"story{unit['story']:02d}_block{unit['block']:04d}.jsonl")
+        if os.path.exists(path):
+            os.remove(path)
+        for chunk in sim.iter_chunks(unit["chunk_hours"]):
+            rows += _write_jsonl(path, chunk, ids)
+    else:
+        path = unit["out_dir"]
+        for k, chunk in enumerate(sim.iter_chunks(unit["chunk_hours"])):
+            rows += _write_columnar(path, chunk, ids, first=k == 0)
+    return {"story": unit["story"], "block": unit["block"], "stations": unit["stations"],
+            "rows": rows, "path": str(path), "seconds": round(time.perf_counter() - t0, 3)}
+
+
+def plan_units(storylines, stations, block_stations, seed, fmt, out_dir, start, chunk_hours):
+    blocks = [(b, min(block_stations, stations - b)) for b in range(0, stations, block_stations)]
+    seeds = np.random.SeedSequence(seed).spawn(len(storylines) * len(blocks))
+    units = []
+    for s, story in enumerate(storylines):
+        for k, (first, n) in enumerate(blocks):
+            units.append({
+                "story": s, "block": k, "first_station": first, "stations": n,
+                "storyline": story, "seed": seeds[s * len(blocks) + k],
+                "format": fmt, "out_dir": str(out_dir), "start": start, "chunk_hours": chunk_hours,
+            })
+    return units
+
+
+def _parse_story(tokens):
+    it = iter(tokens)
+    storyline = []
+    for scene in it:
+        try:
+            days = float(next(it))
+        except StopIteration:
+            raise ValueError("story 参数需成对出现: scene days")
+        if scene not in SCENARIOS:
+            raise ValueError(f"Unknown: {scene}")
+        storyline.append((scene, days))
+    return storyline
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="并行批量生成多站点、多剧情 demo 数据")
+    parser.add_argument("--stations", type=int, default=64, help="每个剧情的站点数")
+    parser.add_argument("--storylines", type=int, default=1, help="剧情数 (0 号为基础剧情)")
+    parser.add_argument("--story", nargs="+", default=None, help="基础剧情: scene_name days ...")
+    parser.add_argument("--repeat", type=int, default=1, help="剧情重复次数")
+    parser.add_argument("--start", type=str, default="2025-01-10")
+    parser.add_argument("--format", choices=["jsonl", "columnar"], default="jsonl")
+    parser.add_argument("--out-dir", type=str, default=str(FIXTURES["out_dir"]))
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--block-stations", type=int, default=FIXTURES["block_stations"])
+    parser.add_argument("--chunk-hours", type=int, default=FIXTURES["chunk_hours"])
+    parser.add_argument("--seed", type=int, default=RNG.get("seed", 2026))
+    args = parser.parse_args(argv)
+
+    base = _parse_story(args.story) if args.story else DEFAULT_STORYLINE
+    storylines = build_storylines(args.storylines, base, args.seed, args.repeat)
+    out_dir = Path(args.out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    units = plan_units(storylines, args.stations, max(1, args.block_stations), args.seed,
+                       args.format, out_dir, args.start, args.chunk_hours)
+
+    t0 = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = [pool.submit(run_unit, u) for u in units]
+        for fut in as_completed(futures):
+            r = fut.result()
+            results.append(r)
+            print(f"[{len(results)}/{len(units)}] story {r['story']} block {r['block']}: {r['rows']} 行, {r['seconds']}s")
+    elapsed = time.perf_counter() - t0
+
+    results.sort(key=lambda r: (r["story"], r["block"]))
+    total_rows = sum(r["rows"] for r in results)
+    manifest = {
+        "seed": args.seed,
+        "format": args.format,
+        "start": args.start,
+        "stations_per_storyline": args.stations,
+        "storylines": storylines,
+        "units": results,
+        "total_rows": total_rows,
+    }
+    with open(out_dir / "manifest.json", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    print(f"共 {total_rows} 行, {elapsed:.1f}s ({total_rows / max(elapsed, 1e-9):.0f} 行/s) -> {out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+/chat HTTP 压测：启动本地 stub LLM 与 FastAPI app (各自独立进程), 按目标 RPS 开环发压
+- stub LLM 可配置固定延迟与生成速度 (--llm-latency / --token-rate), app 的 DEEPSEEK_BASE_URL 指向它
+- 请求混合 include_forecast 与 reference_time (取自 --data-file 的时间范围, app 同样以它为 DATA_FILE_PATH), 默认问题各不相同以绕过回复缓存
+- 请求按计划时刻发出, 延迟从计划时刻算起 (排队时间计入, 不受协同遗漏影响)
+- app 进程内挂一个事件循环延迟探针 (每 10ms 一次 sleep, 记录超出的时间)
+每档 RPS 输出吞吐、成功率、延迟 p50/p90/p99/max 与事件循环延迟, 结果以 JSON 输出
+用法(项目根目录)：python -m test.load_chat --rps 5 10 20 40 --duration 20 --llm-latency 1.0 --token-rate 50
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import subprocess
+from collections import deque
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+LAG_INTERVAL = 0.01
+QUESTIONS = ["果树要不要浇水？", "最近适合施肥吗？", "需要防冻吗？", "明天会下雨吗，要排水吗？"]
+
+
+# ---- app 进程：在 src.app 上挂事件循环延迟探针后启动 uvicorn ----
+
+def serve_app(port: int) -> None:
+    import uvicorn
+    sys.path.insert(0, str(ROOT_DIR / "src"))
+    from src.app import app
+
+    samples = deque(maxlen=200000)
+    state = {"task": None}
+
+    async def monitor():
+        loop = asyncio.get_running_loop()
+        while True:
+            t = loop.time()
+            await asyncio.sleep(LAG_INTERVAL)
+            samples.append(max(0.0, loop.time() - t - LAG_INTERVAL))
+
+    @app.post("/_loadtest/lag/reset")
+    async def lag_reset():
+        if state["task"] is None:
+            state["task"] = asyncio.get_running_loop().create_task(monitor())
+        samples.clear()
+        return {"ok": True}
+
+    @app.get("/_loadtest/lag")
+    async def lag():
+        return {"samples": len(samples), **percentiles(list(samples), prefix="lag_")}
+
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+# ---- 压测端 ----
+
+def percentiles(samples: list, prefix: str = "") -> dict:
+    if not samples:
+        return {f"{prefix}p50_ms": None, f"{prefix}p90_ms": None, f"{prefix}p99_ms": None, f"{prefix}max_ms": None}
+    arr = np.asarray(samples) * 1e3
+    return {
+        f"{prefix}p50_ms": round(float(np.percentile(arr, 50)), 2),
+        f"{prefix}p90_ms": round(float(np.percentile(arr, 90)), 2),
+        f"{prefix}p99_ms": round(float(np.percentile(arr, 99)), 2),
+        f"{prefix}max_ms": round(float(arr.max()), 2),
+    }
+
+
+def reference_times(data_file: str, hours: int = 24) -> list:
+    """
+    数据文件中前后至少留出 hours 小时的整点时间, 作为 reference_time 候选
+    """
+    with open(data_file, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    records = raw["data"] if isinstance(raw, dict) else raw
+    stamps = sorted(r["timestamp"] for r in records if r.get("timestamp"))
+    return stamps[hours:-hours] or stamps
+
+
+def _spawn(args: list, env: dict) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable] + args, cwd=ROOT_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+async def _wait_ready(url: str, proc: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if proc.poll() is not None:
+                raise RuntimeError(f"进程提前退出: {proc.stderr.read().decode(errors='replace')[-2000:]}")
+            try:
+                if (await client.get(url, timeout=1.0)).status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise TimeoutError(f"等待服务就绪超时: {url}")
+
+
+async def run_step(client: httpx.AsyncClient, rps: float, duration: float, refs: list, rng: random.Random,
+                   unique: bool, forecast_ratio: float, timeout: float) -> dict:
+    """
+    开环发压: 第 i 个请求计划在 start + i/rps 发出
+    """
+    await client.post("/_loadtest/lag/reset")
+    n = max(1, int(rps * duration))
+    latencies, errors = [], {}
+    loop = asyncio.get_running_loop()
+    start = loop.time() + 0.05
+
+    async def one(i: int):
+        scheduled = start + i / rps
+        await asyncio.sleep(max(0.0, scheduled - loop.time()))
+        q = rng.choice(QUESTIONS)
+        payload = {
+            "message": f"{q} #{i}-{rps}" if unique else q,
+            "reference_time": rng.choice(refs),
+            "include_forecast": rng.random() < forecast_ratio,
+        }
+        try:
+            resp = await client.post("/chat", json=payload, timeout=timeout)
+            if resp.status_code != 200:
+                errors[f"http_{resp.status_code}"] = errors.get(f"http_{resp.status_code}", 0) + 1
+                return
+            latencies.append(loop.time() - scheduled)
+        except httpx.HTTPError as e:
+            errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+
+    await asyncio.gather(*(one(i) for i in range(n)))
+    elapsed = loop.time() - start
+    lag = (await client.get("/_loadtest/lag")).json()
+    return {
+        "target_rps": rps,
+        "sent": n,
+        "ok": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "elapsed_s": round(elapsed, 2),
+        **percentiles(latencies),
+        "event_loop": lag,
+    }
+
+
+async def run(args) -> dict:
+    stub_port, app_port = args.stub_port, args.app_port
+    env = dict(os.environ)
+    env.update({
+        "DEEPSEEK_BASE_URL": f"http://127.0.0.1:{stub_port}",
+        "DEEPSEEK_API_KEY": "stub",
+        "PYTHONUNBUFFERED": "1",
+        # app 读取的数据与 reference_time 的取样来源一致
+        "DATA_FILE_PATH": str(Path(args.data_file).resolve()),
+    })
+    procs = [
+        _spawn(["-m", "test.stub_llm", "--port", str(stub_port), "--latency", str(args.llm_latency),
+                "--token-rate", str(args.token_rate)], env),
+        _spawn(["-m", "test.load_chat", "--serve-app", str(app_port)], env),
+    ]
+    try:
+        await _wait_ready(f"http://127.0.0.1:{stub_port}/stats", procs[0])
+        await _wait_ready(f"http://127.0.0.1:{app_port}/status", procs[1])
+
+        refs = reference_times(args.data_file)
+        rng = random.Random(args.seed)
+        limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+        steps = []
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{app_port}", limits=limits) as client:
+            for rps in args.rps:
+                r = await run_step(client, rps, args.duration, refs, rng, not args.repeat_messages,
+                                   args.forecast_ratio, args.timeout)
+                steps.append(r)
+                print(f"[rps {rps}] ok {r['ok']}/{r['sent']}, {r['throughput_rps']} req/s, "
+                      f"p50 {r['p50_ms']}ms p99 {r['p99_ms']}ms, loop lag p99 {r['event_loop']['lag_p99_ms']}ms, "
+                      f"errors {r['errors']}", file=sys.stderr)
+            status = (await client.get("/status")).json()
+        async with httpx.AsyncClient() as c:
+            stub_stats = (await c.get(f"http://127.0.0.1:{stub_port}/stats")).json()
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+    return {
+        "config": {
+            "llm_latency_s": args.llm_latency,
+            "token_rate": args.token_rate,
+            "duration_s": args.duration,
+            "forecast_ratio": args.forecast_ratio,
+            "unique_messages": not args.repeat_messages,
+            "data_file": args.data_file,
+        },
+        "steps": steps,
+        "stub_requests": stub_stats.get("requests"),
+        "app_status": status,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="/chat HTTP 压测 (本地 stub LLM)")
+    parser.add_argument("--rps", nargs="+", type=float, default=[5, 10, 20, 40], help="依次测试的目标 RPS")
+    parser.add_argument("--duration", type=float, default=15, help="每档持续时间(秒)")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="stub LLM 固定延迟(秒)")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="stub LLM 每秒生成字符数, 0 表示不限")
+    parser.add_argument("--forecast-ratio", type=float, default=0.5, help="include_forecast=true 的比例")
+    parser.add_argument("--repeat-messages", action="store_true", help="问题不加序号, 允许命中回复缓存")
+    parser.add_argument("--data-file", type=str, default=str(ROOT_DIR / "output" / "pseudo_data" / "test.json"))
+    parser.add_argument("--stub-port", type=int, default=3101)
+    parser.add_argument("--app-port", type=int, default=3100)
+    parser.add_argument("--max-connections", type=int, default=1000)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=2026)
+    parser.add_argument("--out", type=str, default=None, help="结果 JSON 路径 (默认打印到标准输出)")
+    parser.add_argument("--serve-app", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.serve_app is not None:
+        serve_app(args.serve_app)
+        return 0
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        Path(args.out).write_text(text, encoding="utf-8")
+        print(f"已写入 {args.out}", file=sys.stderr)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+本地模拟物联网平台 (Downloader 所用 /app/* 接口), 用于离线测试批量/增量同步
+- POST /app/Login                登录, 返回 userId
+- GET  /app/GetUserDeviceGroups  设备分组
+- GET  /app/GetDeviceData        分组下设备
+- GET  /app/GetDeviceSoftParam   设备参数
+- GET  /app/QueryHistoryList     历史数据：每台设备 4 个节点, 每 10 分钟一条, 每条含 tem/hum 两个寄存器值
+    节点 1: 空气温湿度  节点 2: 雨量(tem)  节点 3: 光照(tem)  节点 4: 土壤温度/含水(tem/hum)
+  数据由 (deviceKey, 时间) 确定性生成, 同一区间重复查询结果一致; 偶尔夹带重复的报警记录
+可配置固定延迟与随机 5xx 失败率, 用于验证重试退避
+用法(项目根目录)：python -m test.mock_iot_server --port 9001 --devices 100
+"""
+
+import json
+import math
+import time
+import random
+import zlib
+import argparse
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+USER_ID = "mock-user-0001"
+RECORD_INTERVAL = timedelta(minutes=10)
+NODES = (1, 2, 3, 4)
+
+
+def _device_seed(device_key: str) -> int:
+    return zlib.crc32(device_key.encode("utf-8"))
+
+
+def _node_values(device_key: str, node_id: int, t: datetime) -> dict:
+    seed = _device_seed(device_key)
+    hours = t.timestamp() / 3600.0
+    hod = t.hour + t.minute / 60.0
+    phase = (seed % 24) / 24.0 * 2 * math.pi
+    noise = ((zlib.crc32(f"{device_key}|{node_id}|{t.isoformat()}".encode()) % 1000) / 1000.0 - 0.5)
+    if node_id == 1:
+        tem = 15 + 6 * math.sin(2 * math.pi * (hod - 8) / 24) + 2 * math.sin(hours / 240 + phase) + noise
+        hum = 70 - 10 * math.sin(2 * math.pi * (hod - 8) / 24) + 3 * noise
+        return {"tem": round(tem, 1), "hum": round(min(100.0, max(5.0, hum)), 1)}
+    if node_id == 2:
+        wet = math.sin(hours / 37 + phase) > 0.6
+        rain = max(0.0, (1.5 + noise) * (math.sin(hours / 37 + phase) - 0.6) * 5) if wet else 0.0
+        return {"tem": round(rain / 6, 2), "hum": 0.0}
+    if node_id == 3:
+        solar = max(0.0, 800 * math.sin(math.pi * (hod - 6.5) / 13)) if 6.5 <= hod <= 19.5 else 0.0
+        return {"tem": round(solar * (0.9 + 0.1 * noise), 1), "hum": 0.0}
+    vwc = 28 + 6 * math.sin(hours / 90 + phase) + 0.2 * noise
+    return {"tem": round(14 + 3 * math.sin(2 * math.pi * (hod - 10) / 24), 1), "hum": round(vwc, 2)}
+
+
+def generate_history(device_key: str, begin: datetime, end: datetime, node_id: int = -1) -> list:
+    start = datetime.fromtimestamp(math.ceil(begin.timestamp() / RECORD_INTERVAL.total_seconds()) * RECORD_INTERVAL.total_seconds())
+    nodes = NODES if node_id in (-1, None) else (node_id,)
+    records = []
+    t = start
+    while t <= end:
+        for n in nodes:
+            values = _node_values(device_key, n, t)
+            rec = {
+                "deviceKey": device_key,
+                "nodeId": n,
+                "recordTime": int(t.timestamp() * 1000),
+                "recordTimeStr": t.strftime("%Y-%m-%d %H:%M:%S"),
+                "isAlarmData": 0,
+                "lng": 112.98,
+                "lat": 28.19,
+                **values,
+            }
+            records.append(rec)
+            # 偶发报警：同一时刻再上报一条 isAlarmData=1 的重复记录
+            if (zlib.crc32(f"{device_key}{n}{rec['recordTime']}".encode()) % 97) == 0:
+                records.append({**rec, "isAlarmData": 1})
+        t += RECORD_INTERVAL
+    return records
+
+
+class MockState:
+    def __init__(self, devices: int = 10, latency: float = 0.0, fail_rate: float = 0.0):
+        self.devices = [f"MOCK{i:04d}" for i in range(devices)]
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.lock = threading.Lock()
+        self.requests = {}
+
+    def count(self, path: str) -> None:
+        with self.lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+
+def _make_handler(state: MockState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, obj, status: int = 200):
+            body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _preamble(self) -> bool:
+            path = urlparse(self.path).path
+            state.count(path)
+            if state.latency:
+                time.sleep(state.latency)
+            if state.fail_rate and random.random() < state.fail_rate:
+                self._send({"code": 5000, "message": "mock server error"}, status=503)
+                return False
+            return True
+
+        def _authorized(self) -> bool:
+            if self.headers.get("userId") != USER_ID:
+                self._send({"code": 1001, "message": "未登录或 userId 无效"})
+                return False
+            return True
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length) if length else b""
+            if not self._preamble():
+                return
+            if urlparse(self.path).path != "/app/Login":
+                self._send({"code": 404, "message": "not found"}, status=404)
+                return
+            try:
+                data = json.loads(body or b"{}")
+            except ValueError:
+                data = {}
+            if not data.get("loginName"):
+                self._send({"code": 1002, "message": "用户名或密码错误"})
+                return
+            self._send({"code": 1000, "message": "success",
+                        "data": {"userId": USER_ID, "userName": data["loginName"], "authList": ["history"]}})
+
+        def do_GET(self):
+            if not self._preamble():
+                return
+            url = urlparse(self.path)
+            q = {k: v[0] for k, v in parse_qs(url.query).items()}
+            if not self._authorized():
+                return
+            if url.path == "/app/GetUserDeviceGroups":
+                self._send({"code": 1000, "data": [{"groupId": "g1", "groupName": "mock orchards"}]})
+            elif url.path == "/app/GetDeviceData":
+                self._send({"code": 1000, "data": [{"deviceKey": k, "deviceName": k, "groupId": "g1"} for k in state.devices]})
+            elif url.path == "/app/GetDeviceSoftParam":
+                self._send({"code": 1000, "data": {"deviceKey": q.get("deviceKey"), "interval": 600}})
+            elif url.path == "/app/QueryHistoryList":
+                try:
+                    begin = datetime.strptime(q["beginTime"], "%Y-%m-%d %H:%M:%S")
+                    end = datetime.strptime(q["endTime"], "%Y-%m-%d %H:%M:%S")
+                except (KeyError, ValueError):
+                    self._send({"code": 1003, "message": "时间参数错误"})
+                    return
+                node_id = int(q.get("nodeId", -1))
+                self._send({"code": 1000, "data": generate_history(q.get("deviceKey", ""), begin, end, node_id)})
+            else:
+                self._send({"code": 404, "message": "not found"}, status=404)
+
+    return Handler
+
+
+def start_mock_server(host: str = "127.0.0.1", port: int = 0, devices: int = 10,
+                      latency: float = 0.0, fail_rate: float = 0.0):
+    """
+    在后台线程启动模拟服务, 返回 (server, state); port=0 时自动选择空闲端口 (server.server_port)
+    """
+    state = MockState(devices=devices, latency=latency, fail_rate=fail_rate)
+    server = ThreadingHTTPServer((host, port), _make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本地模拟物联网平台 /app/* 接口")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--devices", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.0, help="每次请求的固定延迟(秒)")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="随机返回 503 的概率")
+    args = parser.parse_args(argv)
+
+    server, _ = start_mock_server(args.host, args.port, args.devices, args.latency, args.fail_rate)
+    print(f"mock IoT server: http://{args.host}:{server.server_port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
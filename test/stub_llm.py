@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+本地 OpenAI-compatible stub 服务, 用于在无真实 API_KEY 时测试异步 LLM 客户端
+- POST /chat/completions 在固定延迟后返回一条 assistant 消息
+- 请求带 stream=true 时以 SSE 逐字符推送 chat.completion.chunk
+- token_rate > 0 时按每秒 token_rate 个字符模拟生成速度 (非流式在延迟后再等待整段生成时间)
+用法(项目根目录)：
+  python -m test.stub_llm --port 3001 --latency 1.0 --token-rate 50
+  DEEPSEEK_BASE_URL=http://127.0.0.1:3001 DEEPSEEK_API_KEY=stub python -m src.main
+"""
+
+import json
+import time
+import asyncio
+import argparse
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+
+def create_app(latency: float = 0.5, reply: str = "浇水：不要\n\n- 先观察土壤含水。", token_rate: float = 0.0) -> FastAPI:
+    app = FastAPI(title="stub LLM")
+    app.state.requests = 0
+
+    async def stream_chunks(model: str):
+        for ch in reply:
+            chunk = {
+                "object": "chat.completion.chunk",
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": ch}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            await asyncio.sleep(1.0 / token_rate if token_rate > 0 else 0)
+        yield "data: [DONE]\n\n"
+
+    @app.post("/chat/completions")
+    async def chat_completions(req: Request):
+        payload = await req.json()
+        app.state.requests += 1
+        await asyncio.sleep(latency)
+        if payload.get("stream"):
+            return StreamingResponse(stream_chunks(payload.get("model", "stub")), media_type="text/event-stream")
+        if token_rate > 0:
+            await asyncio.sleep(len(reply) / token_rate)
+        return {
+            "id": f"stub-{app.state.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": reply},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": sum(len(m.get("content", "")) for m in payload.get("messages", [])),
+                "completion_tokens": len(reply),
+            },
+        }
+
+    @app.get("/stats")
+    async def stats():
+        return {"requests": app.state.requests}
+
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本地 OpenAI-compatible stub LLM 服务")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3001)
+    parser.add_argument("--latency", type=float, default=0.5, help="每次补全的固定延迟(秒)")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="每秒生成的字符数, 0 表示不限")
+    args = parser.parse_args(argv)
+
+    uvicorn.run(create_app(latency=args.latency, token_rate=args.token_rate), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+ColumnStore: 追加去重、默认只存加载器列、按偏移读取与 memmap 读取一致
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+
+from src.column_store import ColumnStore, convert_json_to_store, store_signature
+
+START = pd.Timestamp("2025-06-01 00:00:00")
+
+
+def _frame(hours, offset=0, temp=None):
+    idx = np.arange(offset, offset + hours)
+    return pd.DataFrame({
+        "timestamp": START + pd.to_timedelta(idx, unit="h"),
+        "temp": np.asarray(temp, dtype=float) if temp is not None else 20.0 + idx,
+        "rain": np.zeros(hours),
+    })
+
+
+def test_append_drops_old_and_duplicate_rows(tmp_path):
+    store = ColumnStore.create(str(tmp_path / "s.cols"), _frame(10))
+    # 与已有数据重叠的 5 行 + 5 行新数据
+    assert store.append(_frame(10, offset=5)) == 5
+    assert len(store) == 15
+    # 重复追加同一批不写入, 版本不变
+    sig = store_signature(store.path)
+    assert store.append(_frame(10, offset=5)) == 0
+    assert store_signature(store.path) == sig
+
+    reopened = ColumnStore(store.path)
+    ts = reopened.timestamps()
+    assert len(reopened) == 15
+    assert (np.diff(ts.astype(np.int64)) > 0).all()
+
+
+def test_append_keeps_last_of_in_batch_duplicates(tmp_path):
+    store = ColumnStore.create(str(tmp_path / "s.cols"), _frame(2))
+    batch = pd.concat([_frame(1, offset=2, temp=[1.0]), _frame(1, offset=2, temp=[2.0]), _frame(1, offset=3)])
+    assert store.append(batch) == 2
+
+    df = ColumnStore(store.path).read()
+    assert df["timestamp"].is_unique
+    assert df.loc[df["timestamp"] == START + pd.Timedelta(hours=2), "temp"].item() == 2.0
+
+
+def test_append_fills_missing_columns_with_nan(tmp_path):
+    store = ColumnStore.create(str(tmp_path / "s.cols"), _frame(3))
+    assert store.append(_frame(2, offset=3).drop(columns=["rain"])) == 2
+    assert ColumnStore(store.path).read()["rain"].iloc[-2:].isna().all()
+
+
+def test_create_keeps_only_loader_columns(tmp_path):
+    df = _frame(4).assign(scene_tag="heatwave", label=1, extra=3.0, humidity=55.0)
+    store = ColumnStore.create(str(tmp_path / "s.cols"), df)
+    assert store.columns == ["timestamp", "temp", "humidity", "rain"]
+
+    explicit = ColumnStore.create(str(tmp_path / "e.cols"), df, columns=["temp", "scene_tag", "extra"])
+    assert explicit.columns == ["timestamp", "temp", "extra"]
+
+
+def test_convert_json_drops_spoilers_and_sorts(tmp_path):
+    records = [
+        {"timestamp": "2025-06-01 02:00:00", "temp": 3.0, "scenario": "x"},
+        {"timestamp": "2025-06-01 00:00:00", "temp": 1.0, "scenario": "x"},
+        {"timestamp": "2025-06-01 01:00:00", "temp": 2.0, "scenario": "x"},
+    ]
+    src = tmp_path / "d.json"
+    src.write_text(json.dumps({"data": records}), encoding="utf-8")
+
+    store = convert_json_to_store(str(src), str(tmp_path / "d.cols"))
+    assert store.columns == ["timestamp", "temp"]
+    assert store.read()["temp"].tolist() == [1.0, 2.0, 3.0]
+
+
+def test_read_arrays_matches_read(tmp_path):
+    store = ColumnStore.create(str(tmp_path / "s.cols"), _frame(48))
+    df = store.read(10, 34, ["temp", "rain"])
+    arrays = store.read_arrays(10, 34, ["temp", "rain", "missing"])
+    assert set(arrays) == {"temp", "rain"}
+    np.testing.assert_array_equal(arrays["temp"], df["temp"].to_numpy())
+
+    store.read()  # 已打开 memmap 的列走同一路径
+    np.testing.assert_array_equal(store.read_arrays(40, 100, ["temp"])["temp"], 20.0 + np.arange(40, 48))
+    assert len(store.read_arrays(50, 60, ["temp"])["temp"]) == 0
+
+
+def test_append_after_interrupted_write_stays_aligned(tmp_path):
+    path = str(tmp_path / "s.cols")
+    ColumnStore.create(path, _frame(3))
+    # 模拟追加中断: 值列已写入, timestamp 只写了半个值
+    with open(f"{path}/temp.bin", "ab") as f:
+        np.array([99.0]).tofile(f)
+    with open(f"{path}/timestamp.bin", "ab") as f:
+        f.write(b"\0" * 4)
+
+    store = ColumnStore(path)
+    assert len(store) == 3
+    assert store.append(_frame(2, offset=3)) == 2
+
+    df = ColumnStore(path).read()
+    assert df["temp"].tolist() == [20.0, 21.0, 22.0, 23.0, 24.0]
+    assert df["timestamp"].tolist() == list(START + pd.to_timedelta(np.arange(5), unit="h"))
+    for c in ("timestamp", "temp", "rain"):
+        assert (tmp_path / "s.cols" / f"{c}.bin").stat().st_size == 5 * 8
+
+
+def test_stale_instance_appends_after_rows_written_by_another(tmp_path):
+    path = str(tmp_path / "s.cols")
+    stale = ColumnStore.create(path, _frame(3))
+    assert ColumnStore(path).append(_frame(2, offset=3)) == 2
+    # 旧实例以磁盘上的行数为准, 不会截掉其他实例已提交的行
+    assert stale.append(_frame(2, offset=4)) == 1
+    assert ColumnStore(path).read()["temp"].tolist() == [20.0, 21.0, 22.0, 23.0, 24.0, 25.0]
@@ -0,0 +1,110 @@
+"""
+数据上下文按 token 预算压缩 (_encode_window): 预算内原样输出、分层降采样、块顺序、聚合方式、恒定列提取
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data_loader import (_encode_window, _encode_tiers, _compression_plans, _compact_csv_from_df,
+                             _estimate_tokens, TRUSTED_COLS)
+
+START = pd.Timestamp("2025-06-01 00:00:00")
+
+
+def _frame(hours: int) -> pd.DataFrame:
+    idx = np.arange(hours)
+    return pd.DataFrame({
+        "timestamp": START + pd.to_timedelta(idx, unit="h"),
+        "temp": 20 + 5 * np.sin(idx / 24 * 2 * np.pi) + idx * 0.01,
+        "humidity": 60.0,
+        "rain": np.where(idx % 5 == 0, 1.2, 0.0),
+        "solar": np.nan,
+        "soil_water": 0.3 + idx * 1e-4,
+    })
+
+
+def _blocks(text: str):
+    """
+    解析为 ([(分辨率, 表头, 行), ...], CONST 行)
+    """
+    blocks, const = [], None
+    for part in text.split("\n["):
+        part = part.lstrip("[")
+        lines = part.split("\n")
+        if lines[-1].startswith("CONST: "):
+            const = lines.pop()[len("CONST: "):]
+        tag = lines[0].rstrip("]")
+        blocks.append((tag, lines[1].split(","), [line.split(",") for line in lines[2:]]))
+    return blocks, const
+
+
+def test_under_budget_is_plain_csv():
+    df = _frame(24)
+    full = _compact_csv_from_df(df, TRUSTED_COLS)
+    for anchor in ("end", "start"):
+        assert _encode_window(df, anchor, budget=_estimate_tokens(full)) == full
+
+
+def test_compression_plans_halve_full_res_span():
+    plans = list(_compression_plans(24))
+    assert plans[0] == ((24, 1), (48, 3), (96, 6))
+    assert [p[0][0] for p in plans] == [24, 12, 6, 3, 1, 0]
+    assert all(span % size == 0 for plan in plans for span, size in plan)
+
+
+@pytest.mark.parametrize("anchor", ["end", "start"])
+def test_thirty_days_fit_budget_in_time_order(anchor):
+    df = _frame(30 * 24)
+    assert _estimate_tokens(_compact_csv_from_df(df, TRUSTED_COLS)) > 1200
+
+    text = _encode_window(df, anchor, budget=1200, full_res_hours=24)
+    assert _estimate_tokens(text) <= 1200
+
+    blocks, _ = _blocks(text)
+    tags = [tag for tag, _, _ in blocks]
+    assert tags == (["1d", "6h", "3h", "1h"] if anchor == "end" else ["1h", "3h", "6h", "1d"])
+    # 逐小时段为距 anchor 最近的 24 小时
+    hourly = next(rows for tag, _, rows in blocks if tag == "1h")
+    assert len(hourly) == 24
+    assert hourly[-1 if anchor == "end" else 0][0] == ("06-30 23:00" if anchor == "end" else "06-01 00:00")
+    times = [row[0] for _, _, rows in blocks for row in rows]
+    assert times == sorted(times) and len(set(times)) == len(times)
+
+
+def test_rain_is_summed_and_other_columns_get_mean_min_max():
+    df = _frame(48)
+    varying = ["temp", "rain", "soil_water"]
+    age_h = np.arange(47, -1, -1, dtype=np.float64)  # anchor='end': 距最后一行的小时数
+    text = _encode_tiers(df, age_h, varying, {}, ((0, 1), (0, 3), (0, 6)), "end")
+
+    blocks, const = _blocks(text)
+    assert const is None and len(blocks) == 1
+    tag, header, rows = blocks[0]
+    assert tag == "1d"
+    assert header == ["time", "T", "T_min", "T_max", "R", "VWC", "VWC_min", "VWC_max"]
+    for row, day in zip(rows, (df.iloc[:24], df.iloc[24:])):
+        got = dict(zip(header, row))
+        assert got["time"] == day["timestamp"].iloc[0].strftime("%m-%d %H:%M")
+        assert float(got["R"]) == pytest.approx(day["rain"].sum(), abs=0.01)
+        assert float(got["T"]) == pytest.approx(day["temp"].mean(), abs=0.01)
+        assert float(got["T_min"]) == pytest.approx(day["temp"].min(), abs=0.01)
+        assert float(got["T_max"]) == pytest.approx(day["temp"].max(), abs=0.01)
+
+
+def test_constant_and_missing_columns_move_to_const_line():
+    df = _frame(30 * 24)
+    text = _encode_window(df, "end", budget=1200, full_res_hours=24)
+    blocks, const = _blocks(text)
+    assert const == "H=60,S=NA"
+    for _, header, _ in blocks:
+        assert not {"H", "S", "H_min", "S_max"} & set(header)
+        assert "T" in header and "R" in header and "VWC" in header
+
+
+def test_tiny_budget_falls_back_to_daily_only():
+    df = _frame(10 * 24)
+    text = _encode_window(df, "end", budget=1, full_res_hours=24)
+    blocks, const = _blocks(text)
+    assert [tag for tag, _, _ in blocks] == ["1d"]
+    assert len(blocks[0][2]) == 10 and const == "H=60,S=NA"
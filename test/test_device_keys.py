@@ -0,0 +1,76 @@
+"""
+device_key -> 数据路径: 拒绝路径穿越/绝对路径/空 key, 列式存储优先于 JSON, 设备列表只含合法 key
+"""
+
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from src import data_loader
+from src.data_loader import resolve_data_path, list_device_keys
+from src.column_store import ColumnStore
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_loader, "DATA_DIR", str(tmp_path))
+    return tmp_path
+
+
+def _write_json(path, rows=3):
+    records = [{"timestamp": f"2025-06-01 0{i}:00:00", "temp": 20.0 + i} for i in range(rows)]
+    path.write_text(json.dumps(records), encoding="utf-8")
+
+
+def _write_cols(path, rows=3):
+    ColumnStore.create(str(path), pd.DataFrame({
+        "timestamp": pd.date_range("2025-06-01", periods=rows, freq="h"), "temp": 20.0}))
+
+
+@pytest.mark.parametrize("key", ["", "../x", "..", "../../etc/passwd", "/etc/passwd", os.path.abspath("dev1"),
+                                 "a/b", "a\\b", ".hidden", "x" * 65, "dev 1"])
+def test_invalid_keys_rejected(data_dir, key):
+    (data_dir / "x.json").write_text("[]", encoding="utf-8")
+    with pytest.raises(ValueError):
+        resolve_data_path(key)
+
+
+def test_none_is_default_data_file(data_dir):
+    assert resolve_data_path(None) == data_loader.DATA_FILE_PATH
+
+
+def test_cols_preferred_over_json(data_dir):
+    _write_json(data_dir / "dev1.json")
+    assert resolve_data_path("dev1") == str(data_dir / "dev1.json")
+
+    _write_cols(data_dir / "dev1.cols")
+    assert resolve_data_path("dev1") == str(data_dir / "dev1.cols")
+
+    # 没有 meta.json 的目录不是列式存储, 回退到 JSON
+    (data_dir / "dev2.cols").mkdir()
+    _write_json(data_dir / "dev2.json")
+    assert resolve_data_path("dev2") == str(data_dir / "dev2.json")
+
+
+def test_unknown_device_and_missing_data_dir(data_dir, monkeypatch):
+    with pytest.raises(FileNotFoundError):
+        resolve_data_path("nope")
+    monkeypatch.setattr(data_loader, "DATA_DIR", "")
+    with pytest.raises(FileNotFoundError):
+        resolve_data_path("dev1")
+    assert list_device_keys() == []
+
+
+def test_list_device_keys(data_dir):
+    _write_json(data_dir / "b-2.json")
+    _write_cols(data_dir / "a_1.cols")
+    _write_json(data_dir / "a_1.json")
+    _write_json(data_dir / ".hidden.json")
+    (data_dir / "notes.txt").write_text("x", encoding="utf-8")
+    (data_dir / "bad key.json").write_text("[]", encoding="utf-8")
+
+    keys = list_device_keys()
+    assert keys == ["a_1", "b-2"]
+    assert all(resolve_data_path(k) for k in keys)
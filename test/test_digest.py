@@ -0,0 +1,125 @@
+"""
+DigestService.refresh: 按数据版本重建摘要 (版本不变跳过、出错重试、移除的设备丢弃、单个设备失败不影响其余设备)
+load_context / answer 为桩, _scan 直接返回给定的版本表
+"""
+
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+from src.digest import DigestService
+from src.data_loader import WindowSummary
+
+
+class Loader:
+    """
+    load_context 桩: fail 中的设备抛异常, bad 中的设备返回带 error 的上下文
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.fail, self.bad = set(), set()
+        self.active = self.peak = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, payload):
+        key = payload["device_key"] or ""
+        with self._lock:
+            self.calls.append(key)
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time.sleep(0.01)
+            if key in self.fail:
+                raise RuntimeError("disk error")
+            if key in self.bad:
+                return SimpleNamespace(summary="数据加载失败", error="数据加载失败", stats=None, as_of=None)
+            alerts = [{"rule": "soil_dry", "level": "warning"}] if key == "dry" else []
+            return SimpleNamespace(summary=f"summary {key}", error=None, as_of="2025-06-01 23:00:00",
+                                   stats=WindowSummary(records=24, mean_temp=21.5, alerts=alerts))
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+async def _answer(ctx, question, timings=None, **kwargs):
+    timings["fallback"] = 0.0
+    return f"{ctx.summary}: {question}"
+
+
+def _service(versions: dict, loader: Loader, **kwargs) -> DigestService:
+    svc = DigestService(loader, _answer, questions=["要浇水吗"], prewarm=False, **kwargs)
+    svc._scan = lambda: dict(versions)
+    return svc
+
+
+def test_unchanged_versions_are_skipped_and_changed_rebuilt():
+    versions = {"": (1, 10), "a": (1, 20), "dry": (1, 30)}
+    loader = Loader()
+    svc = _service(versions, loader)
+
+    assert asyncio.run(svc.refresh()) == 3
+    assert asyncio.run(svc.refresh()) == 0
+    assert sorted(loader.calls) == ["", "a", "dry"]
+
+    versions["a"] = (2, 44)
+    assert asyncio.run(svc.refresh()) == 1
+    assert loader.calls[-1] == "a"
+    assert svc.get("a").data_version == (2, 44)
+    assert svc.get(None).summary == "summary "
+    assert svc.get("dry").alerts == [{"rule": "soil_dry", "level": "warning"}]
+    assert "alerts" not in svc.get("dry").stats
+
+
+def test_errored_digest_is_retried_with_same_version():
+    versions = {"a": (1, 20), "b": (1, 30)}
+    loader = Loader()
+    loader.bad.add("b")
+    svc = _service(versions, loader)
+
+    assert asyncio.run(svc.refresh()) == 2
+    assert svc.get("b").error == "数据加载失败" and svc.get("b").stats is None
+
+    loader.bad.clear()
+    assert asyncio.run(svc.refresh()) == 1
+    assert svc.get("b").error is None
+    assert asyncio.run(svc.refresh()) == 0
+
+
+def test_removed_or_missing_devices_are_dropped():
+    versions = {"a": (1, 20), "b": (1, 30), "c": (1, 40)}
+    svc = _service(versions, Loader())
+    asyncio.run(svc.refresh())
+
+    del versions["b"]
+    versions["c"] = None  # 数据文件缺失
+    asyncio.run(svc.refresh())
+    assert [d.device_key for d in svc.all()] == ["a"]
+
+
+def test_failing_device_does_not_abort_others():
+    versions = {f"d{i}": (1, i) for i in range(6)}
+    loader = Loader()
+    loader.fail.add("d3")
+    svc = _service(versions, loader, concurrency=2)
+
+    assert asyncio.run(svc.refresh()) == 5
+    assert svc.errors == 1 and svc.get("d3") is None
+    assert len(svc.all()) == 5
+    assert loader.peak <= 2
+
+    # 下一轮重试失败的设备
+    loader.fail.clear()
+    assert asyncio.run(svc.refresh()) == 1 and svc.get("d3") is not None
+
+
+def test_prewarm_records_answers():
+    loader = Loader()
+    svc = DigestService(loader, _answer, questions=["要浇水吗", "会下雨吗"], prewarm=True)
+    svc._scan = lambda: {"a": (1, 1)}
+    asyncio.run(svc.refresh())
+    assert svc.get("a").answers == [
+        {"question": "要浇水吗", "response": "summary a: 要浇水吗", "source": "local"},
+        {"question": "会下雨吗", "response": "summary a: 会下雨吗", "source": "local"},
+    ]
@@ -0,0 +1,99 @@
+"""
+Downloader 登录凭证: TokenCache 的过期与 0600 权限, userId 失效时 _get 只重新登录并重试一次
+服务端为 test/mock_iot_server.py (后台线程, 自动选择端口)
+"""
+
+import os
+import stat
+
+import pytest
+
+from src import downloader
+from src.downloader import Downloader, TokenCache
+from test import mock_iot_server
+from test.mock_iot_server import start_mock_server
+
+
+@pytest.fixture
+def server():
+    srv, state = start_mock_server(devices=3)
+    yield srv, state
+    srv.shutdown()
+    srv.server_close()
+
+
+def _client(srv, tmp_path, **kwargs) -> Downloader:
+    cache = TokenCache(str(tmp_path / "cache" / "token.json"), ttl=60)
+    return Downloader("127.0.0.1", str(srv.server_port), token_cache=cache, **kwargs)
+
+
+def test_token_cache_expiry_and_permissions(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(downloader.time, "time", lambda: now[0])
+    cache = TokenCache(str(tmp_path / "cache" / "token.json"), ttl=60)
+    cache.put("a", "uid-a")
+
+    assert stat.S_IMODE(os.stat(cache.path).st_mode) == 0o600
+    assert stat.S_IMODE(os.stat(os.path.dirname(cache.path)).st_mode) == 0o700
+    assert cache.get("a") == "uid-a"
+
+    now[0] += 61
+    assert cache.get("a") is None
+    cache.put("b", "uid-b")  # 写入时清理已过期的条目
+    assert TokenCache(cache.path).get("b") == "uid-b"
+    assert "a" not in cache._read()
+
+    cache.drop("b")
+    assert cache.get("b") is None
+
+
+def test_login_reuses_cached_token(server, tmp_path):
+    srv, state = server
+    d = _client(srv, tmp_path)
+    d.logIn("demo", "demo")
+    assert d.userid == mock_iot_server.USER_ID
+
+    again = _client(srv, tmp_path)
+    again.logIn("demo", "demo")
+    assert again.isLogIn() and state.requests["/app/Login"] == 1
+    assert len(again.getDevicesInGroup("")) == 3
+
+
+def test_stale_userid_relogs_in_once(server, tmp_path, monkeypatch):
+    srv, state = server
+    d = _client(srv, tmp_path)
+    d.logIn("demo", "demo")
+
+    # 平台轮换 userId: 旧凭证返回 1001, 重新登录拿到新凭证后重试成功
+    monkeypatch.setattr(mock_iot_server, "USER_ID", "mock-user-0002")
+    groups = d.getDeviceGroups()
+    assert [g["groupId"] for g in groups] == ["g1"]
+    assert d.userid == "mock-user-0002"
+    assert state.requests["/app/Login"] == 2
+    assert state.requests["/app/GetUserDeviceGroups"] == 2
+    assert d._token_cache.get(d._tokenKey()) == "mock-user-0002"
+
+
+def test_relogin_that_does_not_help_is_not_retried_again(server, tmp_path, monkeypatch):
+    srv, state = server
+    d = _client(srv, tmp_path)
+    d.logIn("demo", "demo")
+
+    logins = []
+    monkeypatch.setattr(d, "_authenticate", lambda: logins.append(1) or "still-stale")
+    monkeypatch.setattr(mock_iot_server, "USER_ID", "mock-user-0002")
+    result = d._get("/app/GetUserDeviceGroups")
+    assert result["code"] == 1001
+    assert len(logins) == 1
+    assert state.requests["/app/GetUserDeviceGroups"] == 2
+
+
+def test_auth_fail_codes_are_configurable(server, tmp_path, monkeypatch):
+    srv, state = server
+    d = _client(srv, tmp_path, auth_fail_codes={4010})
+    d.logIn("demo", "demo")
+    monkeypatch.setattr(mock_iot_server, "USER_ID", "mock-user-0002")
+
+    # 1001 不在配置中: 不重新登录, 原样返回给调用方
+    assert d._get("/app/GetUserDeviceGroups")["code"] == 1001
+    assert state.requests["/app/Login"] == 1
@@ -0,0 +1,113 @@
+"""
+HourlyAggregator: 小时分桶、多节点取均值、累计量求和、报警重复记录去重、跨批次暂存未完整小时
+"""
+
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.ingest import HourlyAggregator, IngestSink, ingest_batches, parse_field_map
+from src.column_store import ColumnStore
+
+FIELD_MAP = {"1.tem": "temp", "1.hum": "humidity", "2.tem": "temp", "3.tem": "rain"}
+
+
+def rec(t, node, alarm=0, **fields):
+    return {"nodeId": node, "recordTimeStr": t, "isAlarmData": alarm, **fields}
+
+
+def test_parse_field_map():
+    assert parse_field_map(FIELD_MAP) == {1: {"tem": "temp", "hum": "humidity"}, 2: {"tem": "temp"}, 3: {"tem": "rain"}}
+
+
+def test_missing_or_unknown_field_map_is_rejected(monkeypatch, tmp_path):
+    monkeypatch.setattr("src.ingest.INGEST_FIELD_MAP", {})
+    with pytest.raises(ValueError, match="INGEST_FIELD_MAP"):
+        HourlyAggregator()
+    with pytest.raises(ValueError, match="INGEST_FIELD_MAP"):
+        IngestSink(str(tmp_path))
+    with pytest.raises(ValueError, match="pressure"):
+        HourlyAggregator({"1.tem": "temp", "2.pa": "pressure"})
+
+
+def test_hourly_buckets_mean_across_nodes_and_sum_rain():
+    agg = HourlyAggregator(FIELD_MAP, sum_cols=["rain"])
+    records = [
+        rec("2025-06-01 00:00:00", 1, tem=20.0, hum=60.0),
+        rec("2025-06-01 00:30:00", 1, tem=22.0, hum=70.0),
+        rec("2025-06-01 00:10:00", 2, tem=30.0),
+        rec("2025-06-01 00:20:00", 3, tem=0.5),
+        rec("2025-06-01 00:50:00", 3, tem=1.5),
+        rec("2025-06-01 01:00:00", 1, tem=25.0, hum=80.0),
+    ]
+    out = agg.feed(records)
+
+    assert out.columns.tolist() == ["timestamp", "temp", "humidity", "rain", "solar", "soil_water"]
+    assert len(out) == 1
+    row = out.iloc[0]
+    assert row["timestamp"] == pd.Timestamp("2025-06-01 00:00:00")
+    assert row["temp"] == (21.0 + 30.0) / 2  # 节点 1 先取小时均值, 再与节点 2 取均值
+    assert row["humidity"] == 65.0
+    assert row["rain"] == 2.0
+    assert np.isnan(row["solar"]) and np.isnan(row["soil_water"])
+    # 01:00 这一小时可能还有后续记录, 留在缓冲区
+    assert agg.pending_since() == datetime(2025, 6, 1, 1)
+
+
+def test_alarm_duplicate_prefers_normal_record():
+    agg = HourlyAggregator(FIELD_MAP, sum_cols=["rain"])
+    out = agg.feed([
+        rec("2025-06-01 00:00:00", 3, alarm=1, tem=9.0),
+        rec("2025-06-01 00:00:00", 3, alarm=0, tem=1.0),
+        rec("2025-06-01 00:00:00", 1, alarm=1, tem=40.0),
+    ], through=datetime(2025, 6, 1, 0, 59, 59))
+    assert out["rain"].item() == 1.0
+    # 只有报警记录时仍保留
+    assert out["temp"].item() == 40.0
+
+
+def test_pending_hour_carries_across_batches():
+    agg = HourlyAggregator(FIELD_MAP, sum_cols=["rain"])
+    assert agg.feed([rec("2025-06-01 00:10:00", 3, tem=1.0)]).empty
+    assert agg.pending_since() == datetime(2025, 6, 1, 0, 10)
+
+    out = agg.feed([rec("2025-06-01 00:40:00", 3, tem=2.0), rec("2025-06-01 01:05:00", 3, tem=4.0)])
+    assert out["rain"].tolist() == [3.0]
+
+    # through 覆盖到 01:59:59 时该小时已完整
+    out = agg.feed([], through=datetime(2025, 6, 1, 1, 59, 59))
+    assert out["rain"].tolist() == [4.0]
+    assert agg.pending_since() is None
+
+
+def test_through_before_hour_end_keeps_partial_hour():
+    agg = HourlyAggregator(FIELD_MAP, sum_cols=["rain"])
+    out = agg.feed([rec("2025-06-01 00:10:00", 3, tem=1.0), rec("2025-06-01 01:10:00", 3, tem=2.0)],
+                   through=datetime(2025, 6, 1, 1, 30))
+    assert out["timestamp"].tolist() == [pd.Timestamp("2025-06-01 00:00:00")]
+
+    rest = agg.flush()
+    assert rest["rain"].tolist() == [2.0]
+    assert agg.pending_since() is None and agg.flush().empty
+
+
+def test_unmapped_nodes_and_fields_are_ignored():
+    agg = HourlyAggregator(FIELD_MAP, sum_cols=["rain"])
+    out = agg.feed([rec("2025-06-01 00:00:00", 9, tem=99.0), rec("2025-06-01 00:00:00", 1, lux=5.0)],
+                   through=datetime(2025, 6, 1, 0, 59, 59))
+    assert out.empty and agg.pending_since() is None
+
+
+def test_sink_chunks_match_single_batch(tmp_path):
+    records = [rec(f"2025-06-01 {h:02d}:{m:02d}:00", n, tem=float(h * 10 + n + m / 60))
+               for h in range(6) for m in (0, 20, 40) for n in (1, 2, 3)]
+    whole = IngestSink(str(tmp_path / "a"), FIELD_MAP, ["rain"])
+    chunked = IngestSink(str(tmp_path / "b"), FIELD_MAP, ["rain"], chunk_records=7)
+    assert ingest_batches("DEV", [records], whole) == 6
+    assert ingest_batches("DEV", [records[:20], records[20:]], chunked) == 6
+
+    a = ColumnStore(whole.store_path("DEV")).read()
+    b = ColumnStore(chunked.store_path("DEV")).read()
+    pd.testing.assert_frame_equal(a, b)
@@ -0,0 +1,83 @@
+"""
+ResponseCache: TTL 过期、条目数/字节数 LRU 淘汰、按数据源版本失效
+"""
+
+import pytest
+
+from src import llm_service
+from src.llm_service import ResponseCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(llm_service.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_hit_until_ttl_expires(clock):
+    cache = ResponseCache(ttl=10, max_entries=8, max_bytes=1 << 20)
+    cache.put("k", "回复")
+    clock[0] += 9.9
+    assert cache.get("k") == "回复"
+    clock[0] += 0.2
+    assert cache.get("k") is None
+    st = cache.stats()
+    assert (st["hits"], st["misses"], st["entries"]) == (1, 1, 0)
+
+
+def test_lru_eviction_by_entries():
+    cache = ResponseCache(ttl=60, max_entries=2, max_bytes=1 << 20)
+    cache.put("a", "A")
+    cache.put("b", "B")
+    assert cache.get("a") == "A"  # a 变为最近使用
+    cache.put("c", "C")
+    assert cache.get("b") is None
+    assert cache.get("a") == "A"
+    assert cache.get("c") == "C"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_lru_eviction_by_bytes():
+    cache = ResponseCache(ttl=60, max_entries=100, max_bytes=10)
+    cache.put("a", "12345")
+    cache.put("b", "12345")
+    cache.put("c", "12345")
+    assert cache.get("a") is None
+    assert cache.get("b") == "12345"
+    # 单条超过上限的回复不缓存
+    cache.put("big", "x" * 11)
+    assert cache.get("big") is None
+
+
+def test_put_replaces_existing_entry(clock):
+    cache = ResponseCache(ttl=10, max_entries=8, max_bytes=1 << 20)
+    cache.put("k", "旧")
+    clock[0] += 8
+    cache.put("k", "新")
+    clock[0] += 8
+    assert cache.get("k") == "新"
+    assert cache.stats()["entries"] == 1
+
+
+def test_data_version_change_drops_only_that_scope():
+    cache = ResponseCache(ttl=60, max_entries=8, max_bytes=1 << 20)
+    cache.observe_data_version((1, 100), scope="dev1")
+    cache.observe_data_version((1, 100), scope="dev2")
+    cache.put("q1", "r1", scope="dev1")
+    cache.put("q2", "r2", scope="dev2")
+
+    cache.observe_data_version((1, 100), scope="dev1")  # 版本未变
+    assert cache.get("q1") == "r1"
+
+    cache.observe_data_version((2, 124), scope="dev1")
+    assert cache.get("q1") is None
+    assert cache.get("q2") == "r2"
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_disabled_cache_stores_nothing():
+    cache = ResponseCache(ttl=0, max_entries=8, max_bytes=1 << 20)
+    assert not cache.enabled
+    cache.put("k", "v")
+    assert cache.get("k") is None
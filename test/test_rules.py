@@ -0,0 +1,111 @@
+"""
+RuleEngine: 各统计量阈值、NaN/缺失窗口、标量取值评估、逐设备与向量化结果一致
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.rules import Rule, RuleEngine, window_stat, stack_windows
+
+RULES = [
+    {"name": "wet", "var": "soil_water", "stat": "last", "op": ">=", "threshold": 0.4},
+    {"name": "heavy_rain", "var": "rain", "stat": "sum", "op": ">=", "threshold": 30.0},
+    {"name": "burst", "var": "rain", "stat": "sum", "op": ">=", "threshold": 10.0, "hours": 3},
+    {"name": "heat", "var": "temp", "stat": "hours_ge", "limit": 35.0, "op": ">=", "threshold": 3},
+    {"name": "frost", "var": "temp", "stat": "min", "op": "<=", "threshold": 0.0, "level": "critical",
+     "message": "最低气温 {value}°C"},
+    {"name": "drying", "var": "soil_water", "stat": "trend", "op": "<=", "threshold": -0.01},
+]
+
+
+def names(alerts):
+    return sorted(a["rule"] for a in alerts)
+
+
+def test_window_stat_values():
+    x = np.array([[1.0, np.nan, 3.0, 5.0],
+                  [np.nan, np.nan, np.nan, np.nan],
+                  [4.0, 3.0, 2.0, 1.0]])
+    np.testing.assert_array_equal(window_stat(x, "last"), [5.0, np.nan, 1.0])
+    np.testing.assert_array_equal(window_stat(x, "first"), [1.0, np.nan, 4.0])
+    np.testing.assert_array_equal(window_stat(x, "delta"), [4.0, np.nan, -3.0])
+    np.testing.assert_array_equal(window_stat(x, "min"), [1.0, np.nan, 1.0])
+    np.testing.assert_array_equal(window_stat(x, "sum"), [9.0, np.nan, 10.0])
+    np.testing.assert_array_equal(window_stat(x, "mean"), [3.0, np.nan, 2.5])
+    np.testing.assert_array_equal(window_stat(x, "hours_ge", 3.0), [2.0, np.nan, 2.0])
+    np.testing.assert_allclose(window_stat(x, "trend"), [np.polyfit([0, 2, 3], [1, 3, 5], 1)[0], np.nan, -1.0])
+
+
+def test_thresholds_fire_per_device():
+    engine = RuleEngine(RULES)
+    hours = 6
+    windows = {
+        "soil_water": np.array([[0.35] * 6, [0.30, 0.28, 0.26, 0.24, 0.22, 0.20], [0.41] * 6]),
+        "rain": np.array([[0.0] * 6, [5.0] * 6, [0, 0, 0, 4.0, 4.0, 2.0]]),
+        "temp": np.array([[36.0, 36.0, 35.0, 30, 30, 30], [20.0] * 6, [5, 3, 1, 0.5, -0.4, 2]]),
+    }
+    assert all(w.shape == (3, hours) for w in windows.values())
+    alerts = engine.evaluate_windows(windows)
+
+    assert names(alerts[0]) == ["heat"]
+    assert names(alerts[1]) == ["burst", "drying", "heavy_rain"]
+    assert names(alerts[2]) == ["burst", "frost", "wet"]
+    frost = next(a for a in alerts[2] if a["rule"] == "frost")
+    assert frost == {"rule": "frost", "level": "critical", "value": -0.4, "threshold": 0.0, "message": "最低气温 -0.4°C"}
+
+
+def test_threshold_boundary_and_missing_data():
+    engine = RuleEngine(RULES)
+    windows = {
+        "soil_water": np.array([[np.nan, 0.4], [np.nan, np.nan]]),
+        "rain": np.array([[np.nan, np.nan], [np.nan, np.nan]]),
+        "temp": np.array([[np.nan, np.nan], [np.nan, np.nan]]),
+    }
+    alerts = engine.evaluate_windows(windows)
+    # >= 阈值时命中; 全 NaN 的窗口不产生告警 (sum 为 NaN 而不是 0)
+    assert names(alerts[0]) == ["wet"]
+    assert alerts[1] == []
+
+
+def test_evaluate_frames_matches_stacked_windows():
+    engine = RuleEngine(RULES)
+    rng = np.random.default_rng(3)
+    frames = []
+    for i in range(12):
+        n = int(rng.integers(2, 30))
+        frames.append(pd.DataFrame({
+            "temp": rng.normal(25, 10, n),
+            "rain": rng.exponential(2, n),
+            "soil_water": 0.3 + np.cumsum(rng.normal(0, 0.02, n)),
+        }))
+    frames[4] = None
+    frames[7] = frames[7].drop(columns=["rain"])
+
+    vec = engine.evaluate_frames(frames, 24)
+    loop = [engine.evaluate_frames([f], 24)[0] for f in frames]
+    assert vec == loop
+    assert vec[4] == []
+    assert np.isnan(stack_windows(frames, ["rain"], 24)["rain"][7]).all()
+
+
+def test_evaluate_values_uses_limit_key_and_skips_hour_rules():
+    engine = RuleEngine(RULES)
+    alerts = engine.evaluate_values({
+        ("soil_water", "last"): 0.45,
+        ("rain", "sum"): 12.0,
+        ("temp", "hours_ge", 35.0): 4,
+        ("temp", "min"): None,
+    })
+    # burst 规则只看末尾 3 小时, 标量取值无法评估
+    assert names(alerts) == ["heat", "wet"]
+    assert engine.evaluate_values({("temp", "hours_ge"): 10}) == []
+
+
+def test_invalid_rules_rejected():
+    with pytest.raises(ValueError):
+        Rule("x", "temp", "median", ">=", 1.0)
+    with pytest.raises(ValueError):
+        Rule("x", "temp", "max", "==", 1.0)
+    with pytest.raises(ValueError):
+        Rule("x", "temp", "hours_ge", ">=", 1.0)
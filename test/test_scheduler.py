@@ -0,0 +1,151 @@
+"""
+LLMScheduler: 优先级放行顺序、排队截止时间、队列已满时挤掉低优先级请求、429 退避与恢复
+pytest-asyncio 不是依赖, 异步用例以 asyncio.run 执行
+"""
+
+import asyncio
+
+import httpx
+import pytest
+
+from src.llm_service import LLMScheduler, QueueRejected
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def _settle():
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+def test_release_admits_by_priority_then_arrival():
+    async def main():
+        s = LLMScheduler(max_in_flight=1, max_queue=8, queue_timeout=5)
+        order = []
+
+        async def waiter(name, priority):
+            await s.acquire(priority)
+            order.append(name)
+            s.release(ok=True)
+
+        await s.acquire(1)
+        tasks = []
+        for name, priority in [("low-a", 2), ("normal", 1), ("low-b", 2), ("urgent", 0)]:
+            tasks.append(asyncio.create_task(waiter(name, priority)))
+            await _settle()
+        assert s.stats()["queue_depth"] == 4
+        s.release(ok=True)
+        await asyncio.gather(*tasks)
+        return order, s.stats()
+
+    order, stats = run(main())
+    assert order == ["urgent", "normal", "low-a", "low-b"]
+    assert stats["in_flight"] == 0 and stats["admitted"] == 5
+
+
+def test_deadline_rejects_queued_request():
+    async def main():
+        s = LLMScheduler(max_in_flight=1, max_queue=8, queue_timeout=5)
+        await s.acquire(1)
+        with pytest.raises(QueueRejected) as exc:
+            await s.acquire(1, timeout=0.05)
+        assert exc.value.reason == "deadline"
+        assert s.stats()["queue_depth"] == 0
+        # 过期请求不占名额, 释放后下一个请求立即放行
+        s.release()
+        assert await s.acquire(1) == 0.0
+        return s.rejected
+
+    assert run(main()) == {"full": 0, "deadline": 1}
+
+
+def test_full_queue_displaces_lower_priority_waiter():
+    async def main():
+        s = LLMScheduler(max_in_flight=1, max_queue=2, queue_timeout=5)
+        await s.acquire(1)
+        low = asyncio.create_task(s.acquire(2))
+        normal = asyncio.create_task(s.acquire(1))
+        await _settle()
+
+        # 不高于最低优先级的请求不能挤掉排队中的请求
+        with pytest.raises(QueueRejected) as exc:
+            await s.acquire(2)
+        assert exc.value.reason == "full"
+
+        urgent = asyncio.create_task(s.acquire(0))
+        await _settle()
+        with pytest.raises(QueueRejected):
+            await low
+        assert not normal.done() and not urgent.done()
+
+        s.release()
+        await urgent
+        assert not normal.done()
+        s.release()
+        await normal
+        s.release()
+        return s.rejected
+
+    assert run(main()) == {"full": 2, "deadline": 0}
+
+
+def _rate_limited_error(retry_after: str) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "http://llm.local/v1/chat/completions")
+    response = httpx.Response(429, headers={"retry-after": retry_after}, request=request)
+    return httpx.HTTPStatusError("429", request=request, response=response)
+
+
+def test_429_halves_limit_pauses_and_recovers():
+    async def main():
+        s = LLMScheduler(max_in_flight=4, max_queue=8, queue_timeout=5, cooldown=10)
+        loop = asyncio.get_running_loop()
+        with pytest.raises(httpx.HTTPStatusError):
+            async with s.slot(1):
+                raise _rate_limited_error("0.2")
+        assert s.limit == 2 and s.rate_limited == 1
+
+        # 暂停期间 (Retry-After 0.2s) 即使有空闲名额也不放行
+        t0 = loop.time()
+        await s.acquire(1)
+        waited = loop.time() - t0
+        s.release(ok=True)
+        assert s.limit == 3
+
+        async with s.slot(1):
+            pass
+        assert s.limit == 4
+        async with s.slot(1):
+            pass
+        return waited, s.stats()
+
+    waited, stats = run(main())
+    assert 0.15 <= waited < 2
+    assert stats["limit"] == 4 and stats["in_flight"] == 0
+
+
+def test_429_without_retry_after_uses_cooldown():
+    async def main():
+        s = LLMScheduler(max_in_flight=1, max_queue=8, queue_timeout=0.05, cooldown=10)
+        with pytest.raises(httpx.HTTPStatusError):
+            async with s.slot(1):
+                raise _rate_limited_error("")
+        # 冷却 10s 内无法放行, 排队请求到期被拒绝
+        with pytest.raises(QueueRejected) as exc:
+            await s.acquire(1)
+        return s.limit, exc.value.reason
+
+    assert run(main()) == (1, "deadline")
+
+
+def test_other_errors_release_without_backoff():
+    async def main():
+        s = LLMScheduler(max_in_flight=2, max_queue=8, queue_timeout=5)
+        with pytest.raises(RuntimeError):
+            async with s.slot(1):
+                raise RuntimeError("boom")
+        return s.stats()
+
+    stats = run(main())
+    assert stats["limit"] == 2 and stats["in_flight"] == 0 and stats["rate_limited"] == 0
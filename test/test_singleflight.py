@@ -0,0 +1,168 @@
+"""
+SingleFlight / AsyncSingleFlight: 并发的相同请求只调用一次上游; 异常与发起方取消都传给全部等待方且不会污染 key
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.singleflight import SingleFlight, AsyncSingleFlight
+
+
+class Upstream:
+    """
+    计数桩: gate 放行前一直阻塞, 便于让所有调用方先进入同一次计算
+    """
+
+    def __init__(self, fail: bool = False):
+        self.calls = 0
+        self.fail = fail
+        self.gate = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.gate.wait(5)
+        if self.fail:
+            raise RuntimeError("upstream 503")
+        return {"answer": self.calls}
+
+
+def _wait_until(cond, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not cond():
+        assert time.monotonic() < deadline, "等待超时"
+        time.sleep(0.001)
+
+
+def _run_threads(sf: SingleFlight, fn, n: int):
+    with ThreadPoolExecutor(max_workers=n) as pool:
+        futures = [pool.submit(sf.do, "k", fn) for _ in range(n)]
+        _wait_until(lambda: sf.coalesced == n - 1)
+        fn.gate.set()
+        return [f.exception() or f.result() for f in futures]
+
+
+def test_threads_share_one_call():
+    sf, upstream = SingleFlight(), Upstream()
+    results = _run_threads(sf, upstream, 8)
+
+    assert upstream.calls == 1
+    assert all(result == {"answer": 1} for result, _ in results)
+    assert sorted(shared for _, shared in results) == [False] + [True] * 7
+    assert results[0][0] is results[1][0]
+    assert sf.in_flight() == 0
+
+
+def test_thread_error_reaches_every_waiter_and_key_recovers():
+    sf, upstream = SingleFlight(), Upstream(fail=True)
+    results = _run_threads(sf, upstream, 4)
+    assert upstream.calls == 1
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+    # 失败不缓存: 下一次调用重新执行
+    upstream.fail = False
+    assert sf.do("k", upstream) == ({"answer": 2}, False)
+
+
+def test_distinct_keys_are_not_merged():
+    sf, upstream = SingleFlight(), Upstream()
+    upstream.gate.set()
+    assert sf.do("a", upstream)[0] == {"answer": 1}
+    assert sf.do("b", upstream)[0] == {"answer": 2}
+    assert sf.coalesced == 0
+
+
+class AsyncUpstream:
+    def __init__(self, fail: bool = False):
+        self.calls = 0
+        self.fail = fail
+        self.gate = None
+
+    async def __call__(self):
+        self.calls += 1
+        await self.gate.wait()
+        if self.fail:
+            raise RuntimeError("upstream 503")
+        return {"answer": self.calls}
+
+
+async def _settle():
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+def test_coroutines_share_one_call():
+    async def main():
+        sf, upstream = AsyncSingleFlight(), AsyncUpstream()
+        upstream.gate = asyncio.Event()
+        tasks = [asyncio.create_task(sf.do("k", upstream)) for _ in range(5)]
+        await _settle()
+        upstream.gate.set()
+        return await asyncio.gather(*tasks), upstream.calls, sf
+
+    results, calls, sf = asyncio.run(main())
+    assert calls == 1
+    assert [shared for _, shared in results] == [False, True, True, True, True]
+    assert all(r is results[0][0] for r, _ in results)
+    assert sf.coalesced == 4 and sf.in_flight() == 0
+
+
+def test_async_error_reaches_every_waiter_and_key_recovers():
+    async def main():
+        sf, upstream = AsyncSingleFlight(), AsyncUpstream(fail=True)
+        upstream.gate = asyncio.Event()
+        tasks = [asyncio.create_task(sf.do("k", upstream)) for _ in range(3)]
+        await _settle()
+        upstream.gate.set()
+        errors = await asyncio.gather(*tasks, return_exceptions=True)
+        upstream.fail = False
+        return errors, await sf.do("k", upstream), upstream.calls
+
+    errors, retry, calls = asyncio.run(main())
+    assert all(isinstance(e, RuntimeError) for e in errors)
+    assert retry == ({"answer": 2}, False) and calls == 2
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    async def main():
+        sf, upstream = AsyncSingleFlight(), AsyncUpstream()
+        upstream.gate = asyncio.Event()
+        leader = asyncio.create_task(sf.do("k", upstream))
+        await _settle()
+        followers = [asyncio.create_task(sf.do("k", upstream)) for _ in range(2)]
+        await _settle()
+
+        leader.cancel()  # 如客户端断开
+        await _settle()
+        upstream.gate.set()
+        results = await asyncio.gather(*followers)
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        in_flight = sf.in_flight()
+        again = await sf.do("k", upstream)
+        return results, in_flight, again, upstream.calls
+
+    results, in_flight, again, calls = asyncio.run(main())
+    assert results == [({"answer": 1}, True), ({"answer": 1}, True)]
+    assert in_flight == 0
+    assert again == ({"answer": 2}, False) and calls == 2
+
+
+def test_all_waiters_cancelled_leaves_no_stale_entry():
+    async def main():
+        sf, upstream = AsyncSingleFlight(), AsyncUpstream(fail=True)
+        upstream.gate = asyncio.Event()
+        tasks = [asyncio.create_task(sf.do("k", upstream)) for _ in range(2)]
+        await _settle()
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # 计算仍在后台完成 (失败), 完成后移除 key 且异常已被取走
+        upstream.gate.set()
+        await _settle()
+        return sf.in_flight()
+
+    assert asyncio.run(main()) == 0
@@ -0,0 +1,98 @@
+"""
+IncrementalSync: 时间块失败时高水位停在前面连续成功的块, 重跑从检查点继续且每小时只落盘一次
+"""
+
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from src.sync import IncrementalSync, ColumnStoreSink, CheckpointStore, split_range, TIME_FMT
+from src.column_store import ColumnStore
+
+SINCE = datetime(2025, 1, 1)
+UNTIL = datetime(2025, 1, 5, 23, 59, 59)
+
+
+class FakeDownloader:
+    """
+    每小时一条记录 (已是 loader 字段); fail 中的 (deviceKey, 块起点) 抛出一次异常
+    """
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def _fetchHistory(self, key, begin, end):
+        with self._lock:
+            self.calls.append((key, begin, end))
+            if (key, begin) in self.fail:
+                self.fail.discard((key, begin))
+                raise RuntimeError("503")
+        t = begin.replace(minute=0, second=0) + (timedelta(hours=1) if begin.minute or begin.second else timedelta())
+        records = []
+        while t <= end:
+            hours = (t - SINCE) // timedelta(hours=1)
+            records.append({"recordTimeStr": t.strftime(TIME_FMT), "temp": float(hours), "rain": 0.0})
+            t += timedelta(hours=1)
+        return records
+
+
+def _engine(tmp_path, downloader):
+    return IncrementalSync(downloader, ColumnStoreSink(str(tmp_path / "data")), CheckpointStore(str(tmp_path / "state")),
+                           chunk_hours=24, max_workers=3)
+
+
+def test_split_range_is_contiguous():
+    chunks = split_range(SINCE, UNTIL, 24)
+    assert len(chunks) == 5
+    assert chunks[0] == (SINCE, datetime(2025, 1, 1, 23, 59, 59))
+    assert all(b - a == timedelta(seconds=1) for (_, a), (b, _) in zip(chunks, chunks[1:]))
+
+
+def test_failed_chunk_stops_high_water_mark_and_resume_completes(tmp_path):
+    failed_day = datetime(2025, 1, 3)
+    fake = FakeDownloader(fail=[("A", failed_day)])
+    report = _engine(tmp_path, fake).sync_devices(["A", "B"], SINCE, UNTIL)
+
+    assert report["A"]["error"] is not None
+    assert report["A"]["high_water_mark"] == "2025-01-02 23:00:00"
+    assert report["A"]["appended"] == 48
+    assert report["B"] == {"fetched": 120, "appended": 120, "high_water_mark": "2025-01-05 23:00:00", "error": None}
+
+    # 新实例从磁盘读取检查点, 只下载断点之后的块
+    fake.calls.clear()
+    report = _engine(tmp_path, fake).sync_devices(["A", "B"], SINCE, UNTIL)
+    assert report["A"]["error"] is None
+    assert report["A"]["appended"] == 72
+    assert report["A"]["high_water_mark"] == "2025-01-05 23:00:00"
+    assert report["B"]["appended"] == 0 and report["B"]["fetched"] == 0
+    assert min(b for k, b, _ in fake.calls if k == "A") == datetime(2025, 1, 2, 23, 0, 1)
+    assert [b for k, b, _ in fake.calls if k == "B"] == [datetime(2025, 1, 5, 23, 0, 1)]
+
+    df = ColumnStore(str(tmp_path / "data" / "A.cols")).read()
+    assert len(df) == 120 and df["timestamp"].is_unique
+    np.testing.assert_array_equal(df["temp"].to_numpy(), np.arange(120.0))
+
+
+def test_checkpoints_survive_reload(tmp_path):
+    store = CheckpointStore(str(tmp_path))
+    store.update("A", datetime(2025, 1, 2, 5), 10)
+    store.update("A", datetime(2025, 1, 2, 6), 1)
+
+    reloaded = CheckpointStore(str(tmp_path))
+    assert reloaded.high_water_mark("A") == datetime(2025, 1, 2, 6)
+    assert reloaded.high_water_mark("B") is None
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_out_of_order_completion_commits_in_order(tmp_path, workers):
+    engine = _engine(tmp_path, FakeDownloader())
+    engine.max_workers = workers
+    report = engine.sync_devices([f"D{i}" for i in range(6)], SINCE, UNTIL)
+    assert all(r["appended"] == 120 and r["error"] is None for r in report.values())
+    for i in range(6):
+        ts = ColumnStore(str(tmp_path / "data" / f"D{i}.cols")).timestamps()
+        assert len(ts) == 120 and (np.diff(ts.astype(np.int64)) > 0).all()
@@ -0,0 +1,110 @@
+"""
+WindowMemo: 数据版本不变时命中; 追加新的小时记录后, 未受影响的历史窗口只做重新校验, 最新窗口重新渲染
+"""
+
+import os
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data_loader import WindowMemo, _DATASET_CACHE
+from src.column_store import ColumnStore
+
+START = pd.Timestamp("2025-06-01 00:00:00")
+
+
+def _frame(hours: int, offset: int = 0) -> pd.DataFrame:
+    idx = np.arange(offset, offset + hours)
+    return pd.DataFrame({
+        "timestamp": START + pd.to_timedelta(idx, unit="h"),
+        "temp": 20.0 + (idx % 24) * 0.5,
+        "humidity": 60.0 + (idx % 7),
+        "rain": np.where(idx % 10 == 0, 1.5, 0.0),
+        "solar": np.maximum(0, 400 - np.abs(idx % 24 - 12) * 60.0),
+        "soil_water": 0.30 - idx * 0.001,
+    })
+
+
+def _write_json(path: str, df: pd.DataFrame) -> None:
+    records = df.assign(timestamp=df["timestamp"].dt.strftime("%Y-%m-%d %H:%M:%S")).to_dict(orient="records")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(records, f)
+
+
+def _bump_mtime(path: str) -> None:
+    # 同一时钟刻度内重写时 mtime 可能不变, 显式推进以模拟新版本
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+
+@pytest.fixture(autouse=True)
+def _clear_dataset_cache():
+    _DATASET_CACHE.clear()
+    yield
+    _DATASET_CACHE.clear()
+
+
+def test_hit_without_change(tmp_path):
+    path = str(tmp_path / "dev.json")
+    _write_json(path, _frame(72))
+    memo = WindowMemo()
+    ref = START + pd.Timedelta(hours=48)
+
+    first = memo.get(path, ref, 24, "past")
+    second = memo.get(path, ref, 24, "past")
+    assert second is first
+    assert (memo.hits, memo.misses, memo.revalidated) == (1, 1, 0)
+    assert len(first.df) == 24
+
+
+def test_append_revalidates_past_window_and_rerenders_latest(tmp_path):
+    path = str(tmp_path / "dev.json")
+    _write_json(path, _frame(72))
+    memo = WindowMemo()
+    ref = START + pd.Timedelta(hours=48)
+
+    past = memo.get(path, ref, 24, "past")
+    latest = memo.get(path, None, 24, "past")
+
+    _write_json(path, _frame(96))
+    _bump_mtime(path)
+
+    assert memo.get(path, ref, 24, "past") is past
+    assert memo.revalidated == 1
+
+    fresh = memo.get(path, None, 24, "past")
+    assert fresh is not latest
+    assert fresh.df["timestamp"].iloc[-1] == START + pd.Timedelta(hours=95)
+    assert memo.misses == 3
+
+
+def test_column_store_append_revalidates(tmp_path):
+    path = str(tmp_path / "dev.cols")
+    store = ColumnStore.create(path, _frame(72))
+    memo = WindowMemo()
+    ref = START + pd.Timedelta(hours=30)
+
+    past = memo.get(path, ref, 24, "past")
+    store.append(_frame(24, offset=72))
+    _bump_mtime(os.path.join(path, "timestamp.bin"))
+
+    assert memo.get(path, ref, 24, "past") is past
+    assert memo.get(path, None, 24, "past").df["timestamp"].iloc[-1] == START + pd.Timedelta(hours=95)
+    assert (memo.revalidated, memo.misses) == (1, 2)
+
+
+def test_uncached_read_does_not_fill(tmp_path):
+    path = str(tmp_path / "dev.json")
+    _write_json(path, _frame(48))
+    memo = WindowMemo()
+
+    result = memo.get(path, None, 24, "past", cache=False)
+    assert len(result.df) == 24
+    assert memo.stats()["entries"] == 0 and memo.bypassed == 1
+    assert _DATASET_CACHE.stats()["entries"] == 0
+
+    cached = memo.get(path, None, 24, "past")
+    assert memo.get(path, None, 24, "past", cache=False) is cached
+    assert memo.bypassed == 1